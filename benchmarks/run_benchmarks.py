@@ -0,0 +1,352 @@
+"""
+Measure speed of synthesis, effects, oscillators, and rendering of whole tracks.
+
+Results are saved to a JSON file. If a file with previous results is passed as a baseline,
+measurements are compared against it and slowdowns are reported.
+
+Examples (the package must be installed, e.g., with `pip install -e .`):
+    python benchmarks/run_benchmarks.py -o baseline.json
+    python benchmarks/run_benchmarks.py -o results.json -b baseline.json
+    python benchmarks/run_benchmarks.py -o float32.json -b baseline.json --dtype float32
+
+Author: Nikolay Lysenko
+"""
+
+
+import argparse
+import importlib.resources
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable
+
+import numpy as np
+import scipy
+import yaml
+
+from sinethesizer.effects import get_effects_registry
+from sinethesizer.io import (
+    convert_events_to_timeline, convert_tsv_to_events, create_instruments_registry
+)
+from sinethesizer.oscillators.facade import (
+    ANALOG_WAVEFORMS, MODEL_BASED_WAVEFORMS, NOISES, generate_mono_wave
+)
+from sinethesizer.synth.core import Event, synthesize
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PRESETS_DIR = os.path.join(REPO_DIR, 'presets')
+EXAMPLES_DIR = os.path.join(REPO_DIR, 'docs', 'examples')
+SUITES = ['presets', 'effects', 'oscillators', 'rendering']
+
+DURATIONS = [0.25, 2.0]
+FREQUENCIES = [55.0, 440.0, 1760.0]
+BUFFER_DURATIONS = [0.1, 1.0]
+EFFECTS_PARAMS = {
+    'amplitude_normalization': {'value_at_max_velocity': 0.5},
+    'artificial_reverb': {'random_seeds': [1, 2]},
+    'automation': {
+        'automated_effect_name': 'filter',
+        'break_points': [
+            {'relative_position': 0.0, 'max_frequency': 1000},
+            {'relative_position': 1.0, 'max_frequency': 5000},
+        ],
+    },
+    'chorus': {
+        'original_sound_gain': 0.5,
+        'copies_params': [{'delay': 0.01, 'gain': 0.5, 'frequency': 1, 'width': 0.1}],
+    },
+    'compressor': {'threshold': 0.5},
+    'envelope_shaper': {'envelope_params': {'name': 'trapezoid'}},
+    'equalizer': {'breakpoint_frequencies': [300, 3000, 10000], 'gains': [1.0, 0.5, 1.0]},
+    'filter': {'min_frequency': 500},
+    'filter_sweep': {'bands': [[300, 1000], [500, 2000]]},
+    'overdrive': {},
+    'panning': {'left_amplitude_ratio': 0.8, 'right_amplitude_ratio': 0.4},
+    'phaser': {},
+    'room_reverb': {},
+    'stereo_delay': {'delay': 0.01},
+    'stereo_to_mono_conversion': {},
+    'tremolo': {},
+    'vibrato': {},
+}
+
+
+def parse_cli_args() -> argparse.Namespace:
+    """
+    Parse arguments passed via Command Line Interface (CLI).
+
+    :return:
+        namespace with arguments
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-o', '--output_path', type=str, required=True,
+        help='path to output JSON file with results'
+    )
+    parser.add_argument(
+        '-b', '--baseline_path', type=str, default=None,
+        help='path to JSON file with results to compare against'
+    )
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=1.25,
+        help='minimum ratio of new time to baseline time that is reported as a slowdown'
+    )
+    parser.add_argument(
+        '-d', '--min_difference', type=float, default=0.001,
+        help='minimum difference (in seconds) between new time and baseline time to be reported'
+    )
+    parser.add_argument(
+        '-n', '--n_repeats', type=int, default=3,
+        help='number of runs of each case (the fastest run is reported)'
+    )
+    parser.add_argument(
+        '-f', '--frame_rate', type=int, default=48000,
+        help='number of frames per second'
+    )
+    parser.add_argument(
+        '-s', '--suites', type=str, nargs='+', choices=SUITES, default=SUITES,
+        help='groups of cases to be run'
+    )
+    parser.add_argument(
+        '--dtype', type=str, choices=['float64', 'float32'], default='float64',
+        help='data type of synthesized sounds'
+    )
+    cli_args = parser.parse_args()
+    return cli_args
+
+
+def measure_time(fn: Callable[[], Any], n_repeats: int) -> float:
+    """
+    Measure execution time of a function.
+
+    :param fn:
+        function without arguments
+    :param n_repeats:
+        number of runs
+    :return:
+        minimum over runs execution time (in seconds)
+    """
+    timings = []
+    for _ in range(n_repeats):
+        start_time = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+def create_test_sound(duration: float, frame_rate: int, dtype: str = 'float64') -> np.ndarray:
+    """
+    Create stereo sound that is used as input for effects.
+
+    :param duration:
+        duration of sound (in seconds)
+    :param frame_rate:
+        number of frames per second
+    :param dtype:
+        data type of sound
+    :return:
+        sum of two sine waves with fading out
+    """
+    moments = np.arange(int(round(duration * frame_rate))) / frame_rate
+    wave = np.sin(2 * np.pi * 440 * moments) + 0.5 * np.sin(2 * np.pi * 1320 * moments)
+    wave *= np.linspace(0.5, 0, len(wave))
+    return np.vstack((wave, wave)).astype(dtype)
+
+
+def benchmark_presets(frame_rate: int, n_repeats: int, dtype: str) -> dict[str, float]:
+    """
+    Measure time of synthesis with every preset for several durations and pitches.
+
+    :param frame_rate:
+        number of frames per second
+    :param n_repeats:
+        number of runs of each case
+    :param dtype:
+        data type of synthesized sounds
+    :return:
+        mapping from case name to time (in seconds)
+    """
+    instruments_registry = create_instruments_registry(PRESETS_DIR)
+    results = {}
+    for instrument in sorted(instruments_registry):
+        for duration in DURATIONS:
+            for frequency in FREQUENCIES:
+                event = Event(
+                    instrument, 0, duration, frequency, 1.0, '', frame_rate, dtype=dtype
+                )
+                name = f'presets/{instrument}/duration={duration}/frequency={frequency}'
+                results[name] = measure_time(
+                    lambda: synthesize(event, instruments_registry, np.random.default_rng(0)),
+                    n_repeats
+                )
+    return results
+
+
+def benchmark_effects(frame_rate: int, n_repeats: int, dtype: str) -> dict[str, float]:
+    """
+    Measure time of every effect from the registry on buffers of standard sizes.
+
+    :param frame_rate:
+        number of frames per second
+    :param n_repeats:
+        number of runs of each case
+    :param dtype:
+        data type of synthesized sounds
+    :return:
+        mapping from case name to time (in seconds)
+    """
+    results = {}
+    for effect_name, effect_fn in sorted(get_effects_registry().items()):
+        for duration in BUFFER_DURATIONS:
+            sound = create_test_sound(duration, frame_rate, dtype)
+            event = Event('benchmark', 0, duration, 440.0, 1.0, '', frame_rate, dtype=dtype)
+            params = EFFECTS_PARAMS[effect_name]
+            name = f'effects/{effect_name}/duration={duration}'
+            results[name] = measure_time(
+                lambda: effect_fn(sound.copy(), event, **params), n_repeats
+            )
+    return results
+
+
+def benchmark_oscillators(frame_rate: int, n_repeats: int, dtype: str) -> dict[str, float]:
+    """
+    Measure time of generation of every waveform on buffers of standard sizes.
+
+    :param frame_rate:
+        number of frames per second
+    :param n_repeats:
+        number of runs of each case
+    :param dtype:
+        data type of synthesized sounds
+    :return:
+        mapping from case name to time (in seconds)
+    """
+    results = {}
+    for waveform in ANALOG_WAVEFORMS + MODEL_BASED_WAVEFORMS + NOISES:
+        for duration in BUFFER_DURATIONS:
+            amplitude_envelope = np.ones(int(round(duration * frame_rate)), dtype=dtype)
+            name = f'oscillators/{waveform}/duration={duration}'
+            results[name] = measure_time(
+                lambda: generate_mono_wave(
+                    waveform, 440.0, amplitude_envelope, frame_rate,
+                    random_generator=np.random.default_rng(0)
+                ),
+                n_repeats
+            )
+    return results
+
+
+def benchmark_rendering(frame_rate: int, n_repeats: int, dtype: str) -> dict[str, float]:
+    """
+    Measure time of rendering of tracks from documentation examples.
+
+    :param frame_rate:
+        number of frames per second
+    :param n_repeats:
+        number of runs of each case
+    :param dtype:
+        data type of synthesized sounds
+    :return:
+        mapping from case name to time (in seconds)
+    """
+    default_config_path = importlib.resources.files("sinethesizer") / "default_config.yml"
+    with open(default_config_path) as config_file:
+        settings = yaml.safe_load(config_file)
+    settings['frame_rate'] = frame_rate
+    settings['dtype'] = dtype
+    instruments_path = os.path.join(EXAMPLES_DIR, 'instruments.yml')
+    settings['instruments_registry'] = create_instruments_registry(instruments_path)
+
+    results = {}
+    for file_name in sorted(os.listdir(EXAMPLES_DIR)):
+        if not file_name.endswith('.tsv'):
+            continue
+        events = convert_tsv_to_events(os.path.join(EXAMPLES_DIR, file_name), settings)
+        name = f'rendering/{file_name}'
+        results[name] = measure_time(
+            lambda: convert_events_to_timeline(events, settings), n_repeats
+        )
+    return results
+
+
+def compare_results(
+        results: dict[str, float], baseline: dict[str, float],
+        threshold: float, min_difference: float
+) -> list[tuple[str, float, float]]:
+    """
+    Find cases that became slower.
+
+    :param results:
+        mapping from case name to time (in seconds)
+    :param baseline:
+        mapping from case name to time (in seconds) for a previous version
+    :param threshold:
+        minimum ratio of new time to baseline time that is treated as a slowdown
+    :param min_difference:
+        minimum difference (in seconds) between new time and baseline time that is treated as
+        a slowdown; it prevents false alarms caused by noise in measurements of short cases
+    :return:
+        list of slowed down cases with their baseline and new times
+    """
+    slowdowns = []
+    for name, new_time in results.items():
+        old_time = baseline.get(name)
+        if old_time is None:
+            continue
+        if new_time > threshold * old_time and new_time - old_time > min_difference:
+            slowdowns.append((name, old_time, new_time))
+    return slowdowns
+
+
+def main() -> None:
+    """Run all necessary code."""
+    cli_args = parse_cli_args()
+
+    suite_name_to_fn = {
+        'presets': benchmark_presets,
+        'effects': benchmark_effects,
+        'oscillators': benchmark_oscillators,
+        'rendering': benchmark_rendering,
+    }
+    results = {}
+    for suite_name in cli_args.suites:
+        suite_results = suite_name_to_fn[suite_name](
+            cli_args.frame_rate, cli_args.n_repeats, cli_args.dtype
+        )
+        results.update(suite_results)
+        total_time = sum(suite_results.values())
+        print(f"{suite_name}: {len(suite_results)} cases, {total_time:.3f} s in total")
+
+    report = {
+        'metadata': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'frame_rate': cli_args.frame_rate,
+            'n_repeats': cli_args.n_repeats,
+            'dtype': cli_args.dtype,
+        },
+        'results': results,
+    }
+    with open(cli_args.output_path, 'w') as output_file:
+        json.dump(report, output_file, indent=4)
+
+    if cli_args.baseline_path is None:
+        return
+    with open(cli_args.baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)['results']
+    slowdowns = compare_results(
+        results, baseline, cli_args.threshold, cli_args.min_difference
+    )
+    for name, old_time, new_time in slowdowns:
+        print(f"Slowdown in {name}: {old_time:.4f} s -> {new_time:.4f} s")
+    if slowdowns:
+        sys.exit(1)
+    print(f"No slowdowns (threshold is {cli_args.threshold}).")
+
+
+if __name__ == '__main__':
+    main()
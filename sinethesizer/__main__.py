@@ -6,6 +6,7 @@ Author: Nikolay Lysenko
 
 
 import argparse
+import contextlib
 import importlib.resources
 
 import yaml
@@ -15,8 +16,12 @@ from sinethesizer.io import (
     convert_midi_to_events,
     convert_tsv_to_events,
     create_instruments_registry,
+    write_events_to_wav_in_blocks,
     write_timeline_to_wav,
 )
+from sinethesizer.synth.cache import create_render_cache
+from sinethesizer.synth.profiling import Profiler, enable_profiling
+from sinethesizer.utils.ir_store import create_ir_store, enable_ir_store
 
 
 def parse_cli_args() -> argparse.Namespace:
@@ -47,6 +52,30 @@ def parse_cli_args() -> argparse.Namespace:
         '-c', '--config_path', type=str, default=None,
         help='path to configuration file with general settings'
     )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help='number of processes for parallel rendering (it overrides value from config)'
+    )
+    parser.add_argument(
+        '-b', '--block_duration', type=float, default=None,
+        help='duration (in seconds) of block for streaming rendering (it overrides config)'
+    )
+    parser.add_argument(
+        '-d', '--cache_dir', type=str, default=None,
+        help='path to directory with persistent cache of notes (it overrides value from config)'
+    )
+    parser.add_argument(
+        '-r', '--ir_store_dir', type=str, default=None,
+        help='path to directory with stored impulse responses (it overrides value from config)'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='print shares of synthesis stages in render time (rendering is not parallel then)'
+    )
+    parser.add_argument(
+        '--profile_memory', action='store_true',
+        help='also measure peak memory of synthesis stages (it slows rendering down)'
+    )
     cli_args = parser.parse_args()
     return cli_args
 
@@ -59,9 +88,23 @@ def main():
     config_path = cli_args.config_path or default_config_path
     with open(config_path) as config_file:
         settings = yaml.safe_load(config_file)
+    if cli_args.workers is not None:
+        settings['workers'] = cli_args.workers
+    if cli_args.block_duration is not None:
+        settings['block_duration'] = cli_args.block_duration
+    if cli_args.cache_dir is not None:
+        settings['cache_dir'] = cli_args.cache_dir
+    if cli_args.ir_store_dir is not None:
+        settings['ir_store_dir'] = cli_args.ir_store_dir
+    profiler = None
+    if cli_args.profile or cli_args.profile_memory:
+        # Only stages executed by the current process can be measured.
+        settings['workers'] = 1
+        profiler = Profiler(track_memory=cli_args.profile_memory)
 
     instruments_registry = create_instruments_registry(cli_args.presets_path)
     settings['instruments_registry'] = instruments_registry
+    settings['render_cache'] = create_render_cache(settings)
 
     if cli_args.midi_config_path is not None:
         with open(cli_args.midi_config_path) as midi_config_file:
@@ -78,8 +121,24 @@ def main():
             f"but found: {extension}."
         )
 
-    timeline = convert_events_to_timeline(events, settings)
-    write_timeline_to_wav(cli_args.output_path, timeline, settings['frame_rate'])
+    profiling_context = (
+        enable_profiling(profiler) if profiler is not None else contextlib.nullcontext()
+    )
+    ir_store = create_ir_store(settings)
+    ir_store_context = (
+        enable_ir_store(ir_store) if ir_store is not None else contextlib.nullcontext()
+    )
+    with profiling_context, ir_store_context:
+        if settings.get('block_duration') is not None:
+            write_events_to_wav_in_blocks(events, settings, cli_args.output_path)
+        else:
+            timeline = convert_events_to_timeline(events, settings)
+            write_timeline_to_wav(
+                cli_args.output_path, timeline, settings['frame_rate'],
+                settings.get('sample_format')
+            )
+    if profiler is not None:
+        print(profiler.create_report())
 
 
 if __name__ == '__main__':
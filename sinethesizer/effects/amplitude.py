@@ -12,6 +12,113 @@ import numpy as np
 from sinethesizer.envelopes import get_envelopes_registry
 
 
+def compute_amplitude_quantile(sound: np.ndarray, quantile: float) -> float:
+    """
+    Compute quantile of absolute pressure deviations.
+
+    :param sound:
+        mono or stereo sound
+    :param quantile:
+        quantile to be computed
+    :return:
+        quantile value; mono sound is treated as stereo sound with identical channels,
+        because interpolated quantiles of these sounds are not the same
+    """
+    abs_sound = np.abs(sound)
+    if abs_sound.shape[0] == 1 and quantile < 1:
+        abs_sound = np.vstack((abs_sound, abs_sound))
+    return np.quantile(abs_sound, quantile)
+
+
+def compute_chunks_bounds(n_frames: int, n_chunks: int) -> np.ndarray:
+    """
+    Compute bounds of chunks produced by `np.array_split` without splitting anything.
+
+    :param n_frames:
+        length of array to be split
+    :param n_chunks:
+        number of chunks
+    :return:
+        start indices of all chunks followed by `n_frames`
+    """
+    if n_chunks <= 0:
+        raise ValueError(f"Number of chunks must be positive, but it is {n_chunks}.")
+    chunk_size, n_longer_chunks = divmod(n_frames, n_chunks)
+    indices = np.arange(n_chunks + 1)
+    return indices * chunk_size + np.minimum(indices, n_longer_chunks)
+
+
+def split_into_equal_chunks(array: np.ndarray, chunks_bounds: np.ndarray) -> list[np.ndarray]:
+    """
+    Split array into chunks and stack chunks of the same length together.
+
+    Chunks produced by `np.array_split` have at most two distinct lengths and longer chunks
+    go first, so the chunks are returned as at most two views of the array.
+
+    :param array:
+        array to be split along its last axis
+    :param chunks_bounds:
+        bounds of chunks returned by `compute_chunks_bounds` function
+    :return:
+        arrays of shape `(*array.shape[:-1], n_chunks_of_this_length, chunk_length)`
+    """
+    chunks_sizes = np.diff(chunks_bounds)
+    n_longer_chunks = np.count_nonzero(chunks_sizes > chunks_sizes[-1])
+    groups = []
+    for group_bounds in [chunks_bounds[:n_longer_chunks + 1], chunks_bounds[n_longer_chunks:]]:
+        n_chunks = len(group_bounds) - 1
+        if n_chunks > 0:
+            start, end = group_bounds[0], group_bounds[-1]
+            shape = (*array.shape[:-1], n_chunks, (end - start) // n_chunks)
+            groups.append(array[..., start:end].reshape(shape))
+    return groups
+
+
+def compute_amplitude_quantiles_of_chunks(
+        sound: np.ndarray, quantile: float, chunks_bounds: np.ndarray
+) -> np.ndarray:
+    """
+    Compute quantile of absolute pressure deviations for each chunk of sound.
+
+    :param sound:
+        mono or stereo sound
+    :param quantile:
+        quantile to be computed
+    :param chunks_bounds:
+        bounds of chunks returned by `compute_chunks_bounds` function
+    :return:
+        quantile values that are equal to the ones returned by `compute_amplitude_quantile`
+        for each chunk separately
+    """
+    abs_sound = np.abs(sound)
+    if abs_sound.shape[0] == 1 and quantile < 1:
+        abs_sound = np.vstack((abs_sound, abs_sound))
+    return np.hstack([
+        np.quantile(chunks, quantile, axis=(0, 2))
+        for chunks in split_into_equal_chunks(abs_sound, chunks_bounds)
+    ])
+
+
+def interpolate_between_chunks_bounds(
+        chunks_bounds: np.ndarray, initial_value: float, values: np.ndarray
+) -> np.ndarray:
+    """
+    Create curve that changes linearly within each chunk and reaches its value at chunk end.
+
+    :param chunks_bounds:
+        bounds of chunks returned by `compute_chunks_bounds` function
+    :param initial_value:
+        value at the first frame of the first chunk
+    :param values:
+        values to be reached at ends of chunks
+    :return:
+        curve with one value per frame
+    """
+    return np.interp(
+        np.arange(chunks_bounds[-1]), chunks_bounds, np.hstack((initial_value, values))
+    )
+
+
 def apply_amplitude_normalization(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
         value_at_max_velocity: float, quantile: float = 1,
@@ -38,7 +145,7 @@ def apply_amplitude_normalization(
     coef = event.velocity ** value_on_velocity_order
     diff = value_at_max_velocity - value_at_zero_velocity
     new_quantile_value = value_at_zero_velocity + coef * diff
-    quantile_value = np.quantile(np.abs(sound), quantile)
+    quantile_value = compute_amplitude_quantile(sound, quantile)
     sound *= new_quantile_value / quantile_value
     return sound
 
@@ -66,17 +173,12 @@ def apply_compressor(
     :return:
         sound of limited amplitude
     """
-    scaling_coefs = []
-    previous_ratio = 1
     chunk_size_in_frames = chunk_size_in_cycles * event.frame_rate / event.frequency
     n_chunks = int(round(sound.shape[1] / chunk_size_in_frames))
-    for chunk in np.array_split(sound, n_chunks, axis=1):
-        current_value = np.quantile(np.abs(chunk), quantile)
-        current_ratio = min(threshold / current_value, 1)
-        current_scaling_coefs = np.linspace(previous_ratio, current_ratio, chunk.shape[1], False)
-        scaling_coefs.append(current_scaling_coefs)
-        previous_ratio = current_ratio
-    scaling_coefs = np.hstack(scaling_coefs)
+    chunks_bounds = compute_chunks_bounds(sound.shape[1], n_chunks)
+    values = compute_amplitude_quantiles_of_chunks(sound, quantile, chunks_bounds)
+    ratios = np.minimum(threshold / values, 1)
+    scaling_coefs = interpolate_between_chunks_bounds(chunks_bounds, 1, ratios)
     sound *= scaling_coefs
     return sound
 
@@ -127,21 +229,17 @@ def apply_envelope_shaper(
             f"sound length is {sound.shape[1]} and envelope length is {len(envelope)}."
         )
 
-    scaling_coefs = []
-    previous_ratio = initial_rescaling_ratio
     chunk_size_in_frames = chunk_size_in_cycles * event.frame_rate / event.frequency
     n_chunks = int(round(sound.shape[1] / chunk_size_in_frames))
-    split_sound = np.array_split(sound, n_chunks, axis=1)
-    split_envelope = np.array_split(envelope, n_chunks, axis=0)
-    for sound_chunk, envelope_chunk in zip(split_sound, split_envelope):
-        current_value = np.quantile(np.abs(sound_chunk), quantile)
-        current_ratio = np.mean(envelope_chunk) / current_value
-        current_scaling_coefs = np.linspace(
-            previous_ratio, current_ratio, sound_chunk.shape[1], False
-        )
-        scaling_coefs.append(current_scaling_coefs)
-        previous_ratio = current_ratio
-    scaling_coefs = np.hstack(scaling_coefs)
+    chunks_bounds = compute_chunks_bounds(sound.shape[1], n_chunks)
+    values = compute_amplitude_quantiles_of_chunks(sound, quantile, chunks_bounds)
+    target_values = np.hstack([
+        chunks.mean(axis=-1) for chunks in split_into_equal_chunks(envelope, chunks_bounds)
+    ])
+    ratios = target_values / values
+    scaling_coefs = interpolate_between_chunks_bounds(
+        chunks_bounds, initial_rescaling_ratio, ratios
+    )
 
     if forced_fading_ratio > 0:
         forced_fading_duration_in_frames = int(round(forced_fading_ratio * sound.shape[1]))
@@ -3,26 +3,39 @@ Apply sound effects with settings changing over time.
 
 In particular, this module can be used to apply equalizer/filter envelope.
 
+Some effects (e.g., filter and equalizer) can take parameters changing over time natively,
+so sound is processed by them only once. Other effects are applied to spans of sound around
+each break point separately and then results are cross-faded.
+
 Author: Nikolay Lysenko
 """
 
 
-from typing import Any
+from functools import partial
+from typing import Any, Callable
 
 import numpy as np
 
 from sinethesizer.effects.amplitude import (
     apply_amplitude_normalization, apply_compressor, apply_envelope_shaper
 )
-from sinethesizer.effects.chorus import apply_chorus
-from sinethesizer.effects.equalizer import apply_equalizer
+from sinethesizer.effects.chorus import apply_chorus, compute_chorus_tail
+from sinethesizer.effects.equalizer import apply_equalizer, apply_equalizer_with_interpolation
 from sinethesizer.effects.filter import apply_frequency_filter
-from sinethesizer.effects.filter_sweep import apply_filter_sweep, apply_phaser
+from sinethesizer.effects.filter_sweep import (
+    apply_filter_sweep, apply_frequency_filter_with_interpolation, apply_phaser
+)
 from sinethesizer.effects.overdrive import apply_overdrive
-from sinethesizer.effects.reverb import apply_artificial_reverb, apply_room_reverb
-from sinethesizer.effects.stereo import apply_panning, apply_stereo_delay
+from sinethesizer.effects.reverb import (
+    apply_artificial_reverb, apply_room_reverb,
+    compute_artificial_reverb_tail, compute_room_reverb_tail
+)
+from sinethesizer.effects.stereo import (
+    apply_panning, apply_stereo_delay, compute_stereo_delay_tail
+)
 from sinethesizer.effects.tremolo import apply_tremolo
 from sinethesizer.effects.vibrato import apply_vibrato
+from sinethesizer.utils.misc import convert_to_stereo
 
 
 REGISTRY_OF_AUTOMATABLE_EFFECTS = {
@@ -42,6 +55,170 @@ REGISTRY_OF_AUTOMATABLE_EFFECTS = {
     'tremolo': apply_tremolo,
     'vibrato': apply_vibrato,
 }
+# Effects that prolong sound. Their inputs (not outputs) are cross-faded, so tails are kept.
+REGISTRY_OF_AUTOMATABLE_EFFECTS_TAILS = {
+    'artificial_reverb': compute_artificial_reverb_tail,
+    'chorus': compute_chorus_tail,
+    'room_reverb': compute_room_reverb_tail,
+    'stereo_delay': compute_stereo_delay_tail,
+}
+# Effects that take arrays with a value for each frame instead of the listed parameters.
+EFFECTS_WITH_PARAMETERS_CURVES = {
+    'overdrive': ('fraction_to_clip', 'strength'),
+    'panning': ('left_amplitude_ratio', 'right_amplitude_ratio'),
+    'tremolo': ('frequency', 'frequency_ratio', 'amplitude'),
+}
+# Effects with filters that are designed for each break point and are interpolated between them.
+# Each function takes positions between break points and values of the listed parameters
+# at break points.
+EFFECTS_WITH_INTERPOLATED_FILTERS = {
+    'equalizer': (
+        apply_equalizer_with_interpolation,
+        ('breakpoint_frequencies', 'breakpoint_frequencies_ratios', 'gains')
+    ),
+    'filter': (
+        apply_frequency_filter_with_interpolation,
+        ('min_frequency', 'max_frequency', 'min_frequency_ratio', 'max_frequency_ratio')
+    ),
+}
+# Values of `kind` parameter with which effects can be automated natively.
+NATIVELY_AUTOMATABLE_KINDS = ['absolute', 'relative']
+
+
+def merge_effect_params(break_point: dict[str, Any], kwargs: dict[str, Any]) -> dict[str, Any]:
+    """
+    Get all parameters of effect at a break point.
+
+    :param break_point:
+        break point with its relative position and its parameters of effect
+    :param kwargs:
+        parameters of effect that do not change over time
+    :return:
+        parameters of effect
+    """
+    effect_params = {k: v for k, v in break_point.items() if k != 'relative_position'}
+    duplicated_params = effect_params.keys() & kwargs.keys()
+    if duplicated_params:
+        raise ValueError(
+            "Parameters can not be set both at break points and for the whole effect, "
+            f"but found: {sorted(duplicated_params)}."
+        )
+    return {**effect_params, **kwargs}
+
+
+def split_effects_params(
+        effects_params: list[dict[str, Any]], varying_params_names: tuple[str, ...]
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """
+    Split parameters of break points into varying and constant ones.
+
+    :param effects_params:
+        parameters of effect at each break point
+    :param varying_params_names:
+        names of parameters that can change over time
+    :return:
+        for each break point, its varying parameters, and constant parameters
+        (or empty list and `None` if constant parameters change over time or
+        sets of parameters differ between break points)
+    """
+    if any(params.keys() != effects_params[0].keys() for params in effects_params):
+        return [], None
+    varying_params = [
+        {k: v for k, v in params.items() if k in varying_params_names}
+        for params in effects_params
+    ]
+    constant_params = {
+        k: v for k, v in effects_params[0].items() if k not in varying_params_names
+    }
+    for params in effects_params[1:]:
+        if any(params[k] != v for k, v in constant_params.items()):
+            return [], None
+    if constant_params.get('kind', 'absolute') not in NATIVELY_AUTOMATABLE_KINDS:
+        return [], None
+    return varying_params, constant_params
+
+
+def apply_effect_with_parameters_curves(
+        effect_fn: Callable, sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
+        positions: np.ndarray, break_points_params: list[dict[str, float]], **kwargs
+) -> np.ndarray:
+    """
+    Apply an effect once with parameters linearly interpolated for each frame.
+
+    :param effect_fn:
+        function that applies the effect
+    :param sound:
+        sound to be modified
+    :param event:
+        parameters of sound event for which this function is called
+    :param positions:
+        positions between break points (from 0 to number of break points minus 1)
+        for all frames of sound
+    :param break_points_params:
+        for each break point, values of parameters that change over time
+    :return:
+        modified sound
+    """
+    break_points_indices = np.arange(len(break_points_params))
+    curves = {
+        name: np.interp(
+            positions, break_points_indices, [params[name] for params in break_points_params]
+        )
+        for name in break_points_params[0]
+    }
+    sound = effect_fn(sound, event, **curves, **kwargs)
+    return sound
+
+
+def apply_effect_to_spans(
+        sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
+        automated_effect_name: str, indices: list[int],
+        effects_params: list[dict[str, Any]]
+) -> np.ndarray:
+    """
+    Apply an effect to spans of sound around break points and cross-fade results.
+
+    :param sound:
+        sound to be modified
+    :param event:
+        parameters of sound event for which this function is called
+    :param automated_effect_name:
+        name of function from the registry that applies the effect
+    :param indices:
+        indices of frames that correspond to break points
+    :param effects_params:
+        parameters of effect at each break point
+    :return:
+        modified sound; it is longer than input sound if effect prolongs sound
+    """
+    n_frames = sound.shape[1]
+    effect_fn = REGISTRY_OF_AUTOMATABLE_EFFECTS[automated_effect_name]
+    tail_fn = REGISTRY_OF_AUTOMATABLE_EFFECTS_TAILS.get(automated_effect_name)
+    max_tail = 0
+    if tail_fn is not None:
+        max_tail = max(tail_fn(event, **params) for params in effects_params)
+    processed_sound = np.zeros((sound.shape[0], n_frames + max_tail), dtype=sound.dtype)
+
+    indices = [indices[0], *indices, indices[-1]]
+    zipped = zip(indices, indices[1:], indices[2:], effects_params)
+    for start_index, center_index, end_index, effect_params in zipped:
+        asc_weights = np.linspace(0, 1, center_index - start_index, False)
+        desc_weights = np.linspace(1, 0, end_index - center_index, False)
+        weights = np.hstack((asc_weights, desc_weights))
+        fragment = np.copy(sound[:, start_index:end_index])
+        if tail_fn is not None:
+            # Weighted inputs are processed, because tails must not be cut off.
+            fragment *= weights
+            processed_fragment = effect_fn(fragment, event, **effect_params)
+        else:
+            processed_fragment = effect_fn(fragment, event, **effect_params)
+            processed_fragment *= weights
+        if processed_fragment.shape[0] > processed_sound.shape[0]:
+            # Mono sound becomes stereo if automated effect makes channels different.
+            processed_sound = convert_to_stereo(processed_sound)
+        end_index = start_index + processed_fragment.shape[1]
+        processed_sound[:, start_index:end_index] += processed_fragment
+    return processed_sound
 
 
 def apply_automated_effect(
@@ -63,7 +240,9 @@ def apply_automated_effect(
         dictionary that has the key 'relative_position' with a float value
         between 0 and 1 that defines position of the point on time axis;
         also a dictionary may include key-value pairs with parameters of the
-        effect; output sound is linearly interpolated at intermediate points
+        effect; parameters or output sound are linearly interpolated at intermediate points
+    :param kwargs:
+        parameters of effect that do not change over time; they must not be set at break points
     :return:
         modified sound
     """
@@ -78,27 +257,51 @@ def apply_automated_effect(
     for break_point in break_points:
         index = int(round(break_point['relative_position'] * n_frames))
         indices.append(index)
-        effect_params = {k: v for k, v in break_point.items() if k != 'relative_position'}
-        effects_params.append(effect_params)
-    indices.insert(0, indices[0])
-    indices.append(indices[-1])
+        effects_params.append(merge_effect_params(break_point, kwargs))
 
-    processed_sound = np.zeros_like(sound)
-    effect_fn = REGISTRY_OF_AUTOMATABLE_EFFECTS[automated_effect_name]
-    zipped = zip(indices, indices[1:], indices[2:], effects_params)
-    for start_index, center_index, end_index, effect_params in zipped:
-        fragment = np.copy(sound[:, start_index:end_index])
-        processed_fragment = effect_fn(fragment, event, **effect_params, **kwargs)
-        if center_index - start_index > 0:
-            asc_weights = np.linspace(0, 1, center_index - start_index, False)
-        else:
-            asc_weights = np.array([])
-        if end_index - center_index > 0:
-            desc_weights = np.linspace(1, 0, end_index - center_index, False)
-        else:
-            desc_weights = np.array([])
-        weights = np.hstack((asc_weights, desc_weights))
+    if automated_effect_name in EFFECTS_WITH_PARAMETERS_CURVES:
+        effect_fn = partial(
+            apply_effect_with_parameters_curves,
+            REGISTRY_OF_AUTOMATABLE_EFFECTS[automated_effect_name]
+        )
+        varying_params_names = EFFECTS_WITH_PARAMETERS_CURVES[automated_effect_name]
+    elif automated_effect_name in EFFECTS_WITH_INTERPOLATED_FILTERS:
+        effect_fn, varying_params_names = EFFECTS_WITH_INTERPOLATED_FILTERS[automated_effect_name]
+    else:
+        return apply_effect_to_spans(sound, event, automated_effect_name, indices, effects_params)
 
-        processed_fragment *= weights
-        processed_sound[:, start_index:end_index] += processed_fragment
-    return processed_sound
+    break_points_params, constant_params = split_effects_params(
+        effects_params, varying_params_names
+    )
+    if constant_params is None:
+        return apply_effect_to_spans(sound, event, automated_effect_name, indices, effects_params)
+    positions = np.interp(np.arange(n_frames), indices, np.arange(len(indices)))
+    sound = effect_fn(sound, event, positions, break_points_params, **constant_params)
+    return sound
+
+
+def compute_automated_effect_tail(
+        event: 'sinethesizer.synth.core.Event',
+        automated_effect_name: str, break_points: list[dict[str, Any]],
+        **kwargs
+) -> int:
+    """
+    Compute number of frames that are added to a sound by `apply_automated_effect` function.
+
+    :param event:
+        parameters of sound event for which this function is called
+    :param automated_effect_name:
+        name of function from the registry that applies the effect
+    :param break_points:
+        points that define dynamics of effect parameters
+    :return:
+        number of extra frames
+    """
+    tail_fn = REGISTRY_OF_AUTOMATABLE_EFFECTS_TAILS.get(automated_effect_name)
+    if tail_fn is None:
+        return 0
+    tails = [
+        tail_fn(event, **merge_effect_params(break_point, kwargs))
+        for break_point in break_points
+    ]
+    return max(tails)
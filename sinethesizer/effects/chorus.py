@@ -10,7 +10,7 @@ from typing import Any
 import numpy as np
 
 from sinethesizer.effects.vibrato import apply_vibrato
-from sinethesizer.utils.misc import sum_two_sounds
+from sinethesizer.utils.misc import SoundAccumulator
 
 
 def apply_chorus(
@@ -34,7 +34,9 @@ def apply_chorus(
     :return:
         enriched sound somehow resembling sounds produced by choirs or ensembles
     """
-    processed_copies = []
+    n_frames = sound.shape[1] + compute_chorus_tail(event, original_sound_gain, copies_params)
+    accumulator = SoundAccumulator(n_frames, sound.dtype, sound.shape[0])
+    accumulator.add(original_sound_gain * sound)
     for copy_params in copies_params:
         delay_in_sec = copy_params['delay']
         gain = copy_params['gain']
@@ -42,10 +44,30 @@ def apply_chorus(
         detuned_copy = apply_vibrato(sound, event, **vibrato_params)
         detuned_copy *= gain
         n_frames_with_silence = int(round(delay_in_sec * event.frame_rate))
-        silence = np.zeros((sound.shape[0], n_frames_with_silence))
-        processed_copy = np.hstack((silence, detuned_copy))
-        processed_copies.append(processed_copy)
-    sound *= original_sound_gain
-    for processed_copy in processed_copies:
-        sound = sum_two_sounds(sound, processed_copy)
+        accumulator.add(detuned_copy, n_frames_with_silence)
+    sound = accumulator.get_sound()
     return sound
+
+
+def compute_chorus_tail(
+        event: 'sinethesizer.synth.core.Event',
+        original_sound_gain: float, copies_params: list[dict[str, Any]]
+) -> int:
+    """
+    Compute number of frames that are added to a sound by `apply_chorus` function.
+
+    :param event:
+        parameters of sound event for which this function is called
+    :param original_sound_gain:
+        an argument that is not used by this function;
+        it is added, because all tail functions must accept parameters of their effects
+    :param copies_params:
+        list of dictionaries each of which contains delay time for a current copy
+    :return:
+        number of extra frames
+    """
+    _ = original_sound_gain  # This argument is ignored.
+    delays_in_frames = [
+        int(round(copy_params['delay'] * event.frame_rate)) for copy_params in copies_params
+    ]
+    return max(delays_in_frames, default=0)
@@ -11,16 +11,57 @@ Author: Nikolay Lysenko
 """
 
 
+from typing import Optional
+
 import numpy as np
-from scipy.signal import convolve, firwin2
 
+from sinethesizer.utils.convolution import convolve, convolve_with_interpolated_kernels
+from sinethesizer.utils.filter_design import design_fir_filter, quantize_frequency
 from sinethesizer.utils.misc import mix_with_original_sound
 
 
+def design_equalizer(
+        frame_rate: int, breakpoint_frequencies: list[float], gains: list[float],
+        quantization_step: Optional[float] = None, **kwargs
+) -> np.ndarray:
+    """
+    Design FIR filter with given frequency response.
+
+    :param frame_rate:
+        number of frames per second
+    :param breakpoint_frequencies:
+        frequencies (in Hz) that correspond to breaks in frequency response of equalizer
+    :param gains:
+        relative gains at corresponding breakpoint frequencies; a gain at an intermediate frequency
+        is linearly interpolated
+    :param quantization_step:
+        if it is passed, breakpoint frequencies are rounded to the nearest nodes of logarithmic
+        grid with this step (in cents); it allows reusing filter designs for multiple notes
+    :return:
+        coefficients of FIR filter (read-only array); its size depends only on `frame_rate`
+    """
+    nyquist_frequency = 0.5 * frame_rate
+    breakpoint_frequencies = [
+        min(quantize_frequency(x, quantization_step) / nyquist_frequency, 1)
+        for x in breakpoint_frequencies
+    ]
+    gains = [x for x in gains]  # Copy it to prevent modifying original list.
+    if breakpoint_frequencies[0] != 0:
+        breakpoint_frequencies.insert(0, 0)
+        gains.insert(0, gains[0])
+    if breakpoint_frequencies[-1] != 1:
+        breakpoint_frequencies.append(1)
+        gains.append(gains[-1])
+    # `fir_size` is odd, because else there are constraints on `gains`.
+    fir_size = 2 * int(round(frame_rate / 100)) + 1
+    fir = design_fir_filter(fir_size, breakpoint_frequencies, gains, **kwargs)
+    return fir
+
+
 def equalize_with_absolute_frequencies(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
         breakpoint_frequencies: list[float], gains: list[float],
-        **kwargs
+        quantization_step: Optional[float] = None, **kwargs
 ) -> np.ndarray:
     """
     Change power and amplitude distribution across frequencies.
@@ -34,32 +75,23 @@ def equalize_with_absolute_frequencies(
     :param gains:
         relative gains at corresponding breakpoint frequencies; a gain at an intermediate frequency
         is linearly interpolated
+    :param quantization_step:
+        if it is passed, breakpoint frequencies are rounded to the nearest nodes of logarithmic
+        grid with this step (in cents); it allows reusing filter designs for multiple notes
     :return:
         sound with altered frequency balance
     """
-    nyquist_frequency = 0.5 * event.frame_rate
-    breakpoint_frequencies = [min(x / nyquist_frequency, 1) for x in breakpoint_frequencies]
-    gains = [x for x in gains]  # Copy it to prevent modifying original list.
-    if breakpoint_frequencies[0] != 0:
-        breakpoint_frequencies.insert(0, 0)
-        gains.insert(0, gains[0])
-    if breakpoint_frequencies[-1] != 1:
-        breakpoint_frequencies.append(1)
-        gains.append(gains[-1])
-    # `fir_size` is odd, because else there are constraints on `gains`.
-    fir_size = 2 * int(round(event.frame_rate / 100)) + 1
-    fir = firwin2(fir_size, breakpoint_frequencies, gains, **kwargs)
-    sound = np.vstack((
-        convolve(sound[0, :], fir, mode='same'),
-        convolve(sound[1, :], fir, mode='same'),
-    ))
+    fir = design_equalizer(
+        event.frame_rate, breakpoint_frequencies, gains, quantization_step, **kwargs
+    )
+    sound = convolve(sound, fir, mode='same')
     return sound
 
 
 def equalize_with_relative_frequencies(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
         breakpoint_frequencies_ratios: list[float], gains: list[float],
-        **kwargs
+        quantization_step: Optional[float] = None, **kwargs
 ) -> np.ndarray:
     """
     Change power and amplitude distribution across frequencies.
@@ -74,13 +106,16 @@ def equalize_with_relative_frequencies(
     :param gains:
         relative gains at corresponding breakpoint frequencies; a gain at an intermediate frequency
         is linearly interpolated
+    :param quantization_step:
+        if it is passed, breakpoint frequencies are rounded to the nearest nodes of logarithmic
+        grid with this step (in cents); it allows reusing filter designs for multiple notes
     :return:
         sound with altered frequency balance
     """
     fundamental_frequency = event.frequency
     breakpoint_frequencies = [x * fundamental_frequency for x in breakpoint_frequencies_ratios]
     sound = equalize_with_absolute_frequencies(
-        sound, event, breakpoint_frequencies, gains, **kwargs
+        sound, event, breakpoint_frequencies, gains, quantization_step, **kwargs
     )
     return sound
 
@@ -109,3 +144,53 @@ def apply_equalizer(
     else:
         raise ValueError(f"Supported kinds are 'absolute' and 'relative', but found: {kind}")
     return sound
+
+
+@mix_with_original_sound
+def apply_equalizer_with_interpolation(
+        sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
+        positions: np.ndarray, break_points_params: list[dict[str, list[float]]],
+        kind: str = 'absolute', quantization_step: Optional[float] = None, **kwargs
+) -> np.ndarray:
+    """
+    Change frequency response of equalizer over time.
+
+    Filters are designed for break points only and filters between them are interpolated
+    (interpolation of coefficients of FIR filters is the same as interpolation of their
+    frequency responses).
+
+    :param sound:
+        sound to be modified
+    :param event:
+        parameters of sound event for which this function is called
+    :param positions:
+        positions between break points (from 0 to number of break points minus 1)
+        for all frames of sound
+    :param break_points_params:
+        for each break point, mapping from 'gains' and either 'breakpoint_frequencies'
+        (if `kind` is 'absolute') or 'breakpoint_frequencies_ratios' (if `kind` is 'relative')
+        to values of these parameters
+    :param kind:
+        kind of filter; supported values are 'absolute' and 'relative'
+    :param quantization_step:
+        if it is passed, breakpoint frequencies are rounded to the nearest nodes of logarithmic
+        grid with this step (in cents); it allows reusing filter designs for multiple notes
+    :return:
+        sound with altered frequency balance
+    """
+    firs = []
+    for params in break_points_params:
+        if kind == 'absolute':
+            breakpoint_frequencies = params['breakpoint_frequencies']
+        elif kind == 'relative':
+            breakpoint_frequencies = [
+                x * event.frequency for x in params['breakpoint_frequencies_ratios']
+            ]
+        else:
+            raise ValueError(f"Supported kinds are 'absolute' and 'relative', but found: {kind}")
+        fir = design_equalizer(
+            event.frame_rate, breakpoint_frequencies, params['gains'], quantization_step, **kwargs
+        )
+        firs.append(fir)
+    sound = convolve_with_interpolated_kernels(sound, np.array(firs), positions, mode='same')
+    return sound
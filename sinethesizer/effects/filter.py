@@ -13,16 +13,118 @@ Author: Nikolay Lysenko
 from typing import Optional
 
 import numpy as np
-from scipy.signal import butter, sosfilt
+from scipy.signal import sosfilt
 
+from sinethesizer.utils.filter_design import (
+    design_butterworth_filter, design_state_variable_butterworth_filters, quantize_frequency
+)
 from sinethesizer.utils.misc import mix_with_original_sound
 
 
+def design_frequency_filter(
+        frame_rate: int,
+        min_frequency: Optional[float] = None,
+        max_frequency: Optional[float] = None,
+        invert: bool = False, order: int = 25,
+        quantization_step: Optional[float] = None
+) -> np.ndarray:
+    """
+    Design Butterworth filter that mutes some frequency ranges (defined in Hz).
+
+    :param frame_rate:
+        number of frames per second
+    :param min_frequency:
+        cutoff frequency for high-pass filtering (in Hz);
+        there is no high-pass filtering by default
+    :param max_frequency:
+        cutoff frequency for low-pass filtering (in Hz);
+        there is no low-pass filtering by default
+    :param invert:
+        if it is `True` and both `min_frequency` and `max_frequency` are passed,
+        band-stop filter is designed instead of band-pass filter
+    :param order:
+        order of the filter; the higher it is, the steeper cutoff is
+    :param quantization_step:
+        if it is passed, cutoff frequencies are rounded to the nearest nodes of logarithmic grid
+        with this step (in cents); it allows reusing filter designs for multiple notes
+    :return:
+        second-order sections of filter; their number is equal to `order`
+    """
+    invert = invert and min_frequency is not None and max_frequency is not None
+    filter_type = 'bandstop' if invert else 'bandpass'
+    nyquist_frequency = 0.5 * frame_rate
+    small_const = 1e-8
+    if min_frequency is not None:
+        min_frequency = quantize_frequency(min_frequency, quantization_step)
+    if max_frequency is not None:
+        max_frequency = quantize_frequency(max_frequency, quantization_step)
+    min_frequency = min_frequency or small_const
+    max_frequency = max_frequency or nyquist_frequency - small_const
+    min_threshold = min(max(min_frequency / nyquist_frequency, small_const), 1 - small_const)
+    max_threshold = min(max(max_frequency / nyquist_frequency, small_const), 1 - small_const)
+    second_order_sections = design_butterworth_filter(
+        order, min_threshold, max_threshold, filter_type
+    )
+    return second_order_sections
+
+
+def design_varying_frequency_filter(
+        frame_rate: int,
+        min_frequencies: Optional[np.ndarray] = None,
+        max_frequencies: Optional[np.ndarray] = None,
+        invert: bool = False, order: int = 25
+) -> np.ndarray:
+    """
+    Design Butterworth filters that mute frequency ranges (defined in Hz) changing over time.
+
+    Unlike `design_frequency_filter`, missing cutoff results in low-pass or high-pass filter
+    and not in band-pass filter with cutoff close to 0 or to Nyquist frequency, because
+    such filter has poles that are too sensitive to changes of its coefficients.
+
+    :param frame_rate:
+        number of frames per second
+    :param min_frequencies:
+        cutoff frequencies for high-pass filtering (in Hz);
+        there is no high-pass filtering by default
+    :param max_frequencies:
+        cutoff frequencies for low-pass filtering (in Hz);
+        there is no low-pass filtering by default
+    :param invert:
+        if it is `True` and both `min_frequencies` and `max_frequencies` are passed,
+        band-stop filters are designed instead of band-pass filters
+    :param order:
+        order of the filters; the higher it is, the steeper cutoffs are
+    :return:
+        state space models of sections of filters as array of shape (n_filters, n_sections, 9)
+        (see `design_state_variable_butterworth_filters` function)
+    """
+    if min_frequencies is None and max_frequencies is None:
+        raise ValueError("At least one of cutoff frequencies must be passed.")
+    nyquist_frequency = 0.5 * frame_rate
+    small_const = 1e-8
+    min_thresholds = max_thresholds = None
+    if min_frequencies is not None:
+        min_thresholds = np.clip(min_frequencies / nyquist_frequency, small_const, 1 - small_const)
+    if max_frequencies is not None:
+        max_thresholds = np.clip(max_frequencies / nyquist_frequency, small_const, 1 - small_const)
+    if min_thresholds is None:
+        filter_type = 'lowpass'
+    elif max_thresholds is None:
+        filter_type = 'highpass'
+    else:
+        filter_type = 'bandstop' if invert else 'bandpass'
+    sections = design_state_variable_butterworth_filters(
+        order, min_thresholds, max_thresholds, filter_type
+    )
+    return sections
+
+
 def filter_absolute_frequencies(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
         min_frequency: Optional[float] = None,
         max_frequency: Optional[float] = None,
-        invert: bool = False, order: int = 25
+        invert: bool = False, order: int = 25,
+        quantization_step: Optional[float] = None
 ) -> np.ndarray:
     """
     Filter some frequency ranges (defined in Hz) from original sound.
@@ -42,24 +144,17 @@ def filter_absolute_frequencies(
         band-stop filter is applied instead of band-pass filter
     :param order:
         order of the filter; the higher it is, the steeper cutoff is
+    :param quantization_step:
+        if it is passed, cutoff frequencies are rounded to the nearest nodes of logarithmic grid
+        with this step (in cents); it allows reusing filter designs for multiple notes
     :return:
         sound with some frequencies muted
     """
-    invert = invert and min_frequency is not None and max_frequency is not None
-    filter_type = 'bandstop' if invert else 'bandpass'
-    nyquist_frequency = 0.5 * event.frame_rate
-    small_const = 1e-8
-    min_frequency = min_frequency or small_const
-    max_frequency = max_frequency or nyquist_frequency - small_const
-    min_threshold = min(max(min_frequency / nyquist_frequency, small_const), 1 - small_const)
-    max_threshold = min(max(max_frequency / nyquist_frequency, small_const), 1 - small_const)
-    second_order_sections = butter(
-        order,
-        [min_threshold, max_threshold],
-        btype=filter_type,
-        output='sos'  # 'ba' is not used, because sometimes it lacks numerical stability.
+    second_order_sections = design_frequency_filter(
+        event.frame_rate, min_frequency, max_frequency, invert, order, quantization_step
     )
-    sound = sosfilt(second_order_sections, sound)
+    # Filter coefficients are kept as 64-bit floats for numerical stability.
+    sound = sosfilt(second_order_sections, sound).astype(sound.dtype, copy=False)
     return sound
 
 
@@ -67,7 +162,8 @@ def filter_relative_frequencies(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
         min_frequency_ratio: Optional[float] = None,
         max_frequency_ratio: Optional[float] = None,
-        invert: bool = False, order: int = 25
+        invert: bool = False, order: int = 25,
+        quantization_step: Optional[float] = None
 ) -> np.ndarray:
     """
     Filter some frequency ranges (defined as ratios) from original sound.
@@ -87,6 +183,9 @@ def filter_relative_frequencies(
         band-stop filter is applied instead of band-pass filter
     :param order:
         order of the filter; the higher it is, the steeper cutoff is
+    :param quantization_step:
+        if it is passed, cutoff frequencies are rounded to the nearest nodes of logarithmic grid
+        with this step (in cents); it allows reusing filter designs for multiple notes
     :return:
         sound with some frequencies muted
     """
@@ -97,7 +196,9 @@ def filter_relative_frequencies(
     max_frequency = None
     if max_frequency_ratio is not None:
         max_frequency = max_frequency_ratio * fundamental_frequency
-    sound = filter_absolute_frequencies(sound, event, min_frequency, max_frequency, invert, order)
+    sound = filter_absolute_frequencies(
+        sound, event, min_frequency, max_frequency, invert, order, quantization_step
+    )
     return sound
 
 
@@ -109,7 +210,8 @@ def filter_absolute_frequencies_wrt_velocity(
         max_frequency_at_zero_velocity: Optional[float] = None,
         max_frequency_at_max_velocity: Optional[float] = None,
         max_frequency_on_velocity_order: Optional[float] = None,
-        invert: bool = False, order: int = 25
+        invert: bool = False, order: int = 25,
+        quantization_step: Optional[float] = None
 ) -> np.ndarray:
     """
     Filter some frequencies (in Hz) depending on velocity.
@@ -141,6 +243,9 @@ def filter_absolute_frequencies_wrt_velocity(
         band-stop filter is applied instead of band-pass filter
     :param order:
         order of the filter; the higher it is, the steeper cutoff is
+    :param quantization_step:
+        if it is passed, cutoff frequencies are rounded to the nearest nodes of logarithmic grid
+        with this step (in cents); it allows reusing filter designs for multiple notes
     :return:
         sound with some frequencies muted
     """
@@ -154,7 +259,9 @@ def filter_absolute_frequencies_wrt_velocity(
         coef = event.velocity ** max_frequency_on_velocity_order
         increment = coef * (max_frequency_at_max_velocity - max_frequency_at_zero_velocity)
         max_frequency = max_frequency_at_zero_velocity + increment
-    sound = filter_absolute_frequencies(sound, event, min_frequency, max_frequency, invert, order)
+    sound = filter_absolute_frequencies(
+        sound, event, min_frequency, max_frequency, invert, order, quantization_step
+    )
     return sound
 
 
@@ -166,7 +273,8 @@ def filter_relative_frequencies_wrt_velocity(
         max_frequency_ratio_at_zero_velocity: Optional[float] = None,
         max_frequency_ratio_at_max_velocity: Optional[float] = None,
         max_frequency_ratio_on_velocity_order: Optional[float] = None,
-        invert: bool = False, order: int = 25
+        invert: bool = False, order: int = 25,
+        quantization_step: Optional[float] = None
 ) -> np.ndarray:
     """
     Filter some frequencies (defined as ratios) depending on velocity.
@@ -202,6 +310,9 @@ def filter_relative_frequencies_wrt_velocity(
         band-stop filter is applied instead of band-pass filter
     :param order:
         order of the filter; the higher it is, the steeper cutoff is
+    :param quantization_step:
+        if it is passed, cutoff frequencies are rounded to the nearest nodes of logarithmic grid
+        with this step (in cents); it allows reusing filter designs for multiple notes
     :return:
         sound with some frequencies muted
     """
@@ -222,7 +333,8 @@ def filter_relative_frequencies_wrt_velocity(
         )
         max_frequency_ratio = max_frequency_ratio_at_zero_velocity + increment
     sound = filter_relative_frequencies(
-        sound, event, min_frequency_ratio, max_frequency_ratio, invert, order
+        sound, event, min_frequency_ratio, max_frequency_ratio, invert, order,
+        quantization_step
     )
     return sound
 
@@ -9,42 +9,184 @@ Author: Nikolay Lysenko
 """
 
 
-from typing import Optional
+from typing import Any, Optional
 
 import numpy as np
 
-from sinethesizer.effects.filter import apply_frequency_filter
+from sinethesizer.effects.filter import apply_frequency_filter, design_varying_frequency_filter
 from sinethesizer.oscillators import generate_mono_wave
+from sinethesizer.utils.filter_design import quantize_frequency
 from sinethesizer.utils.misc import mix_with_original_sound
 
 
-def oscillate_between_sounds(
-        sounds: np.ndarray, frame_rate: int, frequency: float,
-        phase: float = 0.0, waveform: str = 'sine'
+# Coefficients of sweeping filter are updated once per this number of frames.
+FILTER_SWEEP_BLOCK_SIZE = 64
+
+
+def interpolate_cutoff_frequencies(
+        cutoff_frequencies: list[Optional[float]], positions: np.ndarray,
+        default_frequency: float
+) -> Optional[np.ndarray]:
+    """
+    Interpolate cutoff frequencies of bands linearly.
+
+    :param cutoff_frequencies:
+        cutoff frequencies of bands (in Hz); some of them can be `None`
+    :param positions:
+        positions between bands (from 0 to number of bands minus 1)
+    :param default_frequency:
+        frequency (in Hz) that is used instead of missing cutoffs if cutoffs of
+        some other bands are set
+    :return:
+        cutoff frequencies at the positions or `None` if there is no cutoff for any band
+    """
+    if all(x is None for x in cutoff_frequencies):
+        return None
+    cutoff_frequencies = [x if x is not None else default_frequency for x in cutoff_frequencies]
+    return np.interp(positions, np.arange(len(cutoff_frequencies)), cutoff_frequencies)
+
+
+def propagate_states_through_blocks(
+        transition_matrices: np.ndarray, final_states: np.ndarray
 ) -> np.ndarray:
     """
-    Combine multiple sounds into one sound by oscillating between them.
+    Find states of a section at starts of blocks.
 
-    :param sounds:
-        array of shape (n_sounds, n_channels, n_frames)
-    :param frame_rate:
-        number of frames per second
-    :param frequency:
-        frequency of oscillations between sound sources
-    :param phase:
-        phase shift of oscillations (in radians)
-    :param waveform:
-        form of oscillations wave
+    State at the start of a block is `transition_matrix @ previous_state + final_state`,
+    where values are related to the previous block. This recurrence is solved with
+    parallel prefix scan, so number of steps is logarithmic in number of blocks.
+
+    :param transition_matrices:
+        transition matrices of a section over whole blocks as array of shape (n_blocks, 2, 2)
+    :param final_states:
+        states at ends of blocks if blocks start from zero states as array of shape
+        (2, n_channels, n_blocks)
     :return:
-        sound composed of input sounds
-    """
-    thresholds = np.linspace(-1, 1, sounds.shape[0])
-    weights = np.tile(thresholds.reshape((-1, 1)), (1, sounds.shape[2]))
-    wave = generate_mono_wave(waveform, frequency, np.ones(sounds.shape[2]), frame_rate, phase)
-    step = 2 / (sounds.shape[0] - 1)
-    weights = (1 - np.abs(weights - wave) / step) * (np.abs(weights - wave) < step)
-    weights = weights.reshape((weights.shape[0], 1, weights.shape[1]))
-    sound = np.sum(sounds * weights, axis=0)
+        states at starts of blocks as array of shape (2, n_channels, n_blocks)
+    """
+    matrices = transition_matrices
+    states = final_states
+    shift = 1
+    while shift < matrices.shape[0]:
+        current_matrices = matrices[shift:].transpose((1, 2, 0))
+        states = states.copy()
+        states[:, :, shift:] += np.stack((
+            current_matrices[0, 0] * states[0, :, :-shift]
+            + current_matrices[0, 1] * states[1, :, :-shift],
+            current_matrices[1, 0] * states[0, :, :-shift]
+            + current_matrices[1, 1] * states[1, :, :-shift]
+        ))
+        matrices = matrices.copy()
+        matrices[shift:] = matrices[shift:] @ matrices[:-shift]
+        shift *= 2
+    initial_states = np.zeros_like(states)
+    initial_states[:, :, 1:] = states[:, :, :-1]
+    return initial_states
+
+
+def filter_with_varying_sections(
+        sound: np.ndarray, sections: np.ndarray, block_size: int
+) -> np.ndarray:
+    """
+    Filter sound with cascade of sections which coefficients change once per block.
+
+    States of sections are passed from block to block, but all blocks are processed
+    simultaneously: at first, blocks are filtered from zero states and then from true states.
+
+    :param sound:
+        sound to be filtered
+    :param sections:
+        state space models of sections for each block as array of shape
+        (n_blocks, n_sections, 9) (see `design_state_variable_butterworth_filters` function)
+    :param block_size:
+        number of frames in a block (the last block can be shorter)
+    :return:
+        filtered sound
+    """
+    n_channels, n_frames = sound.shape
+    n_blocks = sections.shape[0]
+    signal = np.zeros((n_channels, n_blocks * block_size))
+    signal[:, :n_frames] = sound
+    # Frames with the same index within blocks are stored contiguously.
+    signal = signal.reshape((n_channels, n_blocks, block_size)).transpose((2, 0, 1)).copy()
+    for section in sections.transpose((1, 2, 0)):
+        a11, a12, a21, a22, b1, b2, c1, c2, d = section
+
+        first_states = np.zeros((n_channels, n_blocks))
+        second_states = np.zeros((n_channels, n_blocks))
+        for frame_signal in signal:
+            first_states, second_states = (
+                a11 * first_states + a12 * second_states + b1 * frame_signal,
+                a21 * first_states + a22 * second_states + b2 * frame_signal
+            )
+        block_transition_matrices = np.linalg.matrix_power(
+            section[:4].T.reshape((n_blocks, 2, 2)), block_size
+        )
+        first_states, second_states = propagate_states_through_blocks(
+            block_transition_matrices, np.stack((first_states, second_states))
+        )
+        result = np.empty_like(signal)
+        for frame_index, frame_signal in enumerate(signal):
+            result[frame_index] = c1 * first_states + c2 * second_states + d * frame_signal
+            first_states, second_states = (
+                a11 * first_states + a12 * second_states + b1 * frame_signal,
+                a21 * first_states + a22 * second_states + b2 * frame_signal
+            )
+        signal = result
+    signal = signal.transpose((1, 2, 0)).reshape((n_channels, -1))[:, :n_frames]
+    sound = signal.astype(sound.dtype, copy=False)
+    return sound
+
+
+def filter_with_varying_cutoffs(
+        sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
+        bands: list[tuple[Optional[float], Optional[float]]], positions: np.ndarray,
+        invert: bool, order: int
+) -> np.ndarray:
+    """
+    Filter sound with cutoffs that are interpolated between bands once per block.
+
+    :param sound:
+        sound to be filtered
+    :param event:
+        parameters of sound event for which this function is called
+    :param bands:
+        pairs of minimum and maximum cutoff frequencies (in Hz); missing minimum cutoff is
+        treated as 0 Hz and missing maximum cutoff is treated as Nyquist frequency
+        unless the cutoff is missing for all bands
+    :param positions:
+        positions between bands (from 0 to number of bands minus 1) at starts of blocks of
+        `FILTER_SWEEP_BLOCK_SIZE` frames
+    :param invert:
+        if it is `True` and all cutoff frequencies of all bands are set not to `None`,
+        band-stop filters are applied instead of band-pass filters
+    :param order:
+        order of filters; the higher it is, the steeper cutoffs are
+    :return:
+        filtered sound
+    """
+    if all(tuple(band) == (None, None) for band in bands):
+        sound = apply_frequency_filter(sound, event, 'absolute', None, None, invert, order)
+        return sound
+    nyquist_frequency = 0.5 * event.frame_rate
+    min_frequencies = interpolate_cutoff_frequencies([band[0] for band in bands], positions, 0)
+    max_frequencies = interpolate_cutoff_frequencies(
+        [band[1] for band in bands], positions, nyquist_frequency
+    )
+    has_missing_cutoffs = any(x is None for band in bands for x in band)
+    if has_missing_cutoffs and min_frequencies is not None and max_frequencies is not None:
+        # Band-pass filters with cutoffs close to 0 or to Nyquist frequency are too sensitive
+        # to changes of their coefficients, so high-pass and low-pass filters are chained.
+        # As for static filters, band-stop filters are used only if all cutoffs are set.
+        sections = np.concatenate((
+            design_varying_frequency_filter(event.frame_rate, min_frequencies, None, order=order),
+            design_varying_frequency_filter(event.frame_rate, None, max_frequencies, order=order)
+        ), axis=1)
+    else:
+        sections = design_varying_frequency_filter(
+            event.frame_rate, min_frequencies, max_frequencies, invert, order
+        )
+    sound = filter_with_varying_sections(sound, sections, FILTER_SWEEP_BLOCK_SIZE)
     return sound
 
 
@@ -59,6 +201,10 @@ def apply_filter_sweep(
     """
     Filter some frequencies with oscillating cutoffs.
 
+    Cutoff frequencies are interpolated between the passed bands and filter is redesigned
+    once per `FILTER_SWEEP_BLOCK_SIZE` frames, so computational cost does not depend
+    on the number of bands.
+
     :param sound:
         sound to be modified
     :param event:
@@ -69,35 +215,100 @@ def apply_filter_sweep(
         fundamental frequency
     :param bands:
         list of pairs of minimum and maximum cutoff frequencies;
-        oscillations are between sounds obtained from input sound after
-        applying filters with these cutoff frequencies
+        filter sweeps through these bands in their order; missing minimum cutoff is
+        treated as 0 Hz and missing maximum cutoff is treated as Nyquist frequency
+        unless the cutoff is missing for all bands
     :param invert:
-        if it is `True`, for bands with both cutoff frequencies set not to
-        `None`, band-stop filters are applied instead of band-pass filters
+        if it is `True` and all cutoff frequencies of all bands are set not to `None`,
+        band-stop filters are applied instead of band-pass filters
     :param order:
         order of filters; the higher it is, the steeper cutoffs are
     :param frequency:
-        frequency of oscillations between filtered sounds (in Hz)
+        frequency of sweeping band oscillations (in Hz)
     :param phase:
         phase shift of sweeping band oscillations (in radians)
     :param waveform:
-        form of wave that specifies oscillations between filtered sounds
+        form of wave that specifies sweeping band oscillations
     :return:
         sound filtered with varying cutoff frequencies
     """
     bands = bands or [(None, None)]
-    if len(bands) == 1:
+    if len(bands) == 1 or all(tuple(band) == (None, None) for band in bands):
         sound = apply_frequency_filter(sound, event, kind, bands[0][0], bands[0][1], invert, order)
         return sound
-    filtered_sounds = [
-        apply_frequency_filter(
-            sound, event, kind, min_cutoff_frequency, max_cutoff_frequency, invert, order
-        )
-        for min_cutoff_frequency, max_cutoff_frequency in bands
+    if kind == 'relative':
+        bands = [
+            tuple(x * event.frequency if x is not None else None for x in band)
+            for band in bands
+        ]
+    elif kind != 'absolute':
+        raise ValueError(f"Kind must be either 'absolute' or 'relative', but found: {kind}")
+    amplitude_envelope = np.ones(sound.shape[1])
+    wave = generate_mono_wave(waveform, frequency, amplitude_envelope, event.frame_rate, phase)
+    positions = (wave[::FILTER_SWEEP_BLOCK_SIZE] + 1) / 2 * (len(bands) - 1)
+    sound = filter_with_varying_cutoffs(sound, event, bands, positions, invert, order)
+    return sound
+
+
+@mix_with_original_sound
+def apply_frequency_filter_with_interpolation(
+        sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
+        positions: np.ndarray, break_points_params: list[dict[str, Any]],
+        kind: str = 'absolute', invert: bool = False, order: int = 25,
+        quantization_step: Optional[float] = None
+) -> np.ndarray:
+    """
+    Filter some frequencies with cutoffs changing over time.
+
+    Cutoff frequencies are interpolated between break points and filter is redesigned
+    once per `FILTER_SWEEP_BLOCK_SIZE` frames, so sound is filtered by a single pass.
+
+    :param sound:
+        sound to be modified
+    :param event:
+        parameters of sound event for which this function is called
+    :param positions:
+        positions between break points (from 0 to number of break points minus 1)
+        for all frames of sound
+    :param break_points_params:
+        for each break point, mapping from 'min_frequency' and 'max_frequency'
+        (if `kind` is 'absolute') or from 'min_frequency_ratio' and 'max_frequency_ratio'
+        (if `kind` is 'relative') to cutoff frequencies; missing cutoffs are treated
+        as in `apply_filter_sweep` function
+    :param kind:
+        kind of filter; supported values are 'absolute' and 'relative'
+    :param invert:
+        if it is `True` and all cutoff frequencies of all break points are set,
+        band-stop filters are applied instead of band-pass filters
+    :param order:
+        order of filters; the higher it is, the steeper cutoffs are
+    :param quantization_step:
+        if it is passed, cutoff frequencies of break points are rounded to the nearest nodes
+        of logarithmic grid with this step (in cents) as in static filters
+    :return:
+        sound filtered with varying cutoff frequencies
+    """
+    if kind == 'absolute':
+        bands = [
+            (params.get('min_frequency'), params.get('max_frequency'))
+            for params in break_points_params
+        ]
+    elif kind == 'relative':
+        bands = [
+            tuple(
+                x * event.frequency if x is not None else None
+                for x in (params.get('min_frequency_ratio'), params.get('max_frequency_ratio'))
+            )
+            for params in break_points_params
+        ]
+    else:
+        raise ValueError(f"Kind must be either 'absolute' or 'relative', but found: {kind}")
+    bands = [
+        tuple(quantize_frequency(x, quantization_step) if x is not None else None for x in band)
+        for band in bands
     ]
-    filtered_sounds = [x.reshape((1, x.shape[0], x.shape[1])) for x in filtered_sounds]
-    filtered_sounds = np.concatenate(filtered_sounds)
-    sound = oscillate_between_sounds(filtered_sounds, event.frame_rate, frequency, phase, waveform)
+    positions = positions[::FILTER_SWEEP_BLOCK_SIZE]
+    sound = filter_with_varying_cutoffs(sound, event, bands, positions, invert, order)
     return sound
 
 
@@ -122,9 +333,9 @@ def apply_absolute_phaser(
     :param band_width:
         width of sweeping band (in Hz)
     :param n_bands:
-        number of band positions to consider; the higher it is, the more close
-        to classical phaser result is, but also the longer computations are
-        and the higher RAM consumption is during track creation
+        number of band positions for which filters are designed; filters for positions
+        between them are interpolated, so the higher it is, the more close
+        to classical phaser result is
     :param order:
         order of filters; the higher it is, the steeper cutoffs are
     :param frequency:
@@ -175,9 +386,9 @@ def apply_relative_phaser(
     :param relative_band_width:
         width of sweeping band as ratio to fundamental frequency
     :param n_bands:
-        number of band positions to consider; the higher it is, the more close
-        to classical phaser result is, but also the longer computations are
-        and the higher RAM consumption is during track creation
+        number of band positions for which filters are designed; filters for positions
+        between them are interpolated, so the higher it is, the more close
+        to classical phaser result is
     :param order:
         order of filters; the higher it is, the steeper cutoffs are
     :param frequency:
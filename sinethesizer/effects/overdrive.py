@@ -5,12 +5,15 @@ Author: Nikolay Lysenko
 """
 
 
+from typing import Union
+
 import numpy as np
 
 
 def apply_overdrive(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
-        fraction_to_clip: float = 0.1, strength: float = 0.333
+        fraction_to_clip: Union[float, np.ndarray] = 0.1,
+        strength: Union[float, np.ndarray] = 0.333
 ) -> np.ndarray:
     """
     Overdrive the sound.
@@ -21,21 +24,35 @@ def apply_overdrive(
         an argument that is not used by this function;
         it is added, because all effect functions must have it
     :param fraction_to_clip:
-        fraction of the most outlying frames to be hard clipped
+        fraction of the most outlying frames to be hard clipped;
+        it can be an array with a fraction for each frame (then clipping threshold of a frame
+        is computed as if the fraction were constant and equal to this value)
     :param strength:
-        relative strength of distortion, must be between 0 and 1
+        relative strength of distortion, must be between 0 and 1;
+        it can be an array with a strength for each frame
     :return:
         overdriven sound
     """
-    if not (0 < fraction_to_clip < 1):
+    if not np.all((0 < fraction_to_clip) & (fraction_to_clip < 1)):
         raise ValueError("Fraction to clip must be between 0 and 1.")
-    if not (0 <= strength < 1):
+    if not np.all((0 <= strength) & (strength < 1)):
         raise ValueError("Overdrive strength must be between 0 and 1.")
     _ = event  # This argument is ignored.
 
     abs_sound = np.abs(sound)
-    clipping_threshold = np.quantile(abs_sound, 1 - fraction_to_clip, axis=1)
-    clipping_threshold = clipping_threshold.reshape((-1, 1))
+    if np.ndim(fraction_to_clip) > 0:
+        # It is the same linear interpolation of order statistics as in `np.quantile`,
+        # but values are sorted once for all frames.
+        sorted_abs_sound = np.sort(abs_sound, axis=1)
+        ranks = (1 - fraction_to_clip) * (sound.shape[1] - 1)
+        lower_ranks = np.floor(ranks).astype(int)
+        upper_ranks = np.minimum(lower_ranks + 1, sound.shape[1] - 1)
+        lower_values = sorted_abs_sound[:, lower_ranks]
+        upper_values = sorted_abs_sound[:, upper_ranks]
+        clipping_threshold = lower_values + (ranks - lower_ranks) * (upper_values - lower_values)
+    else:
+        clipping_threshold = np.quantile(abs_sound, 1 - fraction_to_clip, axis=1)
+        clipping_threshold = clipping_threshold.reshape((-1, 1))
     clipping_cond = abs_sound >= clipping_threshold
     distorted_sound = sound - strength * sound**3 / clipping_threshold**2
     clipped_sound = np.sign(sound) * (1 - strength) * clipping_threshold
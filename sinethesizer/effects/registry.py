@@ -5,22 +5,27 @@ Author: Nikolay Lysenko.
 """
 
 
-from typing import Callable
+from functools import lru_cache
+from typing import Any, Callable, Optional
 
 import numpy as np
 
 from sinethesizer.effects.amplitude import (
     apply_amplitude_normalization, apply_compressor, apply_envelope_shaper
 )
-from sinethesizer.effects.automation import apply_automated_effect
-from sinethesizer.effects.chorus import apply_chorus
+from sinethesizer.effects.automation import apply_automated_effect, compute_automated_effect_tail
+from sinethesizer.effects.chorus import apply_chorus, compute_chorus_tail
 from sinethesizer.effects.equalizer import apply_equalizer
 from sinethesizer.effects.filter import apply_frequency_filter
 from sinethesizer.effects.filter_sweep import apply_filter_sweep, apply_phaser
 from sinethesizer.effects.overdrive import apply_overdrive
-from sinethesizer.effects.reverb import apply_artificial_reverb, apply_room_reverb
+from sinethesizer.effects.reverb import (
+    apply_artificial_reverb, apply_room_reverb,
+    compute_artificial_reverb_tail, compute_room_reverb_tail
+)
 from sinethesizer.effects.stereo import (
-    apply_panning, apply_stereo_delay, apply_stereo_to_mono_conversion
+    apply_panning, apply_stereo_delay, apply_stereo_to_mono_conversion,
+    compute_stereo_delay_tail
 )
 from sinethesizer.effects.tremolo import apply_tremolo
 from sinethesizer.effects.vibrato import apply_vibrato
@@ -30,12 +35,16 @@ EFFECT_FN_TYPE = Callable[
     [np.ndarray, 'sinethesizer.synth.core.Event'],
     np.ndarray
 ]
+EFFECT_TAIL_FN_TYPE = Callable[..., int]
 
 
+@lru_cache(maxsize=1)
 def get_effects_registry() -> dict[str, EFFECT_FN_TYPE]:
     """
     Get mapping from effect names to functions that apply effects.
 
+    The registry is built once and is shared between calls, so it must not be modified.
+
     :return:
         registry of effects
     """
@@ -59,3 +68,79 @@ def get_effects_registry() -> dict[str, EFFECT_FN_TYPE]:
         'vibrato': apply_vibrato,
     }
     return registry
+
+
+@lru_cache(maxsize=1)
+def get_effects_tails_registry() -> dict[str, EFFECT_TAIL_FN_TYPE]:
+    """
+    Get mapping from names of effects that prolong sound to functions computing prolongation.
+
+    Each tail function takes an event and parameters of the corresponding effect and returns
+    number of frames that the effect adds to the end of a sound. Effects that are absent in
+    this registry do not change duration of sound. The registry is built once and is shared
+    between calls, so it must not be modified.
+
+    :return:
+        registry of tail functions
+    """
+    registry = {
+        'artificial_reverb': compute_artificial_reverb_tail,
+        'automation': compute_automated_effect_tail,
+        'chorus': compute_chorus_tail,
+        'room_reverb': compute_room_reverb_tail,
+        'stereo_delay': compute_stereo_delay_tail,
+    }
+    return registry
+
+
+@lru_cache(maxsize=1)
+def get_effects_names_registry() -> dict[EFFECT_FN_TYPE, str]:
+    """
+    Get mapping from functions that apply effects to effect names.
+
+    The registry is built once and is shared between calls, so it must not be modified.
+
+    :return:
+        inverted registry of effects
+    """
+    return {fn: name for name, fn in get_effects_registry().items()}
+
+
+def get_effect_name_and_params(
+        effect_fn: EFFECT_FN_TYPE
+) -> tuple[Optional[str], dict[str, Any]]:
+    """
+    Find name and parameters of an effect from its function with frozen parameters.
+
+    :param effect_fn:
+        effect function with all parameters except sound and event set
+        (as it is done by `sinethesizer.io.load_presets.create_list_of_effect_fns`)
+    :return:
+        name of the effect (or `None` if it is not found in the registry of effects)
+        and its parameters
+    """
+    effect_name = get_effects_names_registry().get(getattr(effect_fn, 'func', effect_fn))
+    effect_params = getattr(effect_fn, 'keywords', {})
+    return effect_name, effect_params
+
+
+def compute_effect_tail(
+        event: 'sinethesizer.synth.core.Event', effect_name: Optional[str],
+        effect_params: dict[str, Any]
+) -> int:
+    """
+    Compute number of frames that an effect adds to the end of a sound.
+
+    :param event:
+        parameters of sound event for which this function is called
+    :param effect_name:
+        name of the effect
+    :param effect_params:
+        parameters of the effect
+    :return:
+        number of extra frames
+    """
+    tail_fn = get_effects_tails_registry().get(effect_name)
+    if tail_fn is None:
+        return 0
+    return tail_fn(event, **effect_params)
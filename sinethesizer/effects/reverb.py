@@ -12,7 +12,10 @@ from functools import lru_cache
 from typing import Optional, Sequence
 
 import numpy as np
-from scipy.signal import convolve
+
+from sinethesizer.utils.convolution import convolve
+from sinethesizer.utils.ir_store import load_or_generate
+from sinethesizer.utils.misc import EFFECTS_RANDOM_STATE
 
 
 def validate_inputs(
@@ -224,7 +227,8 @@ def apply_artificial_reverb(
         fraction of amplitude of reverberations sum that is kept in resulting sound
     :param random_seeds:
         seeds for pseudo-random number generator; one is used for the left channel and another one
-        is used for the right channel
+        is used for the right channel; missing seeds are drawn from generator of the sound
+        (if the sound is synthesized with it), so the track is reproducible if it has a seed
     :param keep_peak_amplitude:
         if it is set to `True`, processed sound is rescaled to maintain its original peak amplitude
         which is usually changed due to wave interference
@@ -235,28 +239,65 @@ def apply_artificial_reverb(
         decay_duration, n_early_reflections, early_reflections_delay,
         diffusion_delay_factor
     )
-    left_ir = generate_artificial_impulse_response(
-        event, first_reflection_delay, decay_duration, amplitude_random_range,
-        n_early_reflections, early_reflections_delay, diffusion_delay_factor,
-        diffusion_delay_random_range, late_reflections_decay_power,
-        original_sound_gain, reverberations_gain, random_seeds[0]
-    )
-    right_ir = generate_artificial_impulse_response(
-        event, first_reflection_delay, decay_duration, amplitude_random_range,
+    ir_params = (
+        first_reflection_delay, decay_duration, amplitude_random_range,
         n_early_reflections, early_reflections_delay, diffusion_delay_factor,
         diffusion_delay_random_range, late_reflections_decay_power,
-        original_sound_gain, reverberations_gain, random_seeds[1]
+        original_sound_gain, reverberations_gain
     )
+
+    def generate_impulse_response() -> np.ndarray:
+        return np.vstack([
+            generate_artificial_impulse_response(event, *ir_params, random_seed)
+            for random_seed in random_seeds
+        ])
+
+    # Impulse responses with random reflections are not going to be reused.
+    is_reusable = all(random_seed is not None for random_seed in random_seeds)
+    random_generator = EFFECTS_RANDOM_STATE['generator']
+    if not is_reusable and random_generator is not None:
+        random_seeds = [
+            random_seed if random_seed is not None else int(random_generator.integers(2 ** 32))
+            for random_seed in random_seeds
+        ]
+    if is_reusable:
+        key = ('artificial_reverb', event.frame_rate, *ir_params, *random_seeds)
+        impulse_response = load_or_generate(key, generate_impulse_response)
+    else:
+        key = None
+        impulse_response = generate_impulse_response()
     original_peak_amplitude = np.max(np.abs(sound))
-    sound = np.vstack((
-        convolve(sound[0, :], left_ir),
-        convolve(sound[1, :], right_ir)
-    ))
+    sound = convolve(
+        sound, impulse_response, cache_kernel_spectrum=is_reusable, kernel_key=key
+    )
     if keep_peak_amplitude:
         sound = original_peak_amplitude / np.max(np.abs(sound)) * sound
     return sound
 
 
+def compute_artificial_reverb_tail(
+        event: 'sinethesizer.synth.core.Event',
+        first_reflection_delay: float = 0.1, decay_duration: float = 1.5,
+        **kwargs
+) -> int:
+    """
+    Compute number of frames that are added to a sound by `apply_artificial_reverb` function.
+
+    :param event:
+        parameters of sound event for which this function is called
+    :param first_reflection_delay:
+        time (in seconds) between original sound and its first reflection
+    :param decay_duration:
+        total time (in seconds) since the first reflection until the last one
+    :return:
+        number of extra frames
+    """
+    _ = kwargs  # Other parameters do not affect duration of impulse response.
+    ir_duration_in_seconds = first_reflection_delay + decay_duration
+    ir_duration_in_frames = math.ceil(event.frame_rate * ir_duration_in_seconds)
+    return ir_duration_in_frames - 1
+
+
 class Room:
     """
     Room where reverberations happen.
@@ -473,6 +514,40 @@ def generate_tiling(
     return tiling
 
 
+def generate_reflected_locations(
+        room: Room, listener: Listener, n_reflections: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generate locations of listener within all reflected rooms at once.
+
+    This function returns the same rooms as `generate_tiling` function, but as arrays
+    (not as nested dictionaries), so all reflected rooms can be processed by vectorized
+    operations.
+
+    :param room:
+        room where reverberations happen
+    :param listener:
+        listener within a room
+    :param n_reflections:
+        number of reflections to be analysed
+    :return:
+        array of shape (n_rooms, 3) where each row is a triple of reflection counts (as keys
+        of nested dictionaries returned by `generate_tiling`) and array of shape (n_rooms, 3)
+        where each row is location of listener within the corresponding reflected room
+    """
+    n_dimensions = len(room.dimensions)
+    counts = np.arange(-n_reflections, n_reflections + 1)
+    moves = np.stack(np.meshgrid(*[counts] * n_dimensions, indexing='ij'), axis=-1)
+    moves = moves.reshape((-1, n_dimensions))
+    moves = moves[np.sum(np.abs(moves), axis=1) <= n_reflections]
+    # A room that is reflected `m` times over walls orthogonal to an axis is shifted by
+    # `m` room sizes along this axis and, if `m` is odd, it is mirrored.
+    is_mirrored = moves % 2 == 1
+    locations = np.where(is_mirrored, room.dimensions - listener.location, listener.location)
+    locations = locations + moves * room.dimensions
+    return moves, locations
+
+
 @lru_cache(maxsize=100)
 def generate_room_impulse_response(
         room: Room, listener: Listener, sound_source: SoundSource,
@@ -481,6 +556,9 @@ def generate_room_impulse_response(
     """
     Generate room impulse response.
 
+    Each reflected room contributes a single impulse, and all impulses are computed
+    by vectorized operations over arrays of reflected rooms.
+
     :param room:
         room where reverberations happen
     :param listener:
@@ -497,51 +575,47 @@ def generate_room_impulse_response(
     straight_distance = np.linalg.norm(sound_source.location - listener.location)
     unit_sound_source_direction = sound_source.direction / np.linalg.norm(sound_source.direction)
 
-    impulse_response_data = []
-    tiling = generate_tiling(room, listener, n_reflections)
-    for level_n_reflections, level in tiling.items():
-        reflection_decay_factor = room.reflection_decay_factor ** level_n_reflections
-        for move, location in level.items():
-            trajectory = location - sound_source.location
-            distance = np.linalg.norm(trajectory)
-            unit_trajectory = trajectory / distance
-            cosine = np.dot(unit_sound_source_direction, unit_trajectory)
-            cosine = np.clip(cosine, -1, 1)  # Prevent issues with numeric overflow.
-            angle = math.acos(cosine)
-            if angle > sound_source.angle:
-                continue  # No sound waves are emitted towards `location`.
-
-            delay = (distance - straight_distance) / room.sound_speed
-
-            distance_decay_factor = straight_distance / distance
-            decay_factor = reflection_decay_factor * distance_decay_factor
-
-            reflections_orientation = (-np.ones_like(listener.direction)) ** np.array(np.abs(move))
-            listener_direction = listener.direction * reflections_orientation
-            unit_listener_direction = listener_direction / np.linalg.norm(listener_direction)
-            projected_trajectory = np.append(trajectory[:-1], 0)
-            unit_projected_trajectory = projected_trajectory / np.linalg.norm(projected_trajectory)
-            sine = np.cross(unit_listener_direction, unit_projected_trajectory)[-1]
-            sine = np.clip(sine, -1, 1)
-            angle = math.asin(sine)
-            rescaled_angle = 0.5 * (angle + math.pi / 2)
-            left_value = decay_factor * math.cos(rescaled_angle)
-            right_value = decay_factor * math.sin(rescaled_angle)
-            if move[-1] % 2 == 1:  # If listener is located upwards down, swap channels.
-                left_value, right_value = right_value, left_value
-
-            impulse_response_data.append({'delay': delay, 'values': (left_value, right_value)})
-
-    max_delay = max(x['delay'] for x in impulse_response_data)
-    ir_duration_in_frames = int(round(frame_rate * max_delay)) + 1
-    impulse_response = np.zeros((2, ir_duration_in_frames))
-    for record in impulse_response_data:
-        index = min(
-            int(round(frame_rate * record['delay'])),
-            ir_duration_in_frames - 1
-        )
-        impulse_response[0, index] += record['values'][0]
-        impulse_response[1, index] += record['values'][1]
+    moves, locations = generate_reflected_locations(room, listener, n_reflections)
+    trajectories = locations - sound_source.location
+    distances = np.linalg.norm(trajectories, axis=1)
+    cosines = trajectories @ unit_sound_source_direction / distances
+    cosines = np.clip(cosines, -1, 1)  # Prevent issues with numeric overflow.
+    is_reached = np.arccos(cosines) <= sound_source.angle  # Sound is emitted within the angle.
+    moves = moves[is_reached]
+    trajectories = trajectories[is_reached]
+    distances = distances[is_reached]
+
+    delays = (distances - straight_distance) / room.sound_speed
+
+    reflection_decay_factors = room.reflection_decay_factor ** np.sum(np.abs(moves), axis=1)
+    distance_decay_factors = straight_distance / distances
+    decay_factors = reflection_decay_factors * distance_decay_factors
+
+    reflections_orientations = (-1) ** np.abs(moves[:, :2])
+    listener_directions = listener.direction[:2] * reflections_orientations
+    unit_listener_directions = (
+        listener_directions / np.linalg.norm(listener_directions, axis=1, keepdims=True)
+    )
+    projected_trajectories = trajectories[:, :2]
+    unit_projected_trajectories = (
+        projected_trajectories / np.linalg.norm(projected_trajectories, axis=1, keepdims=True)
+    )
+    sines = (
+        unit_listener_directions[:, 0] * unit_projected_trajectories[:, 1]
+        - unit_listener_directions[:, 1] * unit_projected_trajectories[:, 0]
+    )
+    sines = np.clip(sines, -1, 1)
+    rescaled_angles = 0.5 * (np.arcsin(sines) + np.pi / 2)
+    values = decay_factors * np.vstack((np.cos(rescaled_angles), np.sin(rescaled_angles)))
+    is_upside_down = moves[:, -1] % 2 == 1
+    values[:, is_upside_down] = values[::-1, is_upside_down]  # Swap channels for such rooms.
+
+    indices = np.rint(frame_rate * delays).astype(int)
+    ir_duration_in_frames = np.max(indices) + 1
+    impulse_response = np.vstack([
+        np.bincount(indices, weights=channel_values, minlength=ir_duration_in_frames)
+        for channel_values in values
+    ])
     return impulse_response
 
 
@@ -626,24 +700,43 @@ def apply_room_reverb(
     )
     sound_source = SoundSource(sound_source_location, sound_source_direction, angle)
 
-    impulse_response = generate_room_impulse_response(
-        room, listener, sound_source, n_reflections, event.frame_rate
+    key = (
+        'room_reverb', event.frame_rate, room_dimensions, reflection_decay_factor, sound_speed,
+        listener_location, listener_direction,
+        sound_source_location, sound_source_direction, angle, n_reflections
+    )
+    impulse_response = load_or_generate(
+        key,
+        lambda: generate_room_impulse_response(
+            room, listener, sound_source, n_reflections, event.frame_rate
+        )
     )
 
-    if (sound[0, :] == sound[1, :]).all():
-        sound = np.vstack((
-            convolve(sound[0, :], impulse_response[0, :]),
-            convolve(sound[1, :], impulse_response[1, :])
-        ))
+    # Both channels of original sound reach both ears, so each channel of result
+    # is a half of sum of channels convolved with impulse response for the corresponding ear.
+    # Due to linearity of convolution, channels can be summed before it.
+    if sound.shape[0] == 1 or (sound[0, :] == sound[1, :]).all():
+        mono_sound = sound[:1, :]
     else:
-        sound = 0.5 * (
-            np.vstack((
-                convolve(sound[0, :], impulse_response[0, :]),
-                convolve(sound[0, :], impulse_response[1, :])
-            ))
-            + np.vstack((
-                convolve(sound[1, :], impulse_response[0, :]),
-                convolve(sound[1, :], impulse_response[1, :])
-            ))
-        )
+        mono_sound = 0.5 * (sound[:1, :] + sound[1:, :])
+    sound = convolve(mono_sound, impulse_response, kernel_key=key)
     return sound
+
+
+def compute_room_reverb_tail(event: 'sinethesizer.synth.core.Event', **kwargs) -> int:
+    """
+    Compute number of frames that are added to a sound by `apply_room_reverb` function.
+
+    Duration of room impulse response depends on all geometric parameters, so a single frame is
+    reverberated here. Impulse responses are cached, so this is cheap.
+
+    :param event:
+        parameters of sound event for which this function is called
+    :param kwargs:
+        parameters of `apply_room_reverb` function
+    :return:
+        number of extra frames
+    """
+    single_frame = np.zeros((2, 1))
+    reverberated_frame = apply_room_reverb(single_frame, event, **kwargs)
+    return reverberated_frame.shape[1] - 1
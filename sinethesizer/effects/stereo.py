@@ -8,13 +8,17 @@ Author: Nikolay Lysenko
 
 
 from math import ceil
+from typing import Union
 
 import numpy as np
 
+from sinethesizer.utils.misc import convert_to_stereo
+
 
 def apply_panning(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
-        left_amplitude_ratio: float, right_amplitude_ratio: float
+        left_amplitude_ratio: Union[float, np.ndarray],
+        right_amplitude_ratio: Union[float, np.ndarray]
 ) -> np.ndarray:
     """
     Modify amplitudes of two channels independently.
@@ -25,14 +29,18 @@ def apply_panning(
         an argument that is not used by this function;
         it is added, because all effect functions must have it
     :param left_amplitude_ratio:
-        ratio of new amplitude of left channel to its initial amplitude
+        ratio of new amplitude of left channel to its initial amplitude;
+        it can be an array with a ratio for each frame
     :param right_amplitude_ratio:
-        ratio of new amplitude of right channel to its initial amplitude
+        ratio of new amplitude of right channel to its initial amplitude;
+        it can be an array with a ratio for each frame
     :return:
         sound with changed channel amplitudes
     """
     _ = event  # This argument is ignored.
-    sound *= np.array([[left_amplitude_ratio], [right_amplitude_ratio]])
+    sound = convert_to_stereo(sound)
+    sound[0] *= left_amplitude_ratio
+    sound[1] *= right_amplitude_ratio
     return sound
 
 
@@ -52,7 +60,8 @@ def apply_stereo_delay(
     :return:
         sound with delay between channels
     """
-    silence = np.zeros(ceil(abs(delay) * event.frame_rate))
+    sound = convert_to_stereo(sound)
+    silence = np.zeros(ceil(abs(delay) * event.frame_rate), dtype=sound.dtype)
     if delay >= 0:
         result = np.vstack((
             np.hstack((silence, sound[0])),
@@ -66,6 +75,20 @@ def apply_stereo_delay(
     return result
 
 
+def compute_stereo_delay_tail(event: 'sinethesizer.synth.core.Event', delay: float) -> int:
+    """
+    Compute number of frames that are added to a sound by `apply_stereo_delay` function.
+
+    :param event:
+        parameters of sound event for which this function is called
+    :param delay:
+        delay between channels (in seconds)
+    :return:
+        number of extra frames
+    """
+    return ceil(abs(delay) * event.frame_rate)
+
+
 def apply_stereo_to_mono_conversion(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event'
 ) -> np.ndarray:
@@ -78,9 +101,11 @@ def apply_stereo_to_mono_conversion(
         an argument that is not used by this function;
         it is added, because all effect functions must have it
     :return:
-        sound with identical channels
+        sound with identical channels (mono sound is returned as is)
     """
     _ = event  # This argument is ignored.
+    if sound.shape[0] == 1:
+        return sound
     sound = np.mean(sound, axis=0)
     sound = np.tile(sound, (2, 1))
     return sound
@@ -7,6 +7,8 @@ Author: Nikolay Lysenko
 """
 
 
+from typing import Union
+
 import numpy as np
 
 from sinethesizer.oscillators import generate_mono_wave
@@ -15,8 +17,8 @@ from sinethesizer.utils.misc import mix_with_original_sound
 
 def apply_absolute_tremolo(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
-        frequency: float = 6, amplitude: float = 0.5, phase: float = 0.0,
-        waveform: str = 'sine'
+        frequency: Union[float, np.ndarray] = 6, amplitude: Union[float, np.ndarray] = 0.5,
+        phase: float = 0.0, waveform: str = 'sine'
 ) -> np.ndarray:
     """
     Make sound volume vibrating with frequency defined in Hz.
@@ -26,9 +28,11 @@ def apply_absolute_tremolo(
     :param event:
         parameters of sound event for which this function is called
     :param frequency:
-        frequency of volume oscillations (in Hz)
+        frequency of volume oscillations (in Hz);
+        it can be an array with a frequency for each frame
     :param amplitude:
-        relative amplitude of volume oscillations, must be between 0 and 1
+        relative amplitude of volume oscillations, must be between 0 and 1;
+        it can be an array with an amplitude for each frame
     :param phase:
         phase shift of volume oscillations (in radians)
     :param waveform:
@@ -36,11 +40,18 @@ def apply_absolute_tremolo(
     :return:
         sound with vibrating volume
     """
-    if not (0 < amplitude <= 1):
+    if not np.all((0 < amplitude) & (amplitude <= 1)):
         raise ValueError("Amplitude for tremolo must be between 0 and 1.")
     amplitude_envelope = amplitude * np.ones(sound.shape[1])
+    phase_modulator = None
+    if np.ndim(frequency) > 0:
+        # Deviations of frequency from its initial value are integrated into phase.
+        deviations = frequency - frequency[0]
+        phase_modulator = 2 * np.pi * np.cumsum(deviations) / event.frame_rate
+        frequency = frequency[0]
     volume_wave = generate_mono_wave(
-        waveform, frequency, amplitude_envelope, event.frame_rate, phase
+        waveform, frequency, amplitude_envelope, event.frame_rate, phase,
+        phase_modulator=phase_modulator
     )
     volume_wave += 1
     sound *= volume_wave
@@ -49,8 +60,8 @@ def apply_absolute_tremolo(
 
 def apply_relative_tremolo(
         sound: np.ndarray, event: 'sinethesizer.synth.core.Event',
-        frequency_ratio: float = 0.02, amplitude: float = 0.5, phase: float = 0.0,
-        waveform: str = 'sine'
+        frequency_ratio: Union[float, np.ndarray] = 0.02,
+        amplitude: Union[float, np.ndarray] = 0.5, phase: float = 0.0, waveform: str = 'sine'
 ) -> np.ndarray:
     """
     Make sound volume vibrating with frequency depending on that of the sound.
@@ -61,9 +72,10 @@ def apply_relative_tremolo(
         parameters of sound event for which this function is called
     :param frequency_ratio:
         frequency of volume oscillations as ratio to fundamental frequency
-        of the sound
+        of the sound; it can be an array with a ratio for each frame
     :param amplitude:
-        relative amplitude of volume oscillations, must be between 0 and 1
+        relative amplitude of volume oscillations, must be between 0 and 1;
+        it can be an array with an amplitude for each frame
     :param phase:
         phase shift of volume oscillations (in radians)
     :param waveform:
@@ -60,7 +60,8 @@ def apply_absolute_vibrato(
     lower_indices = np.clip(lower_indices, 0, sound.shape[1] - 1)
     lower_sound = sound[:, lower_indices]
 
-    weights = time_indices - lower_indices
+    dtype = np.result_type(sound.dtype, np.float32)
+    weights = (time_indices - lower_indices).astype(dtype, copy=False)
     sound = weights * upper_sound + (1 - weights) * lower_sound
     return sound
 
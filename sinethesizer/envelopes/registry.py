@@ -5,6 +5,7 @@ Author: Nikolay Lysenko
 """
 
 
+from functools import lru_cache
 from typing import Callable
 
 import numpy as np
@@ -21,10 +22,13 @@ from sinethesizer.envelopes.user_defined import create_user_defined_envelope
 ENVELOPE_FN_TYPE = Callable[['sinethesizer.synth.core.Event'], np.ndarray]
 
 
+@lru_cache(maxsize=1)
 def get_envelopes_registry() -> dict[str, ENVELOPE_FN_TYPE]:
     """
     Get mapping from envelope names to functions that create them.
 
+    The registry is built once and is shared between calls, so it must not be modified.
+
     :return:
         registry of envelopes
     """
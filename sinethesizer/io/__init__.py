@@ -5,14 +5,17 @@ Author: Nikolay Lysenko
 """
 
 
-from . import events_to_wav, load_presets, midi_to_events, tsv_to_events
-from .events_to_wav import convert_events_to_timeline, write_timeline_to_wav
+from . import buses, events_to_wav, load_presets, midi_to_events, tsv_to_events
+from .events_to_wav import (
+    convert_events_to_timeline, write_events_to_wav_in_blocks, write_timeline_to_wav
+)
 from .load_presets import create_instruments_registry
 from .midi_to_events import convert_midi_to_events
 from .tsv_to_events import convert_tsv_to_events
 
 
 __all__ = [
+    'buses',
     'convert_events_to_timeline',
     'convert_midi_to_events',
     'convert_tsv_to_events',
@@ -21,5 +24,6 @@ __all__ = [
     'load_presets',
     'midi_to_events',
     'tsv_to_events',
+    'write_events_to_wav_in_blocks',
     'write_timeline_to_wav',
 ]
@@ -0,0 +1,131 @@
+"""
+Route sounds of events to mix buses and apply effects of buses.
+
+A mix bus (also known as send/return bus or auxiliary bus) sums sounds that are sent to it
+with specified levels. Effects of a bus are applied to this sum only once and then the result
+is added to the track. For linear time-invariant effects (like reverb), it is the same as
+applying them to each sound separately, but it is much faster.
+
+Author: Nikolay Lysenko
+"""
+
+
+import json
+from typing import Any, Optional
+
+import numpy as np
+
+from sinethesizer.effects import get_effects_registry
+from sinethesizer.synth.core import Event
+from sinethesizer.synth.profiling import profile_stage
+from sinethesizer.utils.misc import enable_effects_random_generator
+
+
+LINEAR_EFFECTS = ['artificial_reverb', 'equalizer', 'filter', 'room_reverb', 'stereo_delay']
+# Kinds of effects that depend on pitch or velocity of an event can not be used by buses.
+EFFECTS_WITH_KINDS = ['equalizer', 'filter']
+
+
+def validate_buses(
+        buses: dict[str, list[dict[str, Any]]],
+        instrument_to_sends: Optional[dict[str, dict[str, float]]]
+) -> None:
+    """
+    Check that effects of buses can be applied to sums of sounds and that sends are valid.
+
+    :param buses:
+        mapping from bus name to list of its effects parameters
+    :param instrument_to_sends:
+        mapping from instrument name to default levels of sends for its events
+    :return:
+        None
+    """
+    for bus_name, effects_data in buses.items():
+        for effect_data in effects_data:
+            effect_name = effect_data['name']
+            if effect_name not in LINEAR_EFFECTS:
+                raise ValueError(
+                    f"Effects of buses must be one of {LINEAR_EFFECTS}, "
+                    f"but found: {effect_name} (bus {bus_name})."
+                )
+            kind = effect_data.get('kind', 'absolute')
+            if effect_name in EFFECTS_WITH_KINDS and kind != 'absolute':
+                raise ValueError(
+                    f"Effects of buses must have absolute kind, but found: {kind} "
+                    f"(effect {effect_name}, bus {bus_name})."
+                )
+            if effect_data.get('keep_peak_amplitude', False):
+                raise ValueError(
+                    "Effects of buses can not keep peak amplitude, because such rescaling "
+                    f"is not linear (effect {effect_name}, bus {bus_name})."
+                )
+    for instrument_sends in (instrument_to_sends or {}).values():
+        for bus_name in instrument_sends:
+            if bus_name not in buses:
+                raise ValueError(f"Sound is sent to unknown bus: {bus_name}.")
+
+
+def get_sends(
+        event: Event, instrument_to_sends: Optional[dict[str, dict[str, float]]],
+        buses: dict[str, list[dict[str, Any]]]
+) -> dict[str, float]:
+    """
+    Get levels with which sound of an event is sent to buses.
+
+    :param event:
+        sound event
+    :param instrument_to_sends:
+        mapping from instrument name to default levels of sends for its events
+    :param buses:
+        mapping from bus name to list of its effects parameters
+    :return:
+        mapping from bus name to send level; event-level sends override instrument-level sends
+    """
+    sends = dict((instrument_to_sends or {}).get(event.instrument, {}))
+    if event.sends:
+        sends.update(json.loads(event.sends))
+    for bus_name in sends:
+        if bus_name not in buses:
+            raise ValueError(f"Sound is sent to unknown bus: {bus_name}.")
+    return sends
+
+
+def apply_bus_effects(
+        sound: np.ndarray, bus_name: str, effects_data: list[dict[str, Any]], frame_rate: int,
+        random_generator: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """
+    Apply effects of a bus to the sum of sounds sent to it.
+
+    :param sound:
+        sum of sounds sent to the bus
+    :param bus_name:
+        name of the bus
+    :param effects_data:
+        effects parameters
+    :param frame_rate:
+        number of frames per second
+    :param random_generator:
+        pseudo-random numbers generator for effects without explicit seeds
+    :return:
+        output sound of the bus
+    """
+    # Linear effects with absolute parameters use only frame rate of event.
+    event = Event(
+        instrument=f'bus:{bus_name}',
+        start_time=0,
+        duration=sound.shape[1] / frame_rate,
+        frequency=0,
+        velocity=1,
+        effects='',
+        frame_rate=frame_rate,
+        dtype=sound.dtype.name
+    )
+    effects_registry = get_effects_registry()
+    with enable_effects_random_generator(random_generator):
+        for effect_data in effects_data:
+            effect_name = effect_data['name']
+            params = {k: v for k, v in effect_data.items() if k != 'name'}
+            with profile_stage(event.instrument, f'bus_effect:{effect_name}'):
+                sound = effects_registry[effect_name](sound, event, **params)
+    return sound
@@ -5,17 +5,69 @@ Author: Nikolay Lysenko
 """
 
 
+import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from math import ceil
-from typing import Any
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, BinaryIO, Optional
 
 import numpy as np
-import scipy.io.wavfile
 
-from sinethesizer.synth.core import Event, Instrument, synthesize
+from sinethesizer.io.buses import apply_bus_effects, get_sends, validate_buses
+from sinethesizer.synth.cache import SYNTHESIS_FN_TYPE
+from sinethesizer.synth.core import (
+    Event, Instrument, compute_sound_duration_in_frames, synthesize
+)
+from sinethesizer.utils.ir_store import IR_STORE_STATE, ImpulseResponseStore
+
+
+# State of a process from the pool that is used for parallel rendering.
+WORKER_STATE = {}
+# Maximum number of events that are submitted to the pool, but not yet added to timeline,
+# per process; synthesized sounds of such events occupy shared memory.
+MAX_PENDING_EVENTS_PER_WORKER = 2
+# Size (in bytes) of WAV header written by `write_wav_header` function.
+WAV_HEADER_SIZE = 58
+# Mapping from name of sample format to WAV format tag (1 is PCM and 3 is IEEE float)
+# and to number of bytes per sample.
+SAMPLE_FORMATS = {
+    'float64': (3, 8),
+    'float32': (3, 4),
+    'int16': (1, 2),
+    'int24': (1, 3),
+}
+
+
+def plan_events(
+        events: list[Event], instruments_registry: dict[str, Instrument], frame_rate: int
+) -> list[tuple[int, int]]:
+    """
+    Find positions of events on timeline before synthesizing them.
+
+    :param events:
+        sound events
+    :param instruments_registry:
+        mapping from instrument name to its representation
+    :param frame_rate:
+        number of frames per second
+    :return:
+        list of pairs of start frame (inclusive) and end frame (exclusive) for each event;
+        end frames take into account release and tails of effects (e.g., reverb)
+    """
+    events_borders = []
+    for event in events:
+        start_frame = ceil(frame_rate * event.start_time)
+        n_frames = compute_sound_duration_in_frames(event, instruments_registry)
+        events_borders.append((start_frame, start_frame + n_frames))
+    return events_borders
 
 
 def create_empty_timeline(
-        events: list[Event], frame_rate: int, trailing_silence: float
+        events: list[Event], frame_rate: int, trailing_silence: float,
+        events_borders: Optional[list[tuple[int, int]]] = None, dtype: str = 'float64'
 ) -> np.ndarray:
     """
     Create empty timeline of air pressure.
@@ -26,20 +78,148 @@ def create_empty_timeline(
         number of frames per second
     :param trailing_silence:
         number of seconds with silence at the end of the timeline
+    :param events_borders:
+        start and end frames of synthesized events; if they are passed, the timeline is long
+        enough to store the events without extending it later
+    :param dtype:
+        data type of the timeline
     :return:
         empty timeline
     """
     max_event_time = max(event.start_time + event.duration for event in events)
     duration_in_seconds = max_event_time + trailing_silence
     duration_in_frames = ceil(frame_rate * duration_in_seconds)
-    mono_timeline = np.zeros(duration_in_frames)
-    timeline = np.vstack((mono_timeline, mono_timeline))
+    if events_borders:
+        duration_in_frames = max(duration_in_frames, max(end for _, end in events_borders))
+    timeline = np.zeros((2, duration_in_frames), dtype=dtype)
     return timeline
 
 
+def create_random_generator(
+        random_seed: Optional[int], event_index: int
+) -> np.random.Generator:
+    """
+    Create pseudo-random numbers generator for synthesis of an event.
+
+    Seed of the generator depends only on the global seed and the index of the event, so results
+    do not depend on the order in which events are synthesized and on the process where it
+    happens. Also, global states of `random` and `numpy.random` are not affected.
+
+    :param random_seed:
+        global seed for the whole track; if it is `None`, an unseeded generator is returned
+    :param event_index:
+        index of the event in the list of all events of the track
+    :return:
+        pseudo-random numbers generator
+    """
+    if random_seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([random_seed, event_index])
+
+
+def add_sound_to_timeline(
+        timeline: np.ndarray, sound: np.ndarray, start_time: float, frame_rate: int
+) -> np.ndarray:
+    """
+    Add synthesized sound to timeline.
+
+    :param timeline:
+        timeline of pressure deviations
+    :param sound:
+        sound to be added
+    :param start_time:
+        time (in seconds) when the sound starts
+    :param frame_rate:
+        number of frames per second
+    :return:
+        timeline with the sound added
+    """
+    start_frame = ceil(frame_rate * start_time)
+    end_frame = start_frame + sound.shape[1]
+    if end_frame > timeline.shape[1]:  # It happens only if an effect has unknown tail.
+        n_extra_frames = end_frame - timeline.shape[1]
+        dtype = np.result_type(timeline.dtype, sound.dtype)
+        padding = np.zeros((timeline.shape[0], n_extra_frames), dtype=dtype)
+        timeline = np.hstack((timeline, padding))
+    timeline[:, start_frame:end_frame] += sound
+    return timeline
+
+
+def send_sound_to_buses(
+        bus_timelines: dict[str, np.ndarray], sound: np.ndarray, event: Event,
+        settings: dict[str, Any]
+) -> dict[str, np.ndarray]:
+    """
+    Add synthesized sound to timelines of mix buses with levels of its sends.
+
+    :param bus_timelines:
+        mapping from bus name to timeline of sum of sounds sent to the bus
+    :param sound:
+        sound to be sent
+    :param event:
+        event for which `sound` has been produced
+    :param settings:
+        global settings for the output track
+    :return:
+        timelines of buses with the sound added
+    """
+    sends = get_sends(event, settings.get('instrument_to_sends'), settings.get('buses') or {})
+    for bus_name, level in sends.items():
+        bus_timelines[bus_name] = add_sound_to_timeline(
+            bus_timelines[bus_name], level * sound, event.start_time, settings['frame_rate']
+        )
+    return bus_timelines
+
+
+def add_buses_to_timeline(
+        timeline: np.ndarray, bus_timelines: dict[str, np.ndarray], settings: dict[str, Any],
+        random_generator: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """
+    Apply effects of mix buses and add their outputs to timeline.
+
+    :param timeline:
+        timeline of pressure deviations
+    :param bus_timelines:
+        mapping from bus name to timeline of sum of sounds sent to the bus
+    :param settings:
+        global settings for the output track
+    :param random_generator:
+        pseudo-random numbers generator for effects of buses
+    :return:
+        timeline with outputs of buses added
+    """
+    for bus_name, bus_timeline in bus_timelines.items():
+        if not np.any(bus_timeline):  # Nothing is sent to the bus.
+            continue
+        bus_sound = apply_bus_effects(
+            bus_timeline, bus_name, settings['buses'][bus_name], settings['frame_rate'],
+            random_generator
+        )
+        timeline = add_sound_to_timeline(timeline, bus_sound, 0, settings['frame_rate'])
+    return timeline
+
+
+def get_synthesis_fn(settings: dict[str, Any]) -> SYNTHESIS_FN_TYPE:
+    """
+    Get function that synthesizes events.
+
+    :param settings:
+        global settings for the output track
+    :return:
+        render cache if it is passed in settings, `synthesize` function else
+    """
+    render_cache = settings.get('render_cache')
+    if render_cache is None:
+        return synthesize
+    return render_cache
+
+
 def add_event_to_timeline(
         timeline: np.ndarray, event: Event,
-        instruments_registry: dict[str, Instrument], frame_rate: int
+        instruments_registry: dict[str, Instrument], frame_rate: int,
+        synthesis_fn: SYNTHESIS_FN_TYPE = synthesize,
+        random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Add sound event to timeline.
@@ -52,20 +232,144 @@ def add_event_to_timeline(
         mapping from instrument name to its representation
     :param frame_rate:
         number of frames per second
+    :param synthesis_fn:
+        function that synthesizes sound of the event (e.g., render cache)
+    :param random_generator:
+        pseudo-random numbers generator for synthesis of the event
     :return:
         timeline with sound event added
     """
-    sound = synthesize(event, instruments_registry)
-    start_frame = ceil(frame_rate * event.start_time)
-    end_frame = start_frame + sound.shape[1]
-    if end_frame > timeline.shape[1]:  # Effects like reverb may prolong event.
-        n_extra_frames = end_frame - timeline.shape[1]
-        padding = np.zeros((timeline.shape[0], n_extra_frames))
-        timeline = np.hstack((timeline, padding))
-    timeline[:, start_frame:end_frame] += sound
+    sound = synthesis_fn(event, instruments_registry, random_generator)
+    timeline = add_sound_to_timeline(timeline, sound, event.start_time, frame_rate)
     return timeline
 
 
+def initialize_worker(
+        instruments_registry: dict[str, Instrument], random_seed: Optional[int],
+        synthesis_fn: SYNTHESIS_FN_TYPE = synthesize,
+        ir_store: Optional[ImpulseResponseStore] = None
+) -> None:
+    """
+    Prepare a process from the pool to synthesize events.
+
+    This function is called once per process, so instruments registry is unpacked once per
+    process and not once per event.
+
+    :param instruments_registry:
+        mapping from instrument name to its representation
+    :param random_seed:
+        global seed for the whole track
+    :param synthesis_fn:
+        function that synthesizes events; if it is render cache, each process gets its own copy
+    :param ir_store:
+        store of impulse responses that is enabled in the main process (if any)
+    :return:
+        None
+    """
+    WORKER_STATE['instruments_registry'] = instruments_registry
+    WORKER_STATE['random_seed'] = random_seed
+    WORKER_STATE['synthesis_fn'] = synthesis_fn
+    IR_STORE_STATE['store'] = ir_store
+
+
+def synthesize_to_shared_memory(
+        indexed_event: tuple[int, Event]
+) -> tuple[str, tuple[int, ...], str]:
+    """
+    Synthesize an event within a process from the pool and put result to shared memory.
+
+    :param indexed_event:
+        index of an event and the event itself
+    :return:
+        name of shared memory block, shape of synthesized sound, and its data type
+    """
+    event_index, event = indexed_event
+    random_generator = create_random_generator(WORKER_STATE['random_seed'], event_index)
+    sound = WORKER_STATE['synthesis_fn'](
+        event, WORKER_STATE['instruments_registry'], random_generator
+    )
+    shared_memory = SharedMemory(create=True, size=max(sound.nbytes, 1))
+    buffer = np.ndarray(sound.shape, dtype=sound.dtype, buffer=shared_memory.buf)
+    buffer[:] = sound
+    del buffer  # Shared memory can not be closed while there are references to it.
+    shared_memory.close()
+    return shared_memory.name, sound.shape, sound.dtype.str
+
+
+def add_events_to_timeline_in_parallel(
+        timeline: np.ndarray, events: list[Event], settings: dict[str, Any],
+        bus_timelines: Optional[dict[str, np.ndarray]] = None
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Synthesize events with a pool of processes and add them to timeline.
+
+    Sounds are summed up in the order of events, so the result is the same as after sequential
+    synthesis. Only a few events per process are submitted ahead of summation, so shared memory
+    does not fill up if summation falls behind synthesis.
+
+    :param timeline:
+        timeline of pressure deviations
+    :param events:
+        sound events
+    :param settings:
+        global settings for the output track
+    :param bus_timelines:
+        mapping from bus name to timeline of sum of sounds sent to the bus
+    :return:
+        timeline with sound events added and timelines of buses with sent sounds added
+    """
+    bus_timelines = bus_timelines or {}
+    # Processes of the pool must share resource tracker with the main process,
+    # otherwise they try to release blocks of shared memory on their exit.
+    resource_tracker.ensure_running()
+    pool = ProcessPoolExecutor(
+        max_workers=settings['workers'],
+        initializer=initialize_worker,
+        initargs=(
+            settings['instruments_registry'],
+            settings.get('random_seed'),
+            get_synthesis_fn(settings),
+            IR_STORE_STATE['store']
+        )
+    )
+    max_pending_events = MAX_PENDING_EVENTS_PER_WORKER * settings['workers']
+    indexed_events = enumerate(events)
+    pending_results = deque()
+    with pool:
+        try:
+            for indexed_event in islice(indexed_events, max_pending_events):
+                pending_results.append(pool.submit(synthesize_to_shared_memory, indexed_event))
+            for event in events:
+                name, shape, dtype = pending_results.popleft().result()
+                for indexed_event in islice(indexed_events, 1):
+                    pending_results.append(
+                        pool.submit(synthesize_to_shared_memory, indexed_event)
+                    )
+                shared_memory = SharedMemory(name=name)
+                try:
+                    sound = np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)
+                    timeline = add_sound_to_timeline(
+                        timeline, sound, event.start_time, settings['frame_rate']
+                    )
+                    if bus_timelines or event.sends:
+                        bus_timelines = send_sound_to_buses(bus_timelines, sound, event, settings)
+                    del sound
+                    shared_memory.close()
+                finally:
+                    shared_memory.unlink()
+        finally:
+            # If rendering fails, sounds that are already synthesized must not stay
+            # in shared memory until the end of the main process.
+            for future in pending_results:
+                future.cancel()
+            for future in pending_results:
+                if not future.cancelled() and future.exception() is None:
+                    shared_memory = SharedMemory(name=future.result()[0])
+                    shared_memory.close()
+                    shared_memory.unlink()
+    return timeline, bus_timelines
+
+
 def convert_events_to_timeline(events: list[Event], settings: dict[str, Any]) -> np.ndarray:
     """
     Convert events to array with pressure deviations timeline.
@@ -77,17 +381,68 @@ def convert_events_to_timeline(events: list[Event], settings: dict[str, Any]) ->
     :return:
         pressure deviations timeline
     """
-    timeline = create_empty_timeline(events, settings['frame_rate'], settings['trailing_silence'])
-    for event in events:
-        timeline = add_event_to_timeline(
-            timeline, event, settings['instruments_registry'], settings['frame_rate']
+    events_borders = plan_events(events, settings['instruments_registry'], settings['frame_rate'])
+    timeline = create_empty_timeline(
+        events, settings['frame_rate'], settings['trailing_silence'], events_borders,
+        settings.get('dtype', 'float64')
+    )
+    buses = settings.get('buses') or {}
+    validate_buses(buses, settings.get('instrument_to_sends'))
+    bus_timelines = {bus_name: np.zeros_like(timeline) for bus_name in buses}
+    if settings.get('workers', 1) > 1:
+        timeline, bus_timelines = add_events_to_timeline_in_parallel(
+            timeline, events, settings, bus_timelines
         )
+    else:
+        synthesis_fn = get_synthesis_fn(settings)
+        for event_index, event in enumerate(events):
+            random_generator = create_random_generator(settings.get('random_seed'), event_index)
+            sound = synthesis_fn(event, settings['instruments_registry'], random_generator)
+            timeline = add_sound_to_timeline(
+                timeline, sound, event.start_time, settings['frame_rate']
+            )
+            if bus_timelines or event.sends:
+                bus_timelines = send_sound_to_buses(bus_timelines, sound, event, settings)
+    # Effects of buses get a generator as if they were an event after the last one.
+    random_generator = create_random_generator(settings.get('random_seed'), len(events))
+    timeline = add_buses_to_timeline(timeline, bus_timelines, settings, random_generator)
     if settings.get('peak_amplitude') is not None:
         timeline /= (np.max(np.abs(timeline)) / settings['peak_amplitude'])
     return timeline
 
 
-def write_timeline_to_wav(output_path: str, timeline: np.ndarray, frame_rate: int) -> None:
+def convert_to_sample_format(values: np.ndarray, sample_format: str) -> bytes:
+    """
+    Convert sound values to bytes of WAV data chunk.
+
+    :param values:
+        sound values with channels in columns
+    :param sample_format:
+        one of 'float64', 'float32', 'int16', and 'int24'; integer formats clip values
+        to the range from -1 to 1
+    :return:
+        little-endian samples with interleaved channels
+    """
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(
+            f"Sample format must be one of {list(SAMPLE_FORMATS)}, but found: {sample_format}."
+        )
+    format_tag, bytes_per_sample = SAMPLE_FORMATS[sample_format]
+    if format_tag == 3:
+        return values.astype(f'<f{bytes_per_sample}').tobytes()
+    max_value = 2 ** (8 * bytes_per_sample - 1) - 1
+    samples = np.round(np.clip(values, -1, 1) * max_value)
+    if bytes_per_sample == 2:
+        return samples.astype('<i2').tobytes()
+    # There is no 24-bit integer data type, so the lowest three bytes of 32-bit integers are kept.
+    samples = samples.astype('<i4').reshape(-1).view(np.uint8).reshape((-1, 4))
+    return samples[:, :bytes_per_sample].tobytes()
+
+
+def write_timeline_to_wav(
+        output_path: str, timeline: np.ndarray, frame_rate: int,
+        sample_format: Optional[str] = None
+) -> None:
     """
     Write pressure deviations timeline to WAV file.
 
@@ -97,7 +452,176 @@ def write_timeline_to_wav(output_path: str, timeline: np.ndarray, frame_rate: in
         sound represented as pressure deviations timeline
     :param frame_rate:
         number of frames per second
+    :param sample_format:
+        one of 'float64', 'float32', 'int16', and 'int24';
+        by default, 32-bit floats are used for timeline of 32-bit floats
+        and 64-bit floats are used else
+    :return:
+        None
+    """
+    sample_format = sample_format or ('float32' if timeline.dtype == np.float32 else 'float64')
+    with open(output_path, 'wb') as wav_file:
+        write_wav_header(wav_file, frame_rate, timeline.shape[1], sample_format)
+        wav_file.write(convert_to_sample_format(timeline.T, sample_format))
+
+
+def write_wav_header(
+        wav_file: BinaryIO, frame_rate: int, n_frames: int, sample_format: str = 'float64'
+) -> None:
+    """
+    Write header of WAV file with two channels.
+
+    For 64-bit floats, the header is the same as the one written by `scipy.io.wavfile.write`.
+    Headers of all sample formats have the same size, so the header can be overwritten
+    when sample format of data is changed.
+
+    :param wav_file:
+        file opened in binary mode; header is written from its current position
+    :param frame_rate:
+        number of frames per second
+    :param n_frames:
+        number of frames in the file
+    :param sample_format:
+        one of 'float64', 'float32', 'int16', and 'int24'
+    :return:
+        None
+    """
+    n_channels = 2
+    format_tag, bytes_per_sample = SAMPLE_FORMATS[sample_format]
+    block_align = n_channels * bytes_per_sample
+    data_size = n_frames * block_align
+    riff_size = WAV_HEADER_SIZE - 8 + data_size
+    wav_file.write(b'RIFF' + struct.pack('<I', riff_size) + b'WAVE')
+    wav_file.write(b'fmt ' + struct.pack(
+        '<IHHIIHHH', 18, format_tag, n_channels, frame_rate,
+        frame_rate * block_align, block_align, 8 * bytes_per_sample, 0
+    ))
+    wav_file.write(b'fact' + struct.pack('<II', 4, n_frames))
+    wav_file.write(b'data' + struct.pack('<I', data_size))
+
+
+def normalize_wav_file(
+        output_path: str, frame_rate: int, n_frames: int, factor: float, block_size: int,
+        sample_format: str = 'float64'
+) -> None:
+    """
+    Divide all values from WAV file written by `write_events_to_wav_in_blocks` by a factor.
+
+    Values are read as 64-bit floats and are written back in the requested sample format.
+    Samples of all formats are not longer than 64-bit floats, so the file can be rewritten
+    in place: a block is always read before anything is written over it.
+
+    :param output_path:
+        path to WAV file with 64-bit floats
+    :param frame_rate:
+        number of frames per second
+    :param n_frames:
+        number of frames in the file
+    :param factor:
+        divisor
+    :param block_size:
+        number of frames that are processed at once
+    :param sample_format:
+        sample format of resulting file
+    :return:
+        None
+    """
+    values = np.memmap(
+        output_path, dtype='<f8', mode='r', offset=WAV_HEADER_SIZE, shape=(n_frames, 2)
+    )
+    with open(output_path, 'r+b') as wav_file:
+        wav_file.seek(WAV_HEADER_SIZE)
+        for start_frame in range(0, n_frames, block_size):
+            block = values[start_frame:start_frame + block_size] / factor
+            wav_file.write(convert_to_sample_format(block, sample_format))
+        del values  # File can not be truncated safely while it is mapped.
+        wav_file.truncate()
+        wav_file.seek(0)
+        write_wav_header(wav_file, frame_rate, n_frames, sample_format)
+
+
+def write_events_to_wav_in_blocks(
+        events: list[Event], settings: dict[str, Any], output_path: str
+) -> None:
+    """
+    Convert events to WAV file without storing the whole timeline in memory.
+
+    The timeline is processed in blocks of fixed size. Events are synthesized when their block
+    is reached and are kept only until all their frames (including tails of effects like reverb)
+    are written. So memory consumption depends on polyphony and duration of sounds, but not on
+    duration of the track. If amplitude normalization is requested, 64-bit floats are written
+    first and then they are rescaled and converted to the requested sample format by the second
+    pass over the resulting file.
+
+    :param events:
+        sound events
+    :param settings:
+        global settings for the output track
+    :param output_path:
+        path to resulting file
     :return:
         None
     """
-    scipy.io.wavfile.write(output_path, frame_rate, timeline.T)
+    if settings.get('buses'):
+        raise ValueError(
+            "Mix buses need the whole track in memory, so they can not be used "
+            "with block-wise rendering."
+        )
+    frame_rate = settings['frame_rate']
+    block_size = ceil(settings['block_duration'] * frame_rate)
+    events_borders = plan_events(events, settings['instruments_registry'], frame_rate)
+    max_event_time = max(event.start_time + event.duration for event in events)
+    n_frames = ceil(frame_rate * (max_event_time + settings['trailing_silence']))
+    n_frames = max(n_frames, max(end for _, end in events_borders))
+
+    dtype = settings.get('dtype', 'float64')
+    sample_format = settings.get('sample_format') or dtype
+    normalize = settings.get('peak_amplitude') is not None
+    written_format = 'float64' if normalize else sample_format
+
+    synthesis_fn = get_synthesis_fn(settings)
+    indices = sorted(range(len(events)), key=lambda i: events_borders[i][0])
+    next_position = 0
+    ringing_sounds = {}
+    max_abs_value = 0
+    block_start = 0
+    with open(output_path, 'wb') as wav_file:
+        write_wav_header(wav_file, frame_rate, n_frames, written_format)
+        while block_start < n_frames:
+            block_end = block_start + block_size
+            while next_position < len(indices):
+                event_index = indices[next_position]
+                start_frame = events_borders[event_index][0]
+                if start_frame >= block_end:
+                    break
+                random_generator = create_random_generator(
+                    settings.get('random_seed'), event_index
+                )
+                sound = synthesis_fn(
+                    events[event_index], settings['instruments_registry'], random_generator
+                )
+                ringing_sounds[event_index] = (start_frame, sound)
+                n_frames = max(n_frames, start_frame + sound.shape[1])
+                next_position += 1
+
+            block = np.zeros((2, min(block_end, n_frames) - block_start), dtype=dtype)
+            for event_index in sorted(ringing_sounds):  # Sum up in the original order.
+                start_frame, sound = ringing_sounds[event_index]
+                lower = max(start_frame, block_start)
+                upper = min(start_frame + sound.shape[1], block_end)
+                if lower < upper:
+                    block[:, lower - block_start:upper - block_start] += (
+                        sound[:, lower - start_frame:upper - start_frame]
+                    )
+                if upper >= start_frame + sound.shape[1]:
+                    del ringing_sounds[event_index]
+            max_abs_value = max(max_abs_value, np.max(np.abs(block), initial=0))
+            wav_file.write(convert_to_sample_format(block.T, written_format))
+            block_start = block_end
+
+        wav_file.seek(0)  # Duration might be changed by effects with unknown tails.
+        write_wav_header(wav_file, frame_rate, n_frames, written_format)
+
+    if normalize:
+        factor = max_abs_value / settings['peak_amplitude']
+        normalize_wav_file(output_path, frame_rate, n_frames, factor, block_size, sample_format)
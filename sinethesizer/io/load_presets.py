@@ -6,6 +6,8 @@ Author: Nikolay Lysenko
 
 
 import functools
+import hashlib
+import json
 import math
 import os
 import warnings
@@ -234,6 +236,19 @@ def convert_partials(partials_data: list[dict[str, Any]]) -> list[Partial]:
     return partials
 
 
+def compute_instrument_digest(instrument_data: dict[str, Any]) -> str:
+    """
+    Compute hash of instrument definition.
+
+    :param instrument_data:
+        parameters of instrument as dictionary
+    :return:
+        hexadecimal digest that changes if and only if the definition changes
+    """
+    serialized_data = json.dumps(instrument_data, sort_keys=True, default=str)
+    return hashlib.sha256(serialized_data.encode('utf-8')).hexdigest()
+
+
 def create_list_of_yaml_paths(input_path: str) -> list[str]:
     """
     Create list of paths to YAML files with presets.
@@ -269,9 +284,11 @@ def create_instruments_registry(input_path: str) -> dict[str, Any]:
         with open(file_path) as input_file:
             input_data = yaml.safe_load(input_file)
         for instrument_data in input_data:
+            digest = compute_instrument_digest(instrument_data)
             instruments_registry[instrument_data['name']] = Instrument(
                 partials=convert_partials(instrument_data['partials']),
                 amplitude_scaling=instrument_data['amplitude_scaling'],
-                effects=create_list_of_effect_fns(instrument_data.get('effects', []))
+                effects=create_list_of_effect_fns(instrument_data.get('effects', [])),
+                digest=digest
             )
     return instruments_registry
@@ -5,6 +5,7 @@ Author: Nikolay Lysenko
 """
 
 
+import json
 from typing import Any
 
 import pretty_midi
@@ -32,10 +33,12 @@ def convert_midi_to_events(
     if 'track_name_to_instrument' in midi_settings:
         instruments_mapping = midi_settings['track_name_to_instrument']
         effects_mapping = midi_settings.get('track_name_to_effects', {})
+        sends_mapping = midi_settings.get('track_name_to_sends', {})
         key_fn = lambda instrument: instrument.name
     elif 'program_to_instrument' in midi_settings:
         instruments_mapping = midi_settings['program_to_instrument']
         effects_mapping = midi_settings.get('program_to_effects', {})
+        sends_mapping = midi_settings.get('program_to_sends', {})
         key_fn = lambda instrument: instrument.program
     else:
         raise RuntimeError("MIDI config file lacks required sections.")
@@ -47,6 +50,7 @@ def convert_midi_to_events(
         sinethesizer_instrument = instruments_mapping.get(key)
         if sinethesizer_instrument is None:
             continue
+        sends = json.dumps(sends_mapping[key]) if key in sends_mapping else ''
         for note in pretty_midi_instrument.notes:
             event = Event(
                 instrument=sinethesizer_instrument,
@@ -55,7 +59,9 @@ def convert_midi_to_events(
                 frequency=pretty_midi.note_number_to_hz(note.pitch),
                 velocity=note.velocity / MAX_MIDI_VALUE,
                 effects=effects_mapping.get(key, ''),
-                frame_rate=settings['frame_rate']
+                frame_rate=settings['frame_rate'],
+                sends=sends,
+                dtype=settings.get('dtype', 'float64')
             )
             events.append(event)
     return events
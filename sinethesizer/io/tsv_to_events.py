@@ -69,10 +69,14 @@ def convert_tsv_to_events(
         'duration',
         'frequency',
         'velocity',
-        'effects'
+        'effects',
+        'sends'
     ]
     for raw_event in raw_events:
         raw_event = {k: v for k, v in raw_event.items() if k in fields_to_use}
-        event = Event(frame_rate=settings['frame_rate'], **raw_event)
+        event = Event(
+            frame_rate=settings['frame_rate'], dtype=settings.get('dtype', 'float64'),
+            **raw_event
+        )
         events.append(event)
     return events
@@ -16,6 +16,7 @@ from sinethesizer.oscillators.analog import (
 )
 from sinethesizer.oscillators.karplus_strong import generate_karplus_strong_wave
 from sinethesizer.oscillators.noise import generate_power_law_noise
+from sinethesizer.oscillators.wavetable import generate_wavetable_wave
 
 
 TWO_PI = 2 * np.pi
@@ -23,9 +24,72 @@ PLAIN_ANALOG_WAVEFORMS = ['sine', 'raw_sawtooth', 'raw_square', 'raw_triangle']
 DUTY_CYCLES = [0.1, 0.2, 0.3, 0.4]
 PULSE_WAVEFORMS = [f'pulse_{int(round(100 * duty_cycle))}' for duty_cycle in DUTY_CYCLES]
 BANDLIMITED_ANALOG_WAVEFORMS = ['sawtooth', 'square', 'triangle'] + PULSE_WAVEFORMS
-ANALOG_WAVEFORMS = PLAIN_ANALOG_WAVEFORMS + BANDLIMITED_ANALOG_WAVEFORMS
+WAVETABLE_WAVEFORMS = [f'wavetable_{waveform}' for waveform in BANDLIMITED_ANALOG_WAVEFORMS]
+ANALOG_WAVEFORMS = (
+    PLAIN_ANALOG_WAVEFORMS + BANDLIMITED_ANALOG_WAVEFORMS + WAVETABLE_WAVEFORMS
+)
 NOISES = ['white_noise', 'pink_noise', 'brown_noise']
-MODEL_BASED_WAVEFORMS = ['karplus_strong']
+MODEL_BASED_WAVEFORMS = ['karplus_strong', 'tuned_karplus_strong']
+
+NAME_TO_ANALOG_WAVEFORM_FN = {
+    'sine': np.sin,
+    'sawtooth': generate_sawtooth_wave,
+    'square': generate_pulse_wave,
+    'triangle': generate_triangle_wave,
+    'raw_sawtooth': scipy.signal.sawtooth,
+    'raw_square': scipy.signal.square,
+    'raw_triangle': partial(scipy.signal.sawtooth, width=0.5),
+    **{
+        name: partial(generate_pulse_wave, duty_cycle=duty_cycle)
+        for name, duty_cycle in zip(PULSE_WAVEFORMS, DUTY_CYCLES)
+    },
+    'wavetable_sawtooth': partial(generate_wavetable_wave, waveform='sawtooth'),
+    'wavetable_square': partial(generate_wavetable_wave, waveform='pulse'),
+    'wavetable_triangle': partial(generate_wavetable_wave, waveform='triangle'),
+    **{
+        f'wavetable_{name}': partial(
+            generate_wavetable_wave, waveform='pulse', duty_cycle=duty_cycle
+        )
+        for name, duty_cycle in zip(PULSE_WAVEFORMS, DUTY_CYCLES)
+    },
+}
+NAME_TO_MODEL_BASED_WAVEFORM_FN = {
+    'karplus_strong': generate_karplus_strong_wave,
+    'tuned_karplus_strong': partial(generate_karplus_strong_wave, tuned=True),
+}
+NAME_TO_NOISE_FN = {
+    'white_noise': partial(generate_power_law_noise, psd_decay_order=0),
+    'pink_noise': partial(generate_power_law_noise, psd_decay_order=1),
+    'brown_noise': partial(generate_power_law_noise, psd_decay_order=2),
+}
+
+# Mapping from frame rate to the longest requested time grid with this frame rate.
+TIME_GRIDS = {}
+# Maximum size (in bytes) of phase matrix that is evaluated at once by batched oscillators.
+PHASE_MATRIX_MAX_SIZE_IN_BYTES = 2 ** 25
+
+
+def get_time_grid(duration_in_frames: int, frame_rate: int) -> np.ndarray:
+    """
+    Get moments (in seconds) corresponding to frames.
+
+    Grids are cached and their read-only views are returned, so repeated calls are cheap.
+
+    :param duration_in_frames:
+        number of frames
+    :param frame_rate:
+        number of frames per second
+    :return:
+        array of moments such that its i-th element is `i / frame_rate`
+    """
+    time_grid = TIME_GRIDS.get(frame_rate)
+    if time_grid is None or len(time_grid) < duration_in_frames:
+        n_frames = 0 if time_grid is None else 2 * len(time_grid)  # Amortize regrowth.
+        n_frames = max(n_frames, duration_in_frames)
+        time_grid = np.arange(n_frames) / frame_rate
+        time_grid.setflags(write=False)
+        TIME_GRIDS[frame_rate] = time_grid
+    return time_grid[:duration_in_frames]
 
 
 def generate_analog_wave(
@@ -40,7 +104,9 @@ def generate_analog_wave(
         form of wave;
         it can be one of 'sine', 'sawtooth', 'square', 'triangle',
         'pulse_10', 'pulse_20', 'pulse_30', 'pulse_40',
-        'raw_sawtooth', 'raw_square', and 'raw_triangle'
+        'raw_sawtooth', 'raw_square', 'raw_triangle',
+        and all band-limited waveforms with prefix 'wavetable_'
+        (e.g., 'wavetable_sawtooth' or 'wavetable_pulse_10')
     :param frequency:
         frequency of wave (in Hz)
     :param duration_in_frames:
@@ -54,27 +120,13 @@ def generate_analog_wave(
     :return:
         wave with constant amplitude envelope
     """
-    name_to_waveform = {
-        'sine': np.sin,
-        'sawtooth': generate_sawtooth_wave,
-        'square': generate_pulse_wave,
-        'triangle': generate_triangle_wave,
-        'raw_sawtooth': scipy.signal.sawtooth,
-        'raw_square': scipy.signal.square,
-        'raw_triangle': partial(scipy.signal.sawtooth, width=0.5),
-    }
-    name_to_waveform_for_pulse_waves = {
-        name: partial(generate_pulse_wave, duty_cycle=duty_cycle)
-        for name, duty_cycle in zip(PULSE_WAVEFORMS, DUTY_CYCLES)
-    }
-    name_to_waveform.update(name_to_waveform_for_pulse_waves)
-    wave_fn = name_to_waveform[waveform]
+    wave_fn = NAME_TO_ANALOG_WAVEFORM_FN[waveform]
 
-    moments_in_seconds = np.arange(duration_in_frames) / frame_rate
-    if phase_modulator is None:
-        xs = TWO_PI * frequency * moments_in_seconds + phase
-    else:
-        xs = TWO_PI * frequency * moments_in_seconds + phase + phase_modulator
+    moments_in_seconds = get_time_grid(duration_in_frames, frame_rate)
+    xs = TWO_PI * frequency * moments_in_seconds
+    xs += phase
+    if phase_modulator is not None:
+        xs += phase_modulator
     if waveform in PLAIN_ANALOG_WAVEFORMS:
         return wave_fn(xs)
     else:
@@ -84,32 +136,32 @@ def generate_analog_wave(
 
 def generate_model_based_waveform(
         waveform: str, frequency: float, duration_in_frames: int,
-        frame_rate: int
+        frame_rate: int, random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Generate wave with constant amplitude envelope based on a simulation model.
 
     :param waveform:
-        form of wave; only 'karplus_strong' is supported now
+        form of wave; it can be one of 'karplus_strong' and 'tuned_karplus_strong'
     :param frequency:
         frequency of wave (in Hz)
     :param duration_in_frames:
         duration of output sound in frames
     :param frame_rate:
         number of frames per second
+    :param random_generator:
+        pseudo-random numbers generator
     :return:
         wave with constant amplitude envelope
     """
-    name_to_waveform = {
-        'karplus_strong': generate_karplus_strong_wave,
-    }
-    wave_fn = name_to_waveform[waveform]
-    wave = wave_fn(frequency, duration_in_frames, frame_rate)
+    wave_fn = NAME_TO_MODEL_BASED_WAVEFORM_FN[waveform]
+    wave = wave_fn(frequency, duration_in_frames, frame_rate, random_generator=random_generator)
     return wave
 
 
 def generate_noise(
-        waveform: str, duration_in_frames: int, frame_rate: int
+        waveform: str, duration_in_frames: int, frame_rate: int,
+        random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Generate noise with constant amplitude envelope.
@@ -120,26 +172,21 @@ def generate_noise(
         duration of output sound in frames
     :param frame_rate:
         number of frames per second
+    :param random_generator:
+        pseudo-random numbers generator
     :return:
         noise with constant amplitude envelope
     """
-    name_to_waveform = {
-        'white_noise': lambda n_frames: np.random.normal(0, 0.3, n_frames),
-        'pink_noise': partial(generate_power_law_noise, psd_decay_order=1),
-        'brown_noise': partial(generate_power_law_noise, psd_decay_order=2),
-    }
-    wave_fn = name_to_waveform[waveform]
-    if waveform == 'white_noise':
-        return wave_fn(duration_in_frames)
-    else:
-        return wave_fn(duration_in_frames, frame_rate)
+    wave_fn = NAME_TO_NOISE_FN[waveform]
+    return wave_fn(duration_in_frames, frame_rate, random_generator=random_generator)
 
 
 def generate_mono_wave(
         waveform: str, frequency: float, amplitude_envelope: np.ndarray,
         frame_rate: int, phase: float = 0,
         amplitude_modulator: Optional[np.ndarray] = None,
-        phase_modulator: Optional[np.ndarray] = None
+        phase_modulator: Optional[np.ndarray] = None,
+        random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Generate wave with exactly one channel.
@@ -149,11 +196,12 @@ def generate_mono_wave(
         it can be one of 'sine', 'sawtooth', 'square', 'triangle',
         'pulse_10', 'pulse_20', 'pulse_30', 'pulse_40',
         'raw_sawtooth', 'raw_square', 'raw_triangle',
-        'white_noise', 'pink_noise', 'brown_noise', and 'karplus_strong'
+        'white_noise', 'pink_noise', 'brown_noise', 'karplus_strong',
+        'tuned_karplus_strong', and all band-limited waveforms with prefix 'wavetable_'
     :param frequency:
         frequency of wave (in Hz)
     :param amplitude_envelope:
-        amplitude envelope; it also defines duration of sound
+        amplitude envelope; it also defines duration and data type of sound
     :param frame_rate:
         number of frames per second
     :param phase:
@@ -162,6 +210,9 @@ def generate_mono_wave(
         modulator for AM (amplitude modulation) or RM (ring modulation)
     :param phase_modulator:
         modulator for PM (phase modulation)
+    :param random_generator:
+        pseudo-random numbers generator for noises and model-based waveforms;
+        if it is not passed, an unseeded one is created
     :return:
         sound wave as array of shape (1, len(amplitude_envelope))
     """
@@ -171,13 +222,83 @@ def generate_mono_wave(
             waveform, frequency, duration_in_frames, frame_rate, phase, phase_modulator
         )
     elif waveform in MODEL_BASED_WAVEFORMS:
-        wave = generate_model_based_waveform(waveform, frequency, duration_in_frames, frame_rate)
+        wave = generate_model_based_waveform(
+            waveform, frequency, duration_in_frames, frame_rate, random_generator
+        )
     elif waveform in NOISES:
-        wave = generate_noise(waveform, duration_in_frames, frame_rate)
+        wave = generate_noise(waveform, duration_in_frames, frame_rate, random_generator)
     else:
         raise ValueError(f"Unknown waveform: {waveform}.")
 
+    # Waves are generated from 64-bit phases, so they may need conversion.
+    dtype = np.result_type(amplitude_envelope.dtype, np.float32)
+    wave = wave.astype(dtype, copy=False)
     wave *= amplitude_envelope
     if amplitude_modulator is not None:
         wave *= amplitude_modulator
     return wave
+
+
+def generate_sum_of_plain_analog_waves(
+        waveform: str, frequencies: list[float], phases: list[float],
+        phase_modulators: list[Optional[np.ndarray]], amplitude_envelopes: list[np.ndarray],
+        weights: list[float], frame_rate: int
+) -> np.ndarray:
+    """
+    Generate weighted sum of waves of the same plain analog waveform.
+
+    Phases of waves are stacked into a matrix, so the waveform is evaluated by a single
+    call and the weighted sum is a single matrix-vector product. Waves are processed
+    in groups of rows to limit memory consumption.
+
+    :param waveform:
+        form of waves; it can be one of 'sine', 'raw_sawtooth', 'raw_square', and 'raw_triangle'
+    :param frequencies:
+        frequencies of waves (in Hz)
+    :param phases:
+        phase shifts of waves (in radians)
+    :param phase_modulators:
+        modulators for PM (phase modulation) of waves; `None` means no modulation
+    :param amplitude_envelopes:
+        amplitude envelopes of waves; they define durations of waves and data type of sound;
+        if all waves share the same envelope, it is applied once to the sum
+    :param weights:
+        amplitude factors of waves
+    :param frame_rate:
+        number of frames per second
+    :return:
+        sum of waves as array of shape (duration of the longest wave,)
+    """
+    if waveform not in PLAIN_ANALOG_WAVEFORMS:
+        raise ValueError(
+            f"Waveform must be one of {PLAIN_ANALOG_WAVEFORMS}, but found: {waveform}."
+        )
+    wave_fn = NAME_TO_ANALOG_WAVEFORM_FN[waveform]
+    duration_in_frames = max(len(envelope) for envelope in amplitude_envelopes)
+    moments_in_seconds = get_time_grid(duration_in_frames, frame_rate)
+    angular_frequencies = TWO_PI * np.array(frequencies, dtype=np.float64)
+    phases = np.array(phases, dtype=np.float64)
+    weights = np.array(weights, dtype=np.float64)
+    has_shared_envelope = all(x is amplitude_envelopes[0] for x in amplitude_envelopes)
+
+    wave = np.zeros(duration_in_frames)
+    n_rows = max(PHASE_MATRIX_MAX_SIZE_IN_BYTES // (8 * max(duration_in_frames, 1)), 1)
+    for start in range(0, len(weights), n_rows):
+        end = start + n_rows
+        xs = np.multiply.outer(angular_frequencies[start:end], moments_in_seconds)
+        xs += phases[start:end, np.newaxis]
+        for row, phase_modulator in zip(xs, phase_modulators[start:end]):
+            if phase_modulator is not None:
+                row[:len(phase_modulator)] += phase_modulator
+        values = wave_fn(xs)
+        if not has_shared_envelope:
+            for row, envelope in zip(values, amplitude_envelopes[start:end]):
+                row[:len(envelope)] *= envelope
+                row[len(envelope):] = 0
+        wave += weights[start:end] @ values
+
+    dtype = np.result_type(amplitude_envelopes[0].dtype, np.float32)
+    wave = wave.astype(dtype, copy=False)
+    if has_shared_envelope:
+        wave *= amplitude_envelopes[0]
+    return wave
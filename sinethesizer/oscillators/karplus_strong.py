@@ -6,12 +6,66 @@ Author: Nikolay Lysenko
 
 
 from math import ceil
+from typing import Optional
 
 import numpy as np
+import scipy.signal
+from scipy.special import gammaln
+
+
+def compute_binomial_weights(n_steps: int) -> np.ndarray:
+    """
+    Compute weights of values after repeated averaging of adjacent values.
+
+    :param n_steps:
+        number of averaging steps
+    :return:
+        probabilities of binomial distribution with `n_steps` trials and success probability 0.5
+    """
+    ks = np.arange(n_steps + 1)
+    log_weights = gammaln(n_steps + 1) - gammaln(ks + 1) - gammaln(n_steps - ks + 1)
+    log_weights -= n_steps * np.log(2)
+    return np.exp(log_weights)
+
+
+def run_karplus_strong_feedback(initial_block: np.ndarray, n_frames: int) -> np.ndarray:
+    """
+    Run feedback loop of Karplus-Strong method.
+
+    Output values are defined by the recurrence `y[n] = 0.5 * (y[n - N] + y[n - N + 1])`, where
+    `N` is size of initial block and the first `N` values are taken from the initial block.
+    Applying the recurrence `m` times yields `y[n]` as a binomially weighted sum of `m + 1`
+    consecutive values ending `m * (N - 1)` frames before, so `m * (N - 1)` new values can be
+    found by a single convolution. Since `m` can be up to number of already known values divided
+    by `N`, the known part of output nearly doubles at each step.
+
+    :param initial_block:
+        initial values of delay line (its length must be at least 2)
+    :param n_frames:
+        number of frames to generate (initial block is not included)
+    :return:
+        output of feedback loop
+    """
+    block_size = len(initial_block)
+    total_size = block_size + n_frames
+    values = np.empty(total_size)
+    values[:block_size] = initial_block
+    n_known_values = block_size
+    while n_known_values < total_size:
+        n_steps = n_known_values // block_size
+        n_new_values = min(n_steps * (block_size - 1), total_size - n_known_values)
+        start = n_known_values - n_steps * block_size
+        window = values[start:start + n_new_values + n_steps]
+        weights = compute_binomial_weights(n_steps)
+        new_values = scipy.signal.convolve(window, weights, mode='valid')
+        values[n_known_values:n_known_values + n_new_values] = new_values
+        n_known_values += n_new_values
+    return values[block_size:]
 
 
 def generate_karplus_strong_wave(
-        frequency: float, duration_in_frames: int, frame_rate: int
+        frequency: float, duration_in_frames: int, frame_rate: int, tuned: bool = False,
+        random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Generate wave with Karplus-Strong method.
@@ -22,21 +76,31 @@ def generate_karplus_strong_wave(
         duration of output sound in frames
     :param frame_rate:
         number of frames per second
+    :param tuned:
+        if it is `True`, fractional delay is emulated by resampling, so frequency of output
+        is exactly the requested one; else, delay line length is rounded to an integer number of
+        frames, so high notes can be noticeably out of tune
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
     :return:
         sound resembling a sound of a plucked string
     """
-    block_size = int(round(frame_rate / frequency))
+    period = frame_rate / frequency
+    if tuned:
+        # Effective delay of the feedback loop is `block_size - 0.5` frames.
+        block_size = max(ceil(period + 0.5), 2)
+        stretch_factor = (block_size - 0.5) / period
+        n_frames = ceil(duration_in_frames * stretch_factor) + 1
+    else:
+        block_size = max(int(round(period)), 2)
+        n_frames = duration_in_frames
     block = np.ones(block_size)
-    random_indices = np.random.choice(block_size, block_size // 2, False)
+    random_generator = random_generator or np.random.default_rng()
+    random_indices = random_generator.choice(block_size, block_size // 2, False)
     block[random_indices] = -1
 
-    results = []
-    n_buffer_repetitions = ceil(duration_in_frames / block_size)
-    for _ in range(n_buffer_repetitions):
-        new_block = 0.5 * (block + np.append(block[1:], 0))
-        new_block[-1] += 0.5 * new_block[0]
-        results.append(new_block)
-        block = new_block
-
-    results = np.hstack(results)[:duration_in_frames]
-    return results
+    wave = run_karplus_strong_feedback(block, n_frames)
+    if tuned:
+        positions = np.arange(duration_in_frames) * stretch_factor
+        wave = np.interp(positions, np.arange(n_frames), wave)
+    return wave
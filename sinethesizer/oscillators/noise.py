@@ -6,14 +6,17 @@ Author: Nikolay Lysenko
 
 
 from math import floor, log
+from typing import Optional
 
 import numpy as np
-import scipy.signal
+
+from sinethesizer.utils.convolution import convolve
+from sinethesizer.utils.filter_design import design_fir_filter
 
 
 def generate_power_law_noise(
         duration_in_frames: int, frame_rate: int, psd_decay_order: float,
-        exponential_step: float = 2
+        exponential_step: float = 2, random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Generate noise with bandwidth intensity decaying as power of frequency.
@@ -26,10 +29,13 @@ def generate_power_law_noise(
         order of power spectral density's decay with frequency
     :param exponential_step:
         exponential step for defining filter parameters
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
     :return:
         noise
     """
-    white_noise = np.random.normal(0, 0.3, duration_in_frames)
+    random_generator = random_generator or np.random.default_rng()
+    white_noise = random_generator.normal(0, 0.3, duration_in_frames)
     if psd_decay_order == 0:
         return white_noise
 
@@ -60,6 +66,6 @@ def generate_power_law_noise(
     gains *= scaling
 
     fir_size = 2 * int(round(frame_rate / 100)) + 1
-    fir = scipy.signal.firwin2(fir_size, breakpoint_frequencies, gains)
-    result = scipy.signal.convolve(white_noise, fir, mode='same')
+    fir = design_fir_filter(fir_size, breakpoint_frequencies, gains)
+    result = convolve(white_noise.reshape((1, -1)), fir, mode='same')[0]
     return result
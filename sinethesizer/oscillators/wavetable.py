@@ -0,0 +1,152 @@
+"""
+Generate band-limited waveforms of a classical analog synthesizer with wavetables.
+
+Single-cycle tables are built from Fourier series, so they contain no aliasing at all.
+There is one table per octave (so called mip-mapping): the higher the frequency is,
+the fewer harmonics its table has.
+
+Author: Nikolay Lysenko
+"""
+
+
+import functools
+from math import floor, log2
+
+import numpy as np
+
+
+TWO_PI = 2 * np.pi
+TABLE_SIZE = 4096
+# Linear interpolation attenuates harmonics that are close to Nyquist frequency of a table,
+# so number of harmonics is limited by a fraction of table size.
+MAX_N_HARMONICS = TABLE_SIZE // 4
+
+
+def compute_sawtooth_coefficients(n_harmonics: int) -> np.ndarray:
+    """
+    Compute complex Fourier coefficients of sawtooth wave.
+
+    :param n_harmonics:
+        number of harmonics
+    :return:
+        coefficients for harmonics from 0 (constant term) to `n_harmonics`
+    """
+    ks = np.arange(1, n_harmonics + 1)
+    coefficients = np.zeros(n_harmonics + 1, dtype=np.complex128)
+    coefficients[1:] = 1j / (np.pi * ks)
+    return coefficients
+
+
+def compute_pulse_coefficients(n_harmonics: int, duty_cycle: float = 0.5) -> np.ndarray:
+    """
+    Compute complex Fourier coefficients of pulse wave.
+
+    :param n_harmonics:
+        number of harmonics
+    :param duty_cycle:
+        fraction of one period in which wave values are equal to +1
+    :return:
+        coefficients for harmonics from 0 (constant term) to `n_harmonics`
+    """
+    ks = np.arange(1, n_harmonics + 1)
+    coefficients = np.zeros(n_harmonics + 1, dtype=np.complex128)
+    coefficients[0] = 2 * duty_cycle - 1
+    coefficients[1:] = (1 - np.exp(-2j * np.pi * ks * duty_cycle)) / (1j * np.pi * ks)
+    return coefficients
+
+
+def compute_triangle_coefficients(n_harmonics: int) -> np.ndarray:
+    """
+    Compute complex Fourier coefficients of triangle wave.
+
+    :param n_harmonics:
+        number of harmonics
+    :return:
+        coefficients for harmonics from 0 (constant term) to `n_harmonics`
+    """
+    ks = np.arange(1, n_harmonics + 1)
+    coefficients = np.zeros(n_harmonics + 1, dtype=np.complex128)
+    coefficients[1:] = np.where(ks % 2 == 1, -4 / (np.pi * ks) ** 2, 0)
+    return coefficients
+
+
+NAME_TO_COEFFICIENTS_FN = {
+    'sawtooth': compute_sawtooth_coefficients,
+    'pulse': compute_pulse_coefficients,
+    'triangle': compute_triangle_coefficients,
+}
+
+
+@functools.lru_cache(maxsize=256)
+def create_wavetable(waveform: str, n_harmonics: int, duty_cycle: float = 0.5) -> np.ndarray:
+    """
+    Create single-cycle table of band-limited wave.
+
+    :param waveform:
+        form of wave; it can be one of 'sawtooth', 'pulse', and 'triangle'
+    :param n_harmonics:
+        number of harmonics to be kept
+    :param duty_cycle:
+        fraction of one period in which wave values are equal to +1 (it is used only by pulse)
+    :return:
+        values of one period of wave; the first value is repeated at the end to simplify
+        interpolation
+    """
+    coefficients_fn = NAME_TO_COEFFICIENTS_FN[waveform]
+    if waveform == 'pulse':
+        coefficients = coefficients_fn(n_harmonics, duty_cycle)
+    else:
+        coefficients = coefficients_fn(n_harmonics)
+    spectrum = np.zeros(TABLE_SIZE // 2 + 1, dtype=np.complex128)
+    spectrum[:n_harmonics + 1] = TABLE_SIZE * coefficients
+    table = np.fft.irfft(spectrum, TABLE_SIZE)
+    table = np.append(table, table[0])
+    table.setflags(write=False)
+    return table
+
+
+def select_n_harmonics(xs_step: float) -> int:
+    """
+    Select number of harmonics such that all of them are below Nyquist frequency.
+
+    :param xs_step:
+        phase increment per frame; it equals to `2 * pi * frequency / frame_rate`
+    :return:
+        the highest power of 2 that does not exceed number of harmonics below Nyquist frequency
+    """
+    max_n_harmonics = floor(np.pi / xs_step)
+    if max_n_harmonics < 1:
+        return 1
+    n_harmonics = 2 ** floor(log2(max_n_harmonics))
+    return min(n_harmonics, MAX_N_HARMONICS)
+
+
+def generate_wavetable_wave(
+        xs: np.ndarray, xs_step: float, waveform: str, duty_cycle: float = 0.5
+) -> np.ndarray:
+    """
+    Generate band-limited wave by lookup in a wavetable.
+
+    :param xs:
+        angles (in radians) at which to compute wave values
+    :param xs_step:
+        step of regular phase increments with frequency and frame rate of
+        `xs` and regardless any frequency/phase modulations in `xs`;
+        this value is known as phase step or phase increment
+    :param waveform:
+        form of wave; it can be one of 'sawtooth', 'pulse', and 'triangle'
+    :param duty_cycle:
+        fraction of one period in which wave values are equal to +1 (it is used only by pulse)
+    :return:
+        wave
+    """
+    table = create_wavetable(waveform, select_n_harmonics(xs_step), duty_cycle)
+    slopes = np.diff(table)
+    positions = xs * (TABLE_SIZE / TWO_PI)
+    indices = np.floor(positions)
+    positions -= indices  # Now it contains fractional parts of positions.
+    indices = indices.astype(np.int64)
+    indices &= TABLE_SIZE - 1  # Table size is a power of 2, so it is modulo operation.
+    wave = np.take(table, indices)
+    wave += positions * np.take(slopes, indices)  # Linear interpolation.
+    return wave
@@ -5,8 +5,8 @@ Author: Nikolay Lysenko
 """
 
 
-from . import core, event_to_amplitude_factor
+from . import cache, core, event_to_amplitude_factor, profiling
 from .core import synthesize
 
 
-__all__ = ['core', 'event_to_amplitude_factor', 'synthesize']
+__all__ = ['cache', 'core', 'event_to_amplitude_factor', 'profiling', 'synthesize']
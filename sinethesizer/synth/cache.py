@@ -0,0 +1,397 @@
+"""
+Cache synthesized sounds of repeated events in memory or on disk.
+
+Author: Nikolay Lysenko
+"""
+
+
+import hashlib
+import os
+import shutil
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from sinethesizer.effects.registry import get_effect_name_and_params
+from sinethesizer.oscillators.facade import MODEL_BASED_WAVEFORMS, NOISES
+from sinethesizer.synth.core import (
+    Event, Instrument, ModulatedWave, compile_event_effects, synthesize
+)
+
+
+CACHE_KEY_TYPE = tuple[str, float, float, float, str, int]
+SECONDS_PER_DAY = 24 * 60 * 60
+SYNTHESIS_FN_TYPE = Callable[
+    [Event, dict[str, Instrument], Optional[np.random.Generator]],
+    np.ndarray
+]
+
+
+def get_cache_key(event: Event) -> CACHE_KEY_TYPE:
+    """
+    Get those parameters of an event that define its synthesized sound.
+
+    :param event:
+        parameters of sound event
+    :return:
+        all parameters of the event except its start time
+    """
+    key = (
+        event.instrument, event.duration, event.frequency,
+        event.velocity, event.effects, event.frame_rate, event.dtype
+    )
+    return key
+
+
+def is_effect_random(effect_name: Optional[str], effect_params: dict[str, Any]) -> bool:
+    """
+    Check whether an effect produces different outputs for the same inputs.
+
+    :param effect_name:
+        name of effect from the registry of effects
+    :param effect_params:
+        parameters of the effect
+    :return:
+        indicator whether the effect relies on unseeded pseudo-random numbers generator
+    """
+    if effect_name == 'artificial_reverb':
+        return None in effect_params.get('random_seeds', (None, None))
+    if effect_name == 'automation':
+        automated_effect_name = effect_params.get('automated_effect_name')
+        return any(
+            is_effect_random(automated_effect_name, {**effect_params, **break_point})
+            for break_point in effect_params.get('break_points', [])
+        )
+    return False
+
+
+def is_wave_random(wave: ModulatedWave) -> bool:
+    """
+    Check whether a wave is generated with pseudo-random numbers.
+
+    :param wave:
+        parameters of the wave
+    :return:
+        indicator whether the wave is random
+    """
+    random_waveforms = NOISES + MODEL_BASED_WAVEFORMS
+    modulators = [wave.amplitude_modulator, wave.phase_modulator]
+    waveforms = [wave.waveform] + [x.waveform for x in modulators if x is not None]
+    is_random = (
+        wave.quasiperiodic_bandwidth > 0
+        or any(waveform in random_waveforms for waveform in waveforms)
+    )
+    return is_random
+
+
+def is_instrument_random(instrument: Instrument) -> bool:
+    """
+    Check whether an instrument produces different sounds for the same events.
+
+    :param instrument:
+        parameters of the instrument
+    :return:
+        indicator whether the instrument relies on pseudo-random numbers
+    """
+    effect_fns = list(instrument.effects)
+    for partial in instrument.partials:
+        if partial.random_detuning_range > 0 or is_wave_random(partial.wave):
+            return True
+        effect_fns.extend(partial.effects)
+    return any(is_effect_random(*get_effect_name_and_params(fn)) for fn in effect_fns)
+
+
+def is_event_random(event: Event, instruments_registry: dict[str, Instrument]) -> bool:
+    """
+    Check whether synthesis of an event relies on pseudo-random numbers.
+
+    :param event:
+        parameters of sound event
+    :param instruments_registry:
+        mapping from instrument names to their representations
+    :return:
+        indicator whether the event is random
+    """
+    if is_instrument_random(instruments_registry[event.instrument]):
+        return True
+    return any(
+        is_effect_random(*get_effect_name_and_params(effect_fn))
+        for effect_fn in compile_event_effects(event.effects)
+    )
+
+
+def compute_seed(key: CACHE_KEY_TYPE) -> int:
+    """
+    Compute seed that depends only on cache key (and not on the process or the session).
+
+    :param key:
+        cache key of an event
+    :return:
+        seed for pseudo-random number generators
+    """
+    return zlib.crc32(repr(key).encode('utf-8'))
+
+
+def synthesize_with_seed(
+        event: Event, instruments_registry: dict[str, Instrument], seed: int,
+        synthesis_fn: SYNTHESIS_FN_TYPE = synthesize
+) -> np.ndarray:
+    """
+    Synthesize sound event with seeded pseudo-random numbers generator.
+
+    :param event:
+        parameters of sound event to be synthesized
+    :param instruments_registry:
+        mapping from instrument names to their representations
+    :param seed:
+        seed for pseudo-random numbers generator
+    :param synthesis_fn:
+        function that synthesizes events
+    :return:
+        synthesized sound as pressure deviation timeline
+    """
+    random_generator = np.random.default_rng(seed)
+    sound = synthesis_fn(event, instruments_registry, random_generator)
+    return sound
+
+
+class RenderCache:
+    """
+    Size-bounded LRU cache of synthesized sounds.
+
+    An instance of this class can be called just like `synthesize` function.
+    Sounds are stored as read-only arrays, so they must not be modified by a caller.
+
+    :param max_size_in_bytes:
+        maximum total size of stored sounds; the least recently used sounds are evicted
+        if this size is exceeded
+    :param seed_random_events:
+        if it is `True`, events relying on pseudo-random numbers are synthesized with seed
+        derived from the event parameters (so they are cached, but repeated notes sound
+        identically); else, such events are synthesized every time and are not cached
+    :param synthesis_fn:
+        function that is called for events that are not found in the cache
+        (e.g., persistent cache)
+    """
+
+    def __init__(
+            self, max_size_in_bytes: int, seed_random_events: bool = False,
+            synthesis_fn: SYNTHESIS_FN_TYPE = synthesize
+    ):
+        self.max_size_in_bytes = max_size_in_bytes
+        self.seed_random_events = seed_random_events
+        self.synthesis_fn = synthesis_fn
+        self.size_in_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypasses = 0
+        self._sounds = OrderedDict()
+
+    def __call__(
+            self, event: Event, instruments_registry: dict[str, Instrument],
+            random_generator: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """
+        Synthesize one sound event or get its sound from the cache.
+
+        :param event:
+            parameters of sound event to be synthesized
+        :param instruments_registry:
+            mapping from instrument names to their representations
+        :param random_generator:
+            pseudo-random numbers generator for events that are not cached
+        :return:
+            synthesized sound as pressure deviation timeline
+        """
+        key = get_cache_key(event)
+        if key in self._sounds:
+            self.hits += 1
+            self._sounds.move_to_end(key)
+            return self._sounds[key]
+
+        is_random = is_event_random(event, instruments_registry)
+        if is_random and not self.seed_random_events:
+            self.bypasses += 1
+            return self.synthesis_fn(event, instruments_registry, random_generator)
+
+        self.misses += 1
+        if is_random:
+            seed = compute_seed(key)
+            sound = synthesize_with_seed(event, instruments_registry, seed, self.synthesis_fn)
+        else:
+            sound = self.synthesis_fn(event, instruments_registry, random_generator)
+        sound.setflags(write=False)
+        if sound.nbytes <= self.max_size_in_bytes:
+            self._sounds[key] = sound
+            self.size_in_bytes += sound.nbytes
+            self._evict()
+        return sound
+
+    def _evict(self) -> None:
+        """Remove the least recently used sounds until total size is within the limit."""
+        while self.size_in_bytes > self.max_size_in_bytes:
+            _, sound = self._sounds.popitem(last=False)
+            self.size_in_bytes -= sound.nbytes
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._sounds)
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get statistics of cache usage.
+
+        :return:
+            numbers of hits, misses, evictions, and bypasses (i.e., calls for random events that
+            are not cached), number of stored sounds, and their total size in bytes
+        """
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bypasses': self.bypasses,
+            'n_sounds': len(self),
+            'size_in_bytes': self.size_in_bytes,
+        }
+        return stats
+
+
+class DiskRenderCache:
+    """
+    Persistent cache of synthesized sounds.
+
+    Sounds are stored as `.npy` files in the directory `<cache_dir>/<instrument>/<digest>`,
+    where digest is a hash of instrument definition. Found sounds are memory-mapped, so they
+    are read from disk only when they are added to a timeline. Sounds of different versions
+    of an instrument are stored side by side, so switching between versions (e.g., in A/B
+    comparisons) keeps them all. A version is removed when it has not been used for
+    `max_unused_days` and the instrument is used with another version.
+
+    :param cache_dir:
+        path to directory with cached sounds
+    :param seed_random_events:
+        if it is `True`, events relying on pseudo-random numbers are synthesized with seed
+        derived from the event parameters (so they are cached, but repeated notes sound
+        identically); else, such events are synthesized every time and are not cached
+    :param max_unused_days:
+        number of days after the last use of a version of an instrument such that its sounds
+        are removed
+    """
+
+    def __init__(
+            self, cache_dir: str, seed_random_events: bool = False, max_unused_days: float = 30
+    ):
+        self.cache_dir = cache_dir
+        self.seed_random_events = seed_random_events
+        self.max_unused_days = max_unused_days
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self._validated_instruments = set()
+
+    def _get_instrument_dir(self, instrument_name: str, instrument: Instrument) -> str:
+        """Get directory with sounds of an instrument and remove its long unused versions."""
+        instrument_dir = os.path.join(self.cache_dir, instrument_name)
+        digest_dir = os.path.join(instrument_dir, instrument.digest)
+        if (instrument_name, instrument.digest) not in self._validated_instruments:
+            os.makedirs(digest_dir, exist_ok=True)
+            # Modification time of a directory is time of the last use of the version.
+            os.utime(digest_dir)
+            min_time = time.time() - self.max_unused_days * SECONDS_PER_DAY
+            for digest in os.listdir(instrument_dir):
+                path = os.path.join(instrument_dir, digest)
+                try:
+                    is_unused = os.path.getmtime(path) < min_time
+                except FileNotFoundError:  # It has been removed by another process.
+                    continue
+                if digest != instrument.digest and is_unused:
+                    shutil.rmtree(path, ignore_errors=True)
+            self._validated_instruments.add((instrument_name, instrument.digest))
+        return digest_dir
+
+    def __call__(
+            self, event: Event, instruments_registry: dict[str, Instrument],
+            random_generator: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """
+        Synthesize one sound event or load its sound from disk.
+
+        :param event:
+            parameters of sound event to be synthesized
+        :param instruments_registry:
+            mapping from instrument names to their representations
+        :param random_generator:
+            pseudo-random numbers generator for events that are not cached
+        :return:
+            synthesized sound as pressure deviation timeline
+        """
+        instrument = instruments_registry[event.instrument]
+        is_random = is_event_random(event, instruments_registry)
+        if instrument.digest is None or (is_random and not self.seed_random_events):
+            self.bypasses += 1
+            return synthesize(event, instruments_registry, random_generator)
+
+        key = get_cache_key(event)
+        file_name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest() + '.npy'
+        file_path = os.path.join(self._get_instrument_dir(event.instrument, instrument), file_name)
+        if os.path.isfile(file_path):
+            self.hits += 1
+            return np.load(file_path, mmap_mode='r')
+
+        self.misses += 1
+        if is_random:
+            sound = synthesize_with_seed(event, instruments_registry, compute_seed(key))
+        else:
+            sound = synthesize(event, instruments_registry, random_generator)
+        tmp_file_path = f'{file_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_file_path, 'wb') as tmp_file:
+                np.save(tmp_file, sound)
+            os.replace(tmp_file_path, file_path)  # Other processes never see incomplete files.
+        except FileNotFoundError:
+            # Another process has removed the version as unused, so the sound is not stored.
+            pass
+        return sound
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get statistics of cache usage.
+
+        :return:
+            numbers of hits, misses, and bypasses (i.e., calls for events that are not cached)
+        """
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypasses': self.bypasses,
+        }
+        return stats
+
+
+def create_render_cache(settings: dict[str, Any]) -> Optional[SYNTHESIS_FN_TYPE]:
+    """
+    Create in-memory and/or persistent render cache if it is requested by settings.
+
+    :param settings:
+        global settings for the output track
+    :return:
+        render cache or `None` if neither 'render_cache_size' nor 'cache_dir' is set
+    """
+    seed_random_events = settings.get('seed_random_events_in_render_cache', False)
+    render_cache = None
+    if settings.get('cache_dir') is not None:
+        render_cache = DiskRenderCache(
+            settings['cache_dir'], seed_random_events, settings.get('cache_max_unused_days', 30)
+        )
+    size_in_megabytes = settings.get('render_cache_size')
+    if size_in_megabytes is not None:
+        render_cache = RenderCache(
+            int(size_in_megabytes * 2 ** 20),
+            seed_random_events,
+            render_cache or synthesize
+        )
+    return render_cache
@@ -5,17 +5,28 @@ Author: Nikolay Lysenko
 """
 
 
+import functools
 import json
-import random
-from typing import NamedTuple, Optional
+from typing import ContextManager, NamedTuple, Optional
 
 import numpy as np
 
 from sinethesizer.effects import EFFECT_FN_TYPE, get_effects_registry
+from sinethesizer.effects.registry import compute_effect_tail, get_effect_name_and_params
 from sinethesizer.envelopes import ENVELOPE_FN_TYPE
 from sinethesizer.synth.event_to_amplitude_factor import EVENT_TO_AMPLITUDE_FACTOR_FN_TYPE
 from sinethesizer.oscillators import generate_mono_wave
-from sinethesizer.utils.misc import sum_two_sounds
+from sinethesizer.oscillators.facade import (
+    PLAIN_ANALOG_WAVEFORMS, generate_sum_of_plain_analog_waves
+)
+from sinethesizer.synth.profiling import NULL_CONTEXT, PROFILING_STATE, profile_stage
+from sinethesizer.utils.convolution import convolve
+from sinethesizer.utils.misc import (
+    SoundAccumulator, convert_to_stereo, enable_effects_random_generator
+)
+
+
+EVENT_EFFECTS_CACHE_SIZE = 1024
 
 
 class Event(NamedTuple):
@@ -39,6 +50,12 @@ class Event(NamedTuple):
         resulting sound
     :param frame_rate:
         number of frames per second
+    :param sends:
+        JSON string representing mapping from names of mix buses to levels with which
+        resulting sound is sent to them; it does not affect the sound itself
+    :param dtype:
+        data type of synthesized sound ('float64' or 'float32'); phases of oscillators are
+        accumulated as 64-bit floats regardless of it, because they need high precision
     """
     instrument: str
     start_time: float
@@ -47,6 +64,8 @@ class Event(NamedTuple):
     velocity: float
     effects: str
     frame_rate: int
+    sends: str = ''
+    dtype: str = 'float64'
 
 
 class Modulator(NamedTuple):
@@ -130,7 +149,7 @@ def adjust_envelope_duration(
     n_absent_frames = required_len - len(envelope)
     if n_absent_frames <= 0:
         return envelope[:required_len]
-    padding = envelope[-1] * np.ones(n_absent_frames)
+    padding = np.full(n_absent_frames, envelope[-1], dtype=envelope.dtype)
     envelope = np.hstack((envelope, padding))
     return envelope
 
@@ -139,7 +158,8 @@ def introduce_quasiperiodicity(
         phase_modulator: Optional[np.ndarray],
         n_frames: int, frame_rate: int, frequency: float,
         quasiperiodic_bandwidth: float,
-        quasiperiodic_breakpoints_frequency: float
+        quasiperiodic_breakpoints_frequency: float,
+        random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Add non-periodic component to phase modulator.
@@ -158,11 +178,14 @@ def introduce_quasiperiodicity(
         expected frequency (in Hz) of random breakpoints placing;
         in this context, breakpoints are moments of time associated with
         aperiodic changes of instantaneous frequency of modulated sound
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
     :return:
         phase modulator that makes output wave quasi-periodic
     """
     if quasiperiodic_bandwidth == 0:
         return phase_modulator
+    random_generator = random_generator or np.random.default_rng()
 
     semitone = 2 ** (1 / 12)
     half_of_bandwidth = 0.5 * quasiperiodic_bandwidth
@@ -181,20 +204,33 @@ def introduce_quasiperiodicity(
     n_breakpoints = n_frames / frame_rate * quasiperiodic_breakpoints_frequency
     n_breakpoints = int(round(n_breakpoints))
     n_breakpoints = max(n_breakpoints, 3)  # Prevent border case failures.
-    breakpoints = np.random.uniform(0, n_frames, n_breakpoints - 2).round()
+    breakpoints = random_generator.uniform(0, n_frames, n_breakpoints - 2).round()
     breakpoints = np.hstack((breakpoints, np.array([0, n_frames - 1])))
-    breakpoints = breakpoints.reshape((-1, 1))
+    breakpoints = breakpoints.astype(int)
 
-    slopes = np.random.uniform(-max_increment, max_increment, n_breakpoints)
-    slopes = slopes.reshape((-1, 1))
+    slopes = random_generator.uniform(-max_increment, max_increment, n_breakpoints)
 
     # Increments for phase modulator are weighted sums of slopes with weights
     # inversely depending on distances to corresponding breakpoints.
-    stub = np.tile(np.arange(n_frames), (n_breakpoints, 1))
-    distances_to_breakpoints = np.abs(stub - breakpoints)
-    unnormalized_weights = 1 / (distances_to_breakpoints + 1e-5) ** 2
-    weights = unnormalized_weights / unnormalized_weights.sum(axis=0)
-    increments = np.sum(weights * slopes, axis=0)
+    # Both numerator and denominator of such sums are convolutions of impulse trains
+    # (with impulses placed at breakpoints) with the same kernel, so they can be found
+    # in O(n_frames * log(n_frames)) time instead of O(n_frames * n_breakpoints) time.
+    # Weights of breakpoints coinciding with a frame are much higher than all other weights,
+    # so they are excluded from convolution (where they would cause precision loss) and
+    # are added separately.
+    n_positions = n_frames + 1  # Rounding can place a breakpoint right after the last frame.
+    impulse_trains = np.vstack((
+        np.bincount(breakpoints, weights=slopes, minlength=n_positions),
+        np.bincount(breakpoints, minlength=n_positions)
+    ))
+    distances = np.abs(np.arange(-n_frames, n_frames + 1))
+    kernel = 1 / (distances + 1e-5) ** 2
+    coinciding_breakpoint_weight = kernel[n_frames]
+    kernel[n_frames] = 0
+    sums = convolve(impulse_trains, kernel)
+    sums = sums[:, n_frames:2 * n_frames]
+    sums += coinciding_breakpoint_weight * impulse_trains[:, :n_frames]
+    increments = sums[0] / sums[1]
     non_periodic_modulator = np.cumsum(increments)
 
     if phase_modulator is None:
@@ -202,11 +238,12 @@ def introduce_quasiperiodicity(
     return phase_modulator + non_periodic_modulator
 
 
-def generate_modulated_wave(
-        wave: ModulatedWave, frequency: float, event: Event
-) -> np.ndarray:
+def generate_modulators(
+        wave: ModulatedWave, frequency: float, event: Event, n_frames: int,
+        random_generator: Optional[np.random.Generator] = None
+) -> tuple[float, dict[str, Optional[np.ndarray]]]:
     """
-    Generate wave with modulated frequency.
+    Generate modulators of a wave.
 
     :param wave:
         parameters of a wave to be generated
@@ -214,12 +251,15 @@ def generate_modulated_wave(
         fundamental frequency of a wave to be generated (in Hz)
     :param event:
         parameters of sound event for which this function is called
+    :param n_frames:
+        duration of the wave (in frames)
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
     :return:
-        wave with modulated frequency
+        frequency of carrier (in Hz) and mapping from modulator type ('amplitude_modulator' or
+        'phase_modulator') to modulator (quasi-periodic phase deviations included)
     """
-    amplitude_envelope = wave.amplitude_envelope_fn(event)
-    n_frames = len(amplitude_envelope)
-
+    random_generator = random_generator or np.random.default_rng()
     carrier_frequency = frequency
     modulators_as_params = {
         'amplitude_modulator': wave.amplitude_modulator,
@@ -233,35 +273,70 @@ def generate_modulated_wave(
             # so order in `modulators_as_params` matters.
             carrier_frequency = params.carrier_frequency_ratio * frequency
             modulator_frequency = params.modulator_frequency_ratio * frequency
-            index_envelope = params.modulation_index_envelope_fn(event)
-            index_envelope = adjust_envelope_duration(index_envelope, n_frames)
-            modulator_as_array = generate_mono_wave(
-                params.waveform,
-                modulator_frequency,
-                index_envelope,
-                event.frame_rate,
-                params.phase
-            )
+            with profile_stage(event.instrument, 'envelopes'):
+                index_envelope = params.modulation_index_envelope_fn(event)
+                index_envelope = adjust_envelope_duration(index_envelope, n_frames)
+                index_envelope = index_envelope.astype(event.dtype, copy=False)
+            with profile_stage(event.instrument, 'oscillators'):
+                modulator_as_array = generate_mono_wave(
+                    params.waveform,
+                    modulator_frequency,
+                    index_envelope,
+                    event.frame_rate,
+                    params.phase,
+                    random_generator=random_generator
+                )
         modulators_as_arrays[key] = modulator_as_array
 
     if wave.amplitude_modulator is not None:
         constant = int(not wave.amplitude_modulator.use_ring_modulation)
         modulators_as_arrays['amplitude_modulator'] += constant
-    modulators_as_arrays['phase_modulator'] = introduce_quasiperiodicity(
-        modulators_as_arrays['phase_modulator'], n_frames, event.frame_rate, frequency,
-        wave.quasiperiodic_bandwidth, wave.quasiperiodic_breakpoints_frequency
-    )
+    with profile_stage(event.instrument, 'quasiperiodicity'):
+        modulators_as_arrays['phase_modulator'] = introduce_quasiperiodicity(
+            modulators_as_arrays['phase_modulator'], n_frames, event.frame_rate, frequency,
+            wave.quasiperiodic_bandwidth, wave.quasiperiodic_breakpoints_frequency,
+            random_generator
+        )
+    return carrier_frequency, modulators_as_arrays
 
-    result = generate_mono_wave(
-        wave.waveform,
-        carrier_frequency,
-        amplitude_envelope,
-        event.frame_rate,
-        wave.phase,
-        **modulators_as_arrays
-    )
 
-    result = np.vstack((result, result))  # Two channels for stereo sound.
+def generate_modulated_wave(
+        wave: ModulatedWave, frequency: float, event: Event,
+        random_generator: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """
+    Generate wave with modulated frequency.
+
+    :param wave:
+        parameters of a wave to be generated
+    :param frequency:
+        fundamental frequency of a wave to be generated (in Hz)
+    :param event:
+        parameters of sound event for which this function is called
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
+    :return:
+        wave with modulated frequency as mono sound (i.e., array of shape (1, n_frames))
+    """
+    with profile_stage(event.instrument, 'envelopes'):
+        amplitude_envelope = wave.amplitude_envelope_fn(event).astype(event.dtype, copy=False)
+    n_frames = len(amplitude_envelope)
+    random_generator = random_generator or np.random.default_rng()
+    carrier_frequency, modulators_as_arrays = generate_modulators(
+        wave, frequency, event, n_frames, random_generator
+    )
+    with profile_stage(event.instrument, 'oscillators'):
+        result = generate_mono_wave(
+            wave.waveform,
+            carrier_frequency,
+            amplitude_envelope,
+            event.frame_rate,
+            wave.phase,
+            **modulators_as_arrays,
+            random_generator=random_generator
+        )
+
+    result = result.reshape((1, -1))  # Sound stays mono until a stereo effect is applied.
     return result
 
 
@@ -298,7 +373,9 @@ class Partial(NamedTuple):
     effects: list[EFFECT_FN_TYPE]
 
 
-def generate_partial(partial: Partial, event: Event) -> np.ndarray:
+def generate_partial(
+        partial: Partial, event: Event, random_generator: Optional[np.random.Generator] = None
+) -> np.ndarray:
     """
     Generate partial (fundamental or overtone).
 
@@ -306,35 +383,171 @@ def generate_partial(partial: Partial, event: Event) -> np.ndarray:
         parameters of the partial
     :param event:
         parameters of sound event for which this function is called
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
     :return:
-        partial
+        partial; it is mono sound unless its effects make channels different
     """
     semitone = 2 ** (1 / 12)
-    sound = np.array([[], []], dtype=np.float64)
+    accumulator = SoundAccumulator(dtype=event.dtype)
     partial_frequency = partial.frequency_ratio * event.frequency
     nyquist_frequency = event.frame_rate / 2
     if partial_frequency >= nyquist_frequency:
         # This partial can not be heard, but it creates aliasing, so remove it.
-        return sound
+        return accumulator.get_sound()
+    random_generator = random_generator or np.random.default_rng()
     borders_of_random_detuning = (
         -partial.random_detuning_range / 2,
         partial.random_detuning_range / 2
     )
     params = partial.detuning_to_amplitude.items()
     for freq_shift_in_semitones, amplitude_ratio in params:
-        freq_shift_in_semitones += random.uniform(*borders_of_random_detuning)
+        freq_shift_in_semitones += random_generator.uniform(*borders_of_random_detuning)
         frequency_ratio = semitone ** freq_shift_in_semitones
         detuned_frequency = frequency_ratio * partial_frequency
-        wave = generate_modulated_wave(partial.wave, detuned_frequency, event)
+        wave = generate_modulated_wave(partial.wave, detuned_frequency, event, random_generator)
         wave *= amplitude_ratio
-        sound = sum_two_sounds(sound, wave)
+        accumulator.add(wave)
+    sound = accumulator.get_sound()
     sound *= partial.amplitude_ratio
     sound *= partial.event_to_amplitude_factor_fn(event)
     for effect_fn in partial.effects:
-        sound = effect_fn(sound, event)
+        with profile_effect(event, 'partial', effect_fn):
+            sound = effect_fn(sound, event)
     return sound
 
 
+class OscillatorsBatch(NamedTuple):
+    """
+    Waves of the same waveform that are generated together.
+
+    :param frequencies:
+        frequencies of waves (in Hz)
+    :param phases:
+        phase shifts of waves (in radians)
+    :param phase_modulators:
+        modulators for PM (phase modulation) of waves
+    :param amplitude_envelopes:
+        amplitude envelopes of waves
+    :param weights:
+        amplitude factors of waves
+    """
+    frequencies: list[float]
+    phases: list[float]
+    phase_modulators: list[Optional[np.ndarray]]
+    amplitude_envelopes: list[np.ndarray]
+    weights: list[float]
+
+
+def is_batchable(partial: Partial) -> bool:
+    """
+    Check that waves of partial can be generated in a batch with waves of other partials.
+
+    :param partial:
+        parameters of the partial
+    :return:
+        `True` if the partial has no effects, no amplitude modulation, and
+        its waveform is a plain analog waveform, `False` else
+    """
+    return (
+        not partial.effects
+        and partial.wave.amplitude_modulator is None
+        and partial.wave.waveform in PLAIN_ANALOG_WAVEFORMS
+    )
+
+
+def add_partial_to_batch(
+        partial: Partial, event: Event, batch: OscillatorsBatch,
+        random_generator: Optional[np.random.Generator] = None
+) -> None:
+    """
+    Add waves of partial to batch instead of generating them.
+
+    Pseudo-random numbers are drawn in the same order as in `generate_partial` function,
+    so batching does not change results of seeded synthesis.
+
+    :param partial:
+        parameters of the partial
+    :param event:
+        parameters of sound event for which this function is called
+    :param batch:
+        batch to be extended
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
+    :return:
+        None
+    """
+    semitone = 2 ** (1 / 12)
+    partial_frequency = partial.frequency_ratio * event.frequency
+    nyquist_frequency = event.frame_rate / 2
+    if partial_frequency >= nyquist_frequency:
+        # This partial can not be heard, but it creates aliasing, so remove it.
+        return
+    with profile_stage(event.instrument, 'envelopes'):
+        amplitude_envelope = partial.wave.amplitude_envelope_fn(event)
+        amplitude_envelope = amplitude_envelope.astype(event.dtype, copy=False)
+    amplitude_factor = partial.amplitude_ratio * partial.event_to_amplitude_factor_fn(event)
+    random_generator = random_generator or np.random.default_rng()
+    borders_of_random_detuning = (
+        -partial.random_detuning_range / 2,
+        partial.random_detuning_range / 2
+    )
+    params = partial.detuning_to_amplitude.items()
+    for freq_shift_in_semitones, amplitude_ratio in params:
+        freq_shift_in_semitones += random_generator.uniform(*borders_of_random_detuning)
+        frequency_ratio = semitone ** freq_shift_in_semitones
+        detuned_frequency = frequency_ratio * partial_frequency
+        carrier_frequency, modulators_as_arrays = generate_modulators(
+            partial.wave, detuned_frequency, event, len(amplitude_envelope), random_generator
+        )
+        batch.frequencies.append(carrier_frequency)
+        batch.phases.append(partial.wave.phase)
+        batch.phase_modulators.append(modulators_as_arrays['phase_modulator'])
+        batch.amplitude_envelopes.append(amplitude_envelope)
+        batch.weights.append(amplitude_ratio * amplitude_factor)
+
+
+def generate_partials(
+        partials: list[Partial], event: Event,
+        random_generator: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """
+    Generate sum of partials.
+
+    Waves of partials that can be batched (see `is_batchable` function) are grouped by
+    waveform and each group is generated at once. All other partials are generated one by one.
+
+    :param partials:
+        parameters of partials
+    :param event:
+        parameters of sound event for which this function is called
+    :param random_generator:
+        pseudo-random numbers generator; if it is not passed, an unseeded one is created
+    :return:
+        sum of partials
+    """
+    random_generator = random_generator or np.random.default_rng()
+    accumulator = SoundAccumulator(dtype=event.dtype)
+    batches = {}
+    for partial in partials:
+        if not is_batchable(partial):
+            accumulator.add(generate_partial(partial, event, random_generator))
+            continue
+        batch = batches.setdefault(partial.wave.waveform, OscillatorsBatch([], [], [], [], []))
+        add_partial_to_batch(partial, event, batch, random_generator)
+
+    for waveform, batch in batches.items():
+        if not batch.weights:  # All partials of the batch are above Nyquist frequency.
+            continue
+        with profile_stage(event.instrument, 'oscillators'):
+            wave = generate_sum_of_plain_analog_waves(
+                waveform, batch.frequencies, batch.phases, batch.phase_modulators,
+                batch.amplitude_envelopes, batch.weights, event.frame_rate
+            )
+        accumulator.add(wave.reshape((1, -1)))
+    return accumulator.get_sound()
+
+
 class Instrument(NamedTuple):
     """
     Parameters of a virtual musical instrument.
@@ -348,10 +561,58 @@ class Instrument(NamedTuple):
         partials' amplitudes due to effects)
     :param effects:
         sound effects that should be applied to outputs of the instrument
+    :param digest:
+        hash of instrument definition; it is used by persistent cache of synthesized sounds
+        in order to detect changes of the instrument
     """
     partials: list[Partial]
     amplitude_scaling: float
     effects: list[EFFECT_FN_TYPE]
+    digest: Optional[str] = None
+
+
+def profile_effect(
+        event: Event, level: str, effect_fn: EFFECT_FN_TYPE
+) -> ContextManager[None]:
+    """
+    Measure application of an effect if profiling is enabled.
+
+    :param event:
+        parameters of sound event for which the effect is applied
+    :param level:
+        level at which the effect is applied; it is one of 'partial', 'instrument', and 'event'
+    :param effect_fn:
+        effect function with all parameters except sound and event set
+    :return:
+        context manager that measures its body or does nothing
+    """
+    if PROFILING_STATE['profiler'] is None:
+        return NULL_CONTEXT
+    effect_name = get_effect_name_and_params(effect_fn)[0] or 'unknown'
+    return profile_stage(event.instrument, f'{level}_effect:{effect_name}')
+
+
+@functools.lru_cache(maxsize=EVENT_EFFECTS_CACHE_SIZE)
+def compile_event_effects(effects: str) -> tuple[EFFECT_FN_TYPE, ...]:
+    """
+    Convert JSON string with event-level effects to effect functions with frozen parameters.
+
+    Usually, many events have the same effects (e.g., all notes of a MIDI track),
+    so compiled effects are cached and the string is parsed once.
+
+    :param effects:
+        sound effects to be applied to the resulting event in JSON format (see `Event`)
+    :return:
+        effect functions with all parameters except sound and event set
+    """
+    if not effects:
+        return tuple()
+    effects_registry = get_effects_registry()
+    effect_fns = []
+    for effect in json.loads(effects):
+        effect_name = effect.pop('name')
+        effect_fns.append(functools.partial(effects_registry[effect_name], **effect))
+    return tuple(effect_fns)
 
 
 def apply_event_level_effects(sound: np.ndarray, event: Event) -> np.ndarray:
@@ -365,18 +626,15 @@ def apply_event_level_effects(sound: np.ndarray, event: Event) -> np.ndarray:
     :return:
         modified sound
     """
-    if not event.effects:
-        return sound
-    effects_registry = get_effects_registry()
-    effects = json.loads(event.effects)
-    for effect in effects:
-        effect_name = effect.pop('name')
-        sound = effects_registry[effect_name](sound, event, **effect)
+    for effect_fn in compile_event_effects(event.effects):
+        with profile_effect(event, 'event', effect_fn):
+            sound = effect_fn(sound, event)
     return sound
 
 
 def synthesize(
-        event: Event, instruments_registry: dict[str, Instrument]
+        event: Event, instruments_registry: dict[str, Instrument],
+        random_generator: Optional[np.random.Generator] = None
 ) -> np.ndarray:
     """
     Synthesize one sound event (loosely speaking, a played note).
@@ -385,16 +643,67 @@ def synthesize(
         parameters of sound event to be synthesized
     :param instruments_registry:
         mapping from instrument names to their representations
+    :param random_generator:
+        pseudo-random numbers generator for all random components of the sound
+        (random detuning, quasi-periodicity, noises, unseeded reverbs, etc.); pass seeded generator
+        to make results reproducible; if it is not passed, an unseeded one is created
     :return:
         synthesized sound as pressure deviation timeline
     """
-    sound = np.array([[], []], dtype=np.float64)
     instrument = instruments_registry[event.instrument]
-    for partial in instrument.partials:
-        partial_sound = generate_partial(partial, event)
-        sound = sum_two_sounds(sound, partial_sound)
-    for effect_fn in instrument.effects:
-        sound = effect_fn(sound, event)
-    sound *= instrument.amplitude_scaling
-    sound = apply_event_level_effects(sound, event)
+    random_generator = random_generator or np.random.default_rng()
+    with enable_effects_random_generator(random_generator):
+        sound = generate_partials(instrument.partials, event, random_generator)
+        for effect_fn in instrument.effects:
+            with profile_effect(event, 'instrument', effect_fn):
+                sound = effect_fn(sound, event)
+        sound *= instrument.amplitude_scaling
+        sound = apply_event_level_effects(sound, event)
+    sound = convert_to_stereo(sound)
+    # Effects are not obliged to keep data type, so it is restored here.
+    sound = sound.astype(event.dtype, copy=False)
     return sound
+
+
+def compute_partial_duration_in_frames(partial: Partial, event: Event) -> int:
+    """
+    Compute duration of partial without generating it.
+
+    :param partial:
+        parameters of the partial
+    :param event:
+        parameters of sound event for which this function is called
+    :return:
+        number of frames in the partial (including release and tails of effects)
+    """
+    partial_frequency = partial.frequency_ratio * event.frequency
+    nyquist_frequency = event.frame_rate / 2
+    if partial_frequency >= nyquist_frequency:
+        return 0
+    n_frames = len(partial.wave.amplitude_envelope_fn(event))
+    for effect_fn in partial.effects:
+        n_frames += compute_effect_tail(event, *get_effect_name_and_params(effect_fn))
+    return n_frames
+
+
+def compute_sound_duration_in_frames(
+        event: Event, instruments_registry: dict[str, Instrument]
+) -> int:
+    """
+    Compute duration of sound that is synthesized for an event without synthesizing it.
+
+    :param event:
+        parameters of sound event
+    :param instruments_registry:
+        mapping from instrument names to their representations
+    :return:
+        number of frames in the sound (including release and tails of effects)
+    """
+    instrument = instruments_registry[event.instrument]
+    n_frames = max(
+        (compute_partial_duration_in_frames(partial, event) for partial in instrument.partials),
+        default=0
+    )
+    for effect_fn in [*instrument.effects, *compile_event_effects(event.effects)]:
+        n_frames += compute_effect_tail(event, *get_effect_name_and_params(effect_fn))
+    return n_frames
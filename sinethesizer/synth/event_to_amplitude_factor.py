@@ -5,6 +5,7 @@ Author: Nikolay Lysenko
 """
 
 
+from functools import lru_cache
 from typing import Callable
 
 
@@ -31,11 +32,14 @@ def compute_amplitude_factor_as_power_of_velocity(
     return amplitude_factor
 
 
+@lru_cache(maxsize=1)
 def get_event_to_amplitude_factor_functions_registry(
 ) -> dict[str, EVENT_TO_AMPLITUDE_FACTOR_FN_TYPE]:
     """
     Get mapping from amplitude factor functions' names to the functions itself.
 
+    The registry is built once and is shared between calls, so it must not be modified.
+
     :return:
         registry of amplitude factor functions
     """
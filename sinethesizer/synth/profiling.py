@@ -0,0 +1,155 @@
+"""
+Measure time and memory spent on stages of synthesis.
+
+Stages are envelopes creation, oscillators, quasi-periodicity introduction, and effects
+(which are tracked separately for each effect name and each level where they are applied).
+If profiling is not enabled, stages are not measured at all.
+
+Author: Nikolay Lysenko
+"""
+
+
+import contextlib
+import time
+import tracemalloc
+from typing import Any, ContextManager, Iterator, Optional
+
+
+# Currently enabled profiler (if any).
+PROFILING_STATE = {'profiler': None}
+NULL_CONTEXT = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Collector of statistics on synthesis stages.
+
+    :param track_memory:
+        if it is `True`, peak size of memory allocated within each stage is measured;
+        it slows down synthesis, because all memory allocations are traced
+    """
+
+    def __init__(self, track_memory: bool = False):
+        self.track_memory = track_memory
+        self.total_time = 0.0
+        self.stats = {}
+
+    @contextlib.contextmanager
+    def measure(self, instrument: str, stage: str) -> Iterator[None]:
+        """
+        Measure a stage of synthesis.
+
+        :param instrument:
+            name of instrument that is used for synthesis
+        :param stage:
+            name of stage
+        :return:
+            context manager that measures its body
+        """
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            initial_memory = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_time = time.perf_counter() - start_time
+            stage_stats = self.stats.setdefault(
+                (instrument, stage), {'time': 0.0, 'calls': 0, 'peak_bytes': 0}
+            )
+            stage_stats['time'] += elapsed_time
+            stage_stats['calls'] += 1
+            if self.track_memory:
+                peak_bytes = tracemalloc.get_traced_memory()[1] - initial_memory
+                stage_stats['peak_bytes'] = max(stage_stats['peak_bytes'], peak_bytes)
+
+    def aggregate(self, by: str = 'stage') -> dict[str, dict[str, Any]]:
+        """
+        Aggregate statistics by stages or by instruments.
+
+        :param by:
+            either 'stage' or 'instrument'
+        :return:
+            mapping from stage name or instrument name to its statistics
+        """
+        position = {'instrument': 0, 'stage': 1}[by]
+        aggregated_stats = {}
+        for key, stage_stats in self.stats.items():
+            current_stats = aggregated_stats.setdefault(
+                key[position], {'time': 0.0, 'calls': 0, 'peak_bytes': 0}
+            )
+            current_stats['time'] += stage_stats['time']
+            current_stats['calls'] += stage_stats['calls']
+            current_stats['peak_bytes'] = max(
+                current_stats['peak_bytes'], stage_stats['peak_bytes']
+            )
+        return aggregated_stats
+
+    def create_report(self) -> str:
+        """
+        Create human-readable report.
+
+        :return:
+            shares of stages and instruments in total time of profiled code
+        """
+        lines = [f"Profiled time: {self.total_time:.3f} s"]
+        total_time = self.total_time or 1.0  # Prevent division by zero.
+        for by in ['stage', 'instrument']:
+            lines.append(f"By {by}:")
+            aggregated_stats = self.aggregate(by)
+            unmeasured_time = self.total_time - sum(x['time'] for x in aggregated_stats.values())
+            items = sorted(aggregated_stats.items(), key=lambda x: x[1]['time'], reverse=True)
+            for name, stats in items:
+                line = (
+                    f"  {name}: {100 * stats['time'] / total_time:.1f}% of render time "
+                    f"({stats['time']:.3f} s, {stats['calls']} calls"
+                )
+                if self.track_memory:
+                    line += f", peak {stats['peak_bytes'] / 2 ** 20:.1f} MB"
+                lines.append(line + ")")
+            lines.append(
+                f"  other (mixing, I/O, etc): {100 * unmeasured_time / total_time:.1f}% "
+                f"of render time ({unmeasured_time:.3f} s)"
+            )
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def enable_profiling(profiler: Profiler) -> Iterator[Profiler]:
+    """
+    Profile synthesis within the body of this context manager.
+
+    :param profiler:
+        collector of statistics
+    :return:
+        context manager that enables the profiler
+    """
+    previous_profiler = PROFILING_STATE['profiler']
+    PROFILING_STATE['profiler'] = profiler
+    if profiler.track_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    try:
+        yield profiler
+    finally:
+        profiler.total_time += time.perf_counter() - start_time
+        if profiler.track_memory:
+            tracemalloc.stop()
+        PROFILING_STATE['profiler'] = previous_profiler
+
+
+def profile_stage(instrument: str, stage: str) -> ContextManager[None]:
+    """
+    Measure a stage of synthesis if profiling is enabled.
+
+    :param instrument:
+        name of instrument that is used for synthesis
+    :param stage:
+        name of stage
+    :return:
+        context manager that measures its body or does nothing
+    """
+    profiler: Optional[Profiler] = PROFILING_STATE['profiler']
+    if profiler is None:
+        return NULL_CONTEXT
+    return profiler.measure(instrument, stage)
@@ -5,7 +5,7 @@ Author: Nikolay Lysenko
 """
 
 
-from . import misc, music_theory
+from . import convolution, filter_design, misc, music_theory
 
 
-__all__ = ['misc', 'music_theory']
+__all__ = ['convolution', 'filter_design', 'misc', 'music_theory']
@@ -0,0 +1,331 @@
+"""
+Convolve sounds with impulse responses and FIR filters.
+
+Short kernels are applied directly. Other kernels are applied with uniformly partitioned
+overlap-add method: kernel is split into partitions of a size that depends only on
+kernel size, so spectra of partitions do not depend on sound and they are cached.
+Hence, repeated convolutions with the same kernel (e.g., with the same impulse response
+for all notes of a track) are cheaper regardless of durations of notes.
+If a store of impulse responses is enabled, spectra of long kernels are also saved to disk.
+
+Author: Nikolay Lysenko
+"""
+
+
+import hashlib
+from collections import OrderedDict
+from math import ceil
+from typing import Optional
+
+import numpy as np
+import scipy.fft
+
+from sinethesizer.utils.ir_store import load_or_generate
+
+
+DIRECT_CONVOLUTION_MAX_KERNEL_SIZE = 32
+# Partitions of longer kernels have this size; the higher it is, the less partitions there are,
+# but the more frames are processed in vain for short sounds.
+MAX_PARTITION_SIZE = 2 ** 13
+KERNEL_SPECTRA_MAX_SIZE_IN_BYTES = 2 ** 28
+KERNEL_SPECTRA = OrderedDict()
+# Spectra of shorter kernels (e.g., FIR filters) are cheaper to compute than to load from disk.
+STORED_SPECTRUM_MIN_KERNEL_SIZE = 2 ** 14
+
+
+def select_convolution_method(n_frames: int, kernel_size: int) -> str:
+    """
+    Select the fastest method of convolution.
+
+    :param n_frames:
+        number of frames in sound
+    :param kernel_size:
+        number of frames in kernel
+    :return:
+        name of method; it is either 'direct' or 'partitioned'
+    """
+    if min(n_frames, kernel_size) <= DIRECT_CONVOLUTION_MAX_KERNEL_SIZE:
+        return 'direct'
+    return 'partitioned'
+
+
+def select_partition_size(kernel_size: int) -> int:
+    """
+    Select size of kernel partitions (it is also size of sound segments).
+
+    :param kernel_size:
+        number of frames in kernel
+    :return:
+        number of frames in a partition
+    """
+    return min(2 ** ceil(np.log2(kernel_size)), MAX_PARTITION_SIZE)
+
+
+def compute_kernel_spectra(kernel: np.ndarray, partition_size: int) -> np.ndarray:
+    """
+    Compute spectra of partitions of kernel.
+
+    :param kernel:
+        kernel with channels in rows
+    :param partition_size:
+        number of frames in a partition
+    :return:
+        spectra as array of shape (n_channels, n_partitions, partition_size + 1)
+    """
+    n_channels, kernel_size = kernel.shape
+    n_partitions = ceil(kernel_size / partition_size)
+    partitions = np.zeros((n_channels, n_partitions * partition_size), dtype=kernel.dtype)
+    partitions[:, :kernel_size] = kernel
+    partitions = partitions.reshape((n_channels, n_partitions, partition_size))
+    return scipy.fft.rfft(partitions, 2 * partition_size, axis=-1)
+
+
+def get_kernel_spectra(
+        kernel: np.ndarray, partition_size: int, use_cache: bool,
+        kernel_key: Optional[tuple] = None
+) -> np.ndarray:
+    """
+    Get spectra of partitions of kernel from cache or compute them.
+
+    :param kernel:
+        kernel with channels in rows
+    :param partition_size:
+        number of frames in a partition
+    :param use_cache:
+        if it is `True`, cached spectra are used (if they exist) and new spectra are cached
+        (if kernel is long and store of impulse responses is enabled, the spectra are stored too)
+    :param kernel_key:
+        parameters that define kernel; if they are passed, they identify cached spectra
+        instead of hash of kernel values
+    :return:
+        spectra as array of shape (n_channels, n_partitions, partition_size + 1)
+    """
+    if not use_cache:
+        return compute_kernel_spectra(kernel, partition_size)
+    if kernel_key is not None:
+        key = ('key', kernel_key, kernel.shape, kernel.dtype.str, partition_size)
+    else:
+        kernel = np.ascontiguousarray(kernel)
+        digest = hashlib.blake2b(kernel, digest_size=16).hexdigest()
+        key = ('digest', digest, kernel.shape, kernel.dtype.str, partition_size)
+    spectra = KERNEL_SPECTRA.get(key)
+    if spectra is not None:
+        KERNEL_SPECTRA.move_to_end(key)
+        return spectra
+    if kernel.shape[-1] >= STORED_SPECTRUM_MIN_KERNEL_SIZE:
+        spectra = load_or_generate(
+            ('kernel_spectrum', *key), lambda: compute_kernel_spectra(kernel, partition_size)
+        )
+    else:
+        spectra = compute_kernel_spectra(kernel, partition_size)
+    spectra.setflags(write=False)
+    KERNEL_SPECTRA[key] = spectra
+    total_size = sum(x.nbytes for x in KERNEL_SPECTRA.values())
+    while total_size > KERNEL_SPECTRA_MAX_SIZE_IN_BYTES and len(KERNEL_SPECTRA) > 1:
+        _, evicted_spectra = KERNEL_SPECTRA.popitem(last=False)
+        total_size -= evicted_spectra.nbytes
+    return spectra
+
+
+def convolve_directly(sound: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """
+    Convolve sound with kernel directly.
+
+    :param sound:
+        sound with channels in rows
+    :param kernel:
+        kernel with channels in rows
+    :return:
+        full convolution with channels in rows
+    """
+    n_channels = max(sound.shape[0], kernel.shape[0])
+    sound = np.broadcast_to(sound, (n_channels, sound.shape[1]))
+    kernel = np.broadcast_to(kernel, (n_channels, kernel.shape[1]))
+    return np.vstack([np.convolve(x, y) for x, y in zip(sound, kernel)])
+
+
+def convolve_with_partitions(
+        sound: np.ndarray, kernel: np.ndarray, use_cache: bool,
+        kernel_key: Optional[tuple] = None
+) -> np.ndarray:
+    """
+    Convolve sound with kernel via uniformly partitioned overlap-add method.
+
+    Sound is split into segments of partition size. Spectrum of each output block is a sum of
+    products of spectra of segments and spectra of kernel partitions such that sum of indices
+    of a segment and a partition is index of the block. All segments, partitions, and blocks
+    are transformed by batched FFT calls.
+
+    :param sound:
+        sound with channels in rows
+    :param kernel:
+        kernel with channels in rows
+    :param use_cache:
+        if it is `True`, spectra of kernel partitions are cached
+    :param kernel_key:
+        parameters that define kernel (see `get_kernel_spectra` function)
+    :return:
+        full convolution with channels in rows
+    """
+    n_frames = sound.shape[1]
+    kernel_size = kernel.shape[1]
+    partition_size = select_partition_size(kernel_size)
+    kernel_spectra = get_kernel_spectra(kernel, partition_size, use_cache, kernel_key)
+    n_partitions = kernel_spectra.shape[1]
+    n_segments = ceil(n_frames / partition_size)
+
+    padded_sound = np.zeros((sound.shape[0], n_segments * partition_size), dtype=sound.dtype)
+    padded_sound[:, :n_frames] = sound
+    segments = padded_sound.reshape((sound.shape[0], n_segments, partition_size))
+    segments_spectra = scipy.fft.rfft(segments, 2 * partition_size, axis=-1)
+
+    n_channels = max(sound.shape[0], kernel.shape[0])
+    spectra = np.zeros(
+        (n_channels, n_segments + n_partitions - 1, partition_size + 1),
+        dtype=segments_spectra.dtype
+    )
+    if n_partitions <= n_segments:
+        for partition_index in range(n_partitions):
+            spectra[:, partition_index:partition_index + n_segments] += (
+                segments_spectra * kernel_spectra[:, partition_index:partition_index + 1]
+            )
+    else:
+        for segment_index in range(n_segments):
+            spectra[:, segment_index:segment_index + n_partitions] += (
+                segments_spectra[:, segment_index:segment_index + 1] * kernel_spectra
+            )
+    blocks = scipy.fft.irfft(spectra, 2 * partition_size, axis=-1)
+    result = add_overlapping_blocks(blocks, partition_size, partition_size)
+    return result[:, :n_frames + kernel_size - 1]
+
+
+def add_overlapping_blocks(
+        blocks: np.ndarray, segment_size: int, kernel_size: int
+) -> np.ndarray:
+    """
+    Sum up convolutions of consecutive segments with kernel.
+
+    :param blocks:
+        convolutions of segments as array of shape (n_channels, n_segments, fft_size);
+        tail of each convolution must be not longer than segment
+    :param segment_size:
+        number of frames in a segment
+    :param kernel_size:
+        number of frames in kernel
+    :return:
+        sum of convolutions with channels in rows
+    """
+    n_channels, n_segments, _ = blocks.shape
+    result = np.zeros((n_channels, (n_segments + 1) * segment_size), dtype=blocks.dtype)
+    result[:, :-segment_size] = blocks[:, :, :segment_size].reshape((n_channels, -1))
+    tails = np.zeros((n_channels, n_segments, segment_size), dtype=blocks.dtype)
+    tails[:, :, :kernel_size - 1] = blocks[:, :, segment_size:segment_size + kernel_size - 1]
+    result[:, segment_size:] += tails.reshape((n_channels, -1))
+    return result
+
+
+def convolve(
+        sound: np.ndarray, kernel: np.ndarray, mode: str = 'full',
+        cache_kernel_spectrum: bool = True, kernel_key: Optional[tuple] = None
+) -> np.ndarray:
+    """
+    Convolve sound with kernel (impulse response or FIR filter) using the fastest method.
+
+    :param sound:
+        sound with channels in rows
+    :param kernel:
+        either 1D kernel that is used for all channels or 2D kernel with channels in rows;
+        if sound has one channel and kernel has two channels, result has two channels
+    :param mode:
+        either 'full' (all frames of convolution are returned) or 'same' (frames are
+        centered with respect to 'full' output and their number is the same as in sound)
+    :param cache_kernel_spectrum:
+        if it is `True`, spectrum of kernel is cached; set it to `False` for kernels
+        that are not going to be reused (e.g., random impulse responses)
+    :param kernel_key:
+        parameters that define kernel (e.g., parameters of impulse response); if they are
+        passed, they identify cached spectrum and kernel is not hashed at each call
+    :return:
+        convolution with channels in rows; it has data type of sound
+        (or 64-bit float if sound is not a floating-point array)
+    """
+    if mode not in ['full', 'same']:
+        raise ValueError(f"Mode must be either 'full' or 'same', but found: {mode}.")
+    dtype = sound.dtype if sound.dtype == np.float32 else np.float64
+    sound = sound.astype(dtype, copy=False)
+    kernel = np.atleast_2d(kernel).astype(dtype, copy=False)
+    n_frames = sound.shape[1]
+    kernel_size = kernel.shape[1]
+    if n_frames == 0 or kernel_size == 0:
+        n_channels = max(sound.shape[0], kernel.shape[0])
+        return np.zeros((n_channels, 0), dtype=dtype)
+
+    method = select_convolution_method(n_frames, kernel_size)
+    if method == 'direct':
+        result = convolve_directly(sound, kernel)
+    else:
+        result = convolve_with_partitions(sound, kernel, cache_kernel_spectrum, kernel_key)
+
+    if mode == 'same':
+        start = (kernel_size - 1) // 2
+        result = result[:, start:start + n_frames]
+    return result
+
+
+def convolve_with_interpolated_kernels(
+        sound: np.ndarray, kernels: np.ndarray, positions: np.ndarray, mode: str = 'full'
+) -> np.ndarray:
+    """
+    Convolve sound with kernel that changes over time.
+
+    Sound is split into segments of kernel size and each segment is convolved with
+    linear interpolation of two adjacent kernels. Spectrum of interpolated kernel is
+    interpolation of spectra of kernels, so kernels are transformed only once and all segments
+    are processed by a single batched FFT call as in overlap-add method.
+
+    :param sound:
+        sound with channels in rows
+    :param kernels:
+        1D kernels of the same size as array of shape (n_kernels, kernel_size)
+    :param positions:
+        positions between kernels (from 0 to `n_kernels` - 1) for all frames of sound;
+        a segment is convolved with kernel that corresponds to its central frame
+    :param mode:
+        either 'full' (all frames of convolution are returned) or 'same' (frames are
+        centered with respect to 'full' output and their number is the same as in sound)
+    :return:
+        convolution with channels in rows
+    """
+    if mode not in ['full', 'same']:
+        raise ValueError(f"Mode must be either 'full' or 'same', but found: {mode}.")
+    dtype = sound.dtype if sound.dtype == np.float32 else np.float64
+    n_channels, n_frames = sound.shape
+    n_kernels, kernel_size = kernels.shape
+    segment_size = kernel_size
+    fft_size = scipy.fft.next_fast_len(segment_size + kernel_size - 1, real=True)
+    n_segments = ceil(n_frames / segment_size)
+
+    padded_sound = np.zeros((n_channels, n_segments * segment_size), dtype=dtype)
+    padded_sound[:, :n_frames] = sound
+    segments = padded_sound.reshape((n_channels, n_segments, segment_size))
+    spectra = scipy.fft.rfft(segments, fft_size, axis=-1)
+
+    kernels_spectra = scipy.fft.rfft(kernels.astype(dtype, copy=False), fft_size, axis=-1)
+    centers = np.minimum(np.arange(n_segments) * segment_size + segment_size // 2, n_frames - 1)
+    segments_positions = positions[centers]
+    lower_indices = np.clip(np.floor(segments_positions).astype(int), 0, max(n_kernels - 2, 0))
+    upper_indices = np.minimum(lower_indices + 1, n_kernels - 1)
+    weights = (segments_positions - lower_indices).reshape((-1, 1))
+    segments_kernels_spectra = (
+        (1 - weights) * kernels_spectra[lower_indices]
+        + weights * kernels_spectra[upper_indices]
+    )
+    spectra *= segments_kernels_spectra
+    blocks = scipy.fft.irfft(spectra, fft_size, axis=-1)
+    result = add_overlapping_blocks(blocks, segment_size, kernel_size)
+    result = result[:, :n_frames + kernel_size - 1]
+
+    if mode == 'same':
+        start = (kernel_size - 1) // 2
+        result = result[:, start:start + n_frames]
+    return result
@@ -0,0 +1,309 @@
+"""
+Design FIR filters and Butterworth filters with memoization.
+
+Filters with the same parameters are usually designed for many notes of a track,
+so designs are cached. Cached FIR filters are shared between calls, so they are read-only.
+Butterworth filters with cutoffs changing over time are designed at once for all cutoffs.
+
+Author: Nikolay Lysenko
+"""
+
+
+import functools
+from math import log2
+from typing import Any, Optional
+
+import numpy as np
+from scipy.signal import butter, firwin2
+
+
+FILTER_DESIGNS_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=FILTER_DESIGNS_CACHE_SIZE)
+def design_cached_fir_filter(
+        n_taps: int, breakpoint_frequencies: tuple[float, ...], gains: tuple[float, ...],
+        firwin2_params: tuple[tuple[str, Any], ...]
+) -> np.ndarray:
+    """
+    Design FIR filter with hashable arguments.
+
+    :param n_taps:
+        number of taps
+    :param breakpoint_frequencies:
+        frequencies (as ratios to Nyquist frequency) that correspond to breaks in
+        frequency response of filter
+    :param gains:
+        gains at corresponding breakpoint frequencies
+    :param firwin2_params:
+        pairs of names and values of additional arguments of `scipy.signal.firwin2`
+    :return:
+        coefficients of FIR filter
+    """
+    fir = firwin2(n_taps, breakpoint_frequencies, gains, **dict(firwin2_params))
+    fir.setflags(write=False)
+    return fir
+
+
+def design_fir_filter(
+        n_taps: int, breakpoint_frequencies: list[float], gains: list[float], **kwargs
+) -> np.ndarray:
+    """
+    Design FIR filter with given frequency response.
+
+    :param n_taps:
+        number of taps
+    :param breakpoint_frequencies:
+        frequencies (as ratios to Nyquist frequency) that correspond to breaks in
+        frequency response of filter
+    :param gains:
+        gains at corresponding breakpoint frequencies
+    :return:
+        coefficients of FIR filter (read-only array)
+    """
+    firwin2_params = tuple(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in sorted(kwargs.items())
+    )
+    fir = design_cached_fir_filter(
+        n_taps,
+        tuple(float(x) for x in breakpoint_frequencies),
+        tuple(float(x) for x in gains),
+        firwin2_params
+    )
+    return fir
+
+
+@functools.lru_cache(maxsize=FILTER_DESIGNS_CACHE_SIZE)
+def design_cached_butterworth_filter(
+        order: int, min_threshold: float, max_threshold: float, filter_type: str
+) -> np.ndarray:
+    """
+    Design Butterworth band-pass or band-stop filter and cache it.
+
+    :param order:
+        order of the filter
+    :param min_threshold:
+        lower cutoff frequency as ratio to Nyquist frequency
+    :param max_threshold:
+        upper cutoff frequency as ratio to Nyquist frequency
+    :param filter_type:
+        either 'bandpass' or 'bandstop'
+    :return:
+        second-order sections of filter (read-only array)
+    """
+    second_order_sections = butter(
+        order,
+        [min_threshold, max_threshold],
+        btype=filter_type,
+        output='sos'  # 'ba' is not used, because sometimes it lacks numerical stability.
+    )
+    second_order_sections.setflags(write=False)
+    return second_order_sections
+
+
+def design_butterworth_filter(
+        order: int, min_threshold: float, max_threshold: float, filter_type: str
+) -> np.ndarray:
+    """
+    Design Butterworth band-pass or band-stop filter.
+
+    :param order:
+        order of the filter
+    :param min_threshold:
+        lower cutoff frequency as ratio to Nyquist frequency
+    :param max_threshold:
+        upper cutoff frequency as ratio to Nyquist frequency
+    :param filter_type:
+        either 'bandpass' or 'bandstop'
+    :return:
+        second-order sections of filter; it is a copy of cached array, because
+        `scipy.signal.sosfilt` does not accept read-only arrays
+    """
+    second_order_sections = design_cached_butterworth_filter(
+        order, min_threshold, max_threshold, filter_type
+    )
+    return second_order_sections.copy()
+
+
+def design_state_variable_butterworth_filters(
+        order: int, min_thresholds: Optional[np.ndarray], max_thresholds: Optional[np.ndarray],
+        filter_type: str
+) -> np.ndarray:
+    """
+    Design Butterworth filters as cascades of state variable filters with matching sections.
+
+    Each section is a topology-preserving transform of analog state variable filter,
+    i.e., its states are values of integrators and not delayed samples. Such sections stay
+    stable and do not produce bursts when their coefficients change (unlike direct forms
+    of second-order sections), so these designs are suitable for time-varying filtering.
+    Each section is determined by a pole of analog prototype filter, so sections with
+    the same index change smoothly if cutoffs change smoothly.
+
+    :param order:
+        order of filters
+    :param min_thresholds:
+        lower cutoff frequencies as ratios to Nyquist frequency (ignored by low-pass filters)
+    :param max_thresholds:
+        upper cutoff frequencies as ratios to Nyquist frequency (ignored by high-pass filters)
+    :param filter_type:
+        one of 'lowpass', 'highpass', 'bandpass', and 'bandstop'
+    :return:
+        state space models of sections as array of shape (n_filters, n_sections, 9);
+        the last axis contains transition matrix (4 values, row by row), input vector
+        (2 values), output vector (2 values), and feedthrough coefficient
+    """
+    # Bilinear transform is `z = (4 + s) / (4 - s)` as in `scipy.signal.butter`.
+    if filter_type != 'lowpass':
+        min_frequencies = 4 * np.tan(np.pi * np.asarray(min_thresholds, float) / 2)[:, None]
+    if filter_type != 'highpass':
+        max_frequencies = 4 * np.tan(np.pi * np.asarray(max_thresholds, float) / 2)[:, None]
+    # Poles of analog prototype from the upper half-plane and also a real pole if order is odd.
+    prototype_poles = -np.exp(1j * np.pi * np.arange(-order + 1, 1, 2) / (2 * order))
+    has_real_pole = order % 2 == 1
+
+    if filter_type in ['lowpass', 'highpass']:
+        if filter_type == 'lowpass':
+            poles = max_frequencies * prototype_poles
+        else:
+            poles = min_frequencies / prototype_poles
+        natural_frequencies = np.abs(poles)
+        dampings = -2 * poles.real / natural_frequencies
+        # Weights of low-pass, band-pass, and high-pass outputs of state variable filter.
+        output_weights = np.zeros(poles.shape + (3,))
+        output_weights[..., 0 if filter_type == 'lowpass' else 2] = 1
+    elif filter_type in ['bandpass', 'bandstop']:
+        center_frequencies = np.sqrt(min_frequencies * max_frequencies)
+        band_widths = max_frequencies - min_frequencies
+        if filter_type == 'bandpass':
+            lowpass_poles = prototype_poles * band_widths / 2
+        else:
+            lowpass_poles = np.conj(band_widths / 2 / prototype_poles)
+        # Roots of `s ** 2 - 2 * lowpass_pole * s + center_frequency ** 2`; the first one is
+        # the root of greater magnitude and the second one is found in a numerically stable way.
+        # Sections alternate between them, so signals between sections have moderate amplitudes.
+        upper_poles = lowpass_poles - np.sqrt(lowpass_poles ** 2 - center_frequencies ** 2)
+        lower_poles = center_frequencies ** 2 / upper_poles
+        poles = np.stack((upper_poles, lower_poles), axis=-1).reshape((len(band_widths), -1))
+        poles = poles[:, :order]
+        natural_frequencies = np.abs(poles)
+        dampings = -2 * poles.real / natural_frequencies
+        if has_real_pole:
+            # Poles produced by the real pole of prototype are either both real or conjugate.
+            natural_frequencies[:, -1] = center_frequencies[:, 0]
+            dampings[:, -1] = -2 * lowpass_poles[:, -1].real / center_frequencies[:, 0]
+        output_weights = np.zeros(poles.shape + (3,))
+        if filter_type == 'bandpass':
+            output_weights[..., 1] = 1
+        else:
+            output_weights[..., 0] = (center_frequencies / natural_frequencies) ** 2
+            output_weights[..., 2] = 1
+    else:
+        raise ValueError(f"Unknown type of filter: {filter_type}")
+
+    # Notation is from "The Art of VA Filter Design" by V. Zavalishin.
+    gains = natural_frequencies / 4
+    coefs = 1 / (1 + gains * (gains + dampings))
+    sections = np.zeros(poles.shape + (9,))
+    sections[..., 0] = 2 * coefs - 1
+    sections[..., 1] = -2 * gains * coefs
+    sections[..., 2] = 2 * gains * coefs
+    sections[..., 3] = 1 - 2 * gains ** 2 * coefs
+    sections[..., 4] = 2 * gains * coefs
+    sections[..., 5] = 2 * gains ** 2 * coefs
+    # Band-pass output is `coef * (gain * input + first_state - gain * second_state)`,
+    # low-pass output is `second_state + gain * band-pass output`, and high-pass output is
+    # `input - damping * band-pass output - low-pass output`.
+    lowpass_weights = output_weights[..., 0] - output_weights[..., 2]
+    bandpass_weights = (
+        output_weights[..., 1] - dampings * output_weights[..., 2] + gains * lowpass_weights
+    )
+    sections[..., 6] = coefs * bandpass_weights
+    sections[..., 7] = -gains * coefs * bandpass_weights + lowpass_weights
+    sections[..., 8] = gains * coefs * bandpass_weights + output_weights[..., 2]
+    if has_real_pole and filter_type in ['lowpass', 'highpass']:
+        # The last section is one-pole filter, so its second state is not used.
+        one_pole_coefs = gains[:, -1] / (1 + gains[:, -1])
+        sign = 1 if filter_type == 'lowpass' else -1
+        sections[:, -1] = 0
+        sections[:, -1, 0] = 1 - 2 * one_pole_coefs
+        sections[:, -1, 4] = 2 * one_pole_coefs
+        sections[:, -1, 6] = sign * (1 - one_pole_coefs)
+        sections[:, -1, 8] = one_pole_coefs if filter_type == 'lowpass' else 1 - one_pole_coefs
+    if filter_type == 'bandpass':
+        # Sections have unit gain at centers of the bands.
+        center_angles = 2 * np.arctan(center_frequencies[:, 0] / 4)
+        responses = compute_state_space_response(sections, center_angles)
+        sections[..., 6:] /= np.abs(responses)[..., None]
+    return sections
+
+
+def compute_state_space_response(sections: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """
+    Compute frequency responses of sections defined as state space models with two states.
+
+    :param sections:
+        state space models of sections as array of shape (n_filters, n_sections, 9)
+        (see `design_state_variable_butterworth_filters` function)
+    :param angles:
+        frequencies (in radians per frame) as array of shape (n_filters,)
+    :return:
+        complex frequency responses as array of shape (n_filters, n_sections)
+    """
+    z = np.exp(1j * angles)[:, None]
+    transition_matrices = sections[..., :4]
+    # Inverse of `z * I - transition_matrix` multiplied by its determinant.
+    adjugate = np.stack((
+        z - transition_matrices[..., 3], transition_matrices[..., 1],
+        transition_matrices[..., 2], z - transition_matrices[..., 0]
+    ), axis=-1).reshape(sections.shape[:2] + (2, 2))
+    determinants = (
+        (z - transition_matrices[..., 0]) * (z - transition_matrices[..., 3])
+        - transition_matrices[..., 1] * transition_matrices[..., 2]
+    )
+    responses = sections[..., 8] + np.einsum(
+        '...i,...ij,...j->...', sections[..., 6:8], adjugate, sections[..., 4:6]
+    ) / determinants
+    return responses
+
+
+def get_filter_designs_stats() -> dict[str, dict[str, int]]:
+    """
+    Get statistics of filter designs caching.
+
+    :return:
+        numbers of cache hits, cache misses, and cached designs for each kind of filters
+    """
+    stats = {}
+    name_to_fn = {
+        'fir': design_cached_fir_filter,
+        'butterworth': design_cached_butterworth_filter,
+    }
+    for name, fn in name_to_fn.items():
+        cache_info = fn.cache_info()
+        stats[name] = {
+            'hits': cache_info.hits,
+            'misses': cache_info.misses,
+            'size': cache_info.currsize,
+        }
+    return stats
+
+
+def quantize_frequency(frequency: float, quantization_step: Optional[float]) -> float:
+    """
+    Round frequency to the nearest node of a logarithmic grid.
+
+    Quantization makes filter designs that depend on pitch or velocity of notes
+    reusable by many notes.
+
+    :param frequency:
+        frequency (in Hz)
+    :param quantization_step:
+        step of grid (in cents); if it is `None`, frequency is returned as is
+    :return:
+        quantized frequency (in Hz)
+    """
+    if quantization_step is None or frequency <= 0:
+        return frequency
+    n_steps = round(1200 * log2(frequency) / quantization_step)
+    return 2 ** (n_steps * quantization_step / 1200)
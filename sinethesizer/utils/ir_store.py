@@ -0,0 +1,125 @@
+"""
+Store impulse responses and spectra of long kernels on disk.
+
+Generation of impulse responses (IRs) and their Fourier transforms is repeated for every track
+even if all tracks have the same rooms. If a store is enabled, such arrays are saved to disk
+once and then they are memory-mapped by all runs and all processes.
+
+Author: Nikolay Lysenko
+"""
+
+
+import contextlib
+import hashlib
+import os
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+
+# Currently enabled store (if any).
+IR_STORE_STATE = {'store': None}
+
+
+class ImpulseResponseStore:
+    """
+    Persistent store of impulse responses and spectra of long kernels.
+
+    Arrays are stored as `.npy` files in the directory `store_dir`, where name of a file is
+    a hash of parameters that define the array. Both found and generated arrays are returned
+    memory-mapped, so they are read from disk only when they are used and the store itself
+    keeps no references to them.
+
+    :param store_dir:
+        path to directory with stored arrays
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, generate_fn: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Load array from the store or generate it and save it to the store.
+
+        :param key:
+            parameters that define the array; their `repr` must not depend on the process
+        :param generate_fn:
+            function without arguments that generates the array
+        :return:
+            array that must not be modified by a caller
+        """
+        file_name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest() + '.npy'
+        file_path = os.path.join(self.store_dir, file_name)
+        if os.path.isfile(file_path):
+            self.hits += 1
+        else:
+            self.misses += 1
+            array = generate_fn()
+            os.makedirs(self.store_dir, exist_ok=True)
+            tmp_file_path = f'{file_path}.{os.getpid()}.tmp'
+            with open(tmp_file_path, 'wb') as tmp_file:
+                np.save(tmp_file, array)
+            os.replace(tmp_file_path, file_path)  # Other processes never see incomplete files.
+        return np.load(file_path, mmap_mode='r')
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get statistics of store usage.
+
+        :return:
+            numbers of hits (i.e., arrays loaded from disk) and
+            misses (i.e., generated arrays)
+        """
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+@contextlib.contextmanager
+def enable_ir_store(store: ImpulseResponseStore) -> Iterator[ImpulseResponseStore]:
+    """
+    Use store for all impulse responses and spectra of long kernels within the context.
+
+    :param store:
+        store to be used
+    :return:
+        context manager that yields the store
+    """
+    previous_store = IR_STORE_STATE['store']
+    IR_STORE_STATE['store'] = store
+    try:
+        yield store
+    finally:
+        IR_STORE_STATE['store'] = previous_store
+
+
+def load_or_generate(key: tuple, generate_fn: Callable[[], np.ndarray]) -> np.ndarray:
+    """
+    Get array from the enabled store or generate it if no store is enabled.
+
+    :param key:
+        parameters that define the array; their `repr` must not depend on the process
+    :param generate_fn:
+        function without arguments that generates the array
+    :return:
+        array that must not be modified by a caller
+    """
+    store: Optional[ImpulseResponseStore] = IR_STORE_STATE['store']
+    if store is None:
+        return generate_fn()
+    return store.get(key, generate_fn)
+
+
+def create_ir_store(settings: dict[str, Any]) -> Optional[ImpulseResponseStore]:
+    """
+    Create persistent store of impulse responses if it is requested by settings.
+
+    :param settings:
+        global settings for the output track
+    :return:
+        store or `None` if 'ir_store_dir' is not set
+    """
+    store_dir = settings.get('ir_store_dir')
+    if store_dir is None:
+        return None
+    return ImpulseResponseStore(store_dir)
@@ -5,11 +5,38 @@ Author: Nikolay Lysenko
 """
 
 
+import contextlib
 import functools
+from typing import Iterator, Optional
 
 import numpy as np
 
 
+# Pseudo-random numbers generator of the sound that is being synthesized (if any);
+# effects that rely on pseudo-random numbers and have no explicit seeds draw seeds from it.
+EFFECTS_RANDOM_STATE = {'generator': None}
+
+
+@contextlib.contextmanager
+def enable_effects_random_generator(
+        random_generator: Optional[np.random.Generator]
+) -> Iterator[Optional[np.random.Generator]]:
+    """
+    Use pseudo-random numbers generator for all effects within the context.
+
+    :param random_generator:
+        generator to be used
+    :return:
+        context manager that yields the generator
+    """
+    previous_generator = EFFECTS_RANDOM_STATE['generator']
+    EFFECTS_RANDOM_STATE['generator'] = random_generator
+    try:
+        yield random_generator
+    finally:
+        EFFECTS_RANDOM_STATE['generator'] = previous_generator
+
+
 def mix_with_original_sound(fn):
     """
     Add support of argument named `original_sound_weight`.
@@ -39,10 +66,29 @@ def mix_with_original_sound(fn):
     return wrapper
 
 
+def convert_to_stereo(sound: np.ndarray) -> np.ndarray:
+    """
+    Make stereo sound from mono sound.
+
+    Sounds are synthesized with one channel until an effect that makes channels different
+    (e.g., panning or reverb) is applied, because processing of identical channels is redundant.
+
+    :param sound:
+        sound as array of shape (n_channels, n_frames) where `n_channels` is 1 or 2
+    :return:
+        sound with two channels
+    """
+    if sound.shape[0] == 2:
+        return sound
+    return np.vstack((sound, sound))
+
+
 def sum_two_sounds(first_sound: np.ndarray, second_sound: np.ndarray) -> np.ndarray:
     """
     Sum two sounds of probably unequal durations.
 
+    If one sound is mono and another one is stereo, the result is stereo.
+
     :param first_sound:
         first sound as array of shape (n_channels, n_frames)
     :param second_sound:
@@ -53,9 +99,67 @@ def sum_two_sounds(first_sound: np.ndarray, second_sound: np.ndarray) -> np.ndar
     first_n_frames = first_sound.shape[1]
     second_n_frames = second_sound.shape[1]
     n_extra_frames = abs(first_n_frames - second_n_frames)
-    padding = np.zeros((first_sound.shape[0], n_extra_frames))
     if first_n_frames > second_n_frames:
+        padding = np.zeros((second_sound.shape[0], n_extra_frames), dtype=second_sound.dtype)
         second_sound = np.hstack((second_sound, padding))
     elif first_n_frames < second_n_frames:
+        padding = np.zeros((first_sound.shape[0], n_extra_frames), dtype=first_sound.dtype)
         first_sound = np.hstack((first_sound, padding))
     return first_sound + second_sound
+
+
+class SoundAccumulator:
+    """
+    Buffer that sums up sounds of probably unequal durations in place.
+
+    Unlike repeated calls of `sum_two_sounds`, adding a sound does not create new arrays unless
+    the buffer is too short or has too few channels. Short buffer is grown geometrically,
+    so the number of reallocations is logarithmic in total duration.
+
+    :param n_frames:
+        initial size of buffer (in frames); pass expected duration of the sum if it is known
+    :param dtype:
+        data type of the sum
+    :param n_channels:
+        initial number of channels
+    """
+
+    def __init__(self, n_frames: int = 0, dtype: str = 'float64', n_channels: int = 1):
+        self.buffer = np.zeros((n_channels, n_frames), dtype=dtype)
+        self.n_frames = 0
+        self.n_reallocations = 0
+
+    def add(self, sound: np.ndarray, start_frame: int = 0) -> None:
+        """
+        Add sound to the sum.
+
+        :param sound:
+            mono or stereo sound; if it is stereo, the sum becomes stereo
+        :param start_frame:
+            index of frame of the sum where the sound starts
+        :return:
+            None
+        """
+        end_frame = start_frame + sound.shape[1]
+        n_channels = max(self.buffer.shape[0], sound.shape[0])
+        if end_frame > self.buffer.shape[1] or n_channels > self.buffer.shape[0]:
+            buffer_size = self.buffer.shape[1]
+            if end_frame > buffer_size:
+                buffer_size = max(end_frame, 2 * buffer_size)
+            buffer = np.zeros((n_channels, buffer_size), dtype=self.buffer.dtype)
+            buffer[:, :self.n_frames] = self.buffer[:, :self.n_frames]
+            self.buffer = buffer
+            self.n_reallocations += 1
+        target = self.buffer[:, start_frame:end_frame]
+        np.add(target, sound, out=target)
+        self.n_frames = max(self.n_frames, end_frame)
+
+    def get_sound(self) -> np.ndarray:
+        """
+        Get the sum of all added sounds.
+
+        :return:
+            view of the buffer with all frames of added sounds;
+            it is mono if all added sounds are mono
+        """
+        return self.buffer[:, :self.n_frames]
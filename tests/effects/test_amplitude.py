@@ -11,11 +11,79 @@ import numpy as np
 import pytest
 
 from sinethesizer.effects.amplitude import (
-    apply_amplitude_normalization, apply_compressor, apply_envelope_shaper
+    apply_amplitude_normalization, apply_compressor, apply_envelope_shaper,
+    compute_amplitude_quantile, compute_amplitude_quantiles_of_chunks, compute_chunks_bounds,
+    interpolate_between_chunks_bounds
 )
 from sinethesizer.synth.core import Event
 
 
+@pytest.mark.parametrize(
+    "n_frames, n_chunks",
+    [
+        (10, 3),
+        (12, 4),
+        (7, 7),
+        (100, 9),
+    ]
+)
+def test_compute_chunks_bounds(n_frames: int, n_chunks: int) -> None:
+    """Test that `compute_chunks_bounds` function is consistent with `np.array_split`."""
+    result = compute_chunks_bounds(n_frames, n_chunks)
+    chunks = np.array_split(np.arange(n_frames), n_chunks)
+    expected = np.cumsum([0] + [len(chunk) for chunk in chunks])
+    np.testing.assert_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "n_channels, n_frames, n_chunks, quantile",
+    [
+        (1, 10, 3, 1),
+        (1, 101, 7, 0.9),
+        (2, 101, 7, 0.5),
+        (2, 96, 8, 0.99),
+    ]
+)
+def test_compute_amplitude_quantiles_of_chunks(
+        n_channels: int, n_frames: int, n_chunks: int, quantile: float
+) -> None:
+    """Test that `compute_amplitude_quantiles_of_chunks` processes chunks independently."""
+    sound = np.random.default_rng(n_frames).normal(size=(n_channels, n_frames))
+    chunks_bounds = compute_chunks_bounds(n_frames, n_chunks)
+    result = compute_amplitude_quantiles_of_chunks(sound, quantile, chunks_bounds)
+    expected = [
+        compute_amplitude_quantile(chunk, quantile)
+        for chunk in np.array_split(sound, n_chunks, axis=1)
+    ]
+    np.testing.assert_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "chunks_bounds, initial_value, values, expected",
+    [
+        (
+            np.array([0, 3, 5]),
+            0,
+            np.array([3, 1]),
+            np.array([0, 1, 2, 3, 2]),
+        ),
+        (
+            np.array([0, 2, 4, 6]),
+            1,
+            np.array([1, 0.5, 0.5]),
+            np.array([1, 1, 1, 0.75, 0.5, 0.5]),
+        ),
+    ]
+)
+def test_interpolate_between_chunks_bounds(
+        chunks_bounds: np.ndarray, initial_value: float, values: np.ndarray,
+        expected: np.ndarray
+) -> None:
+    """Test `interpolate_between_chunks_bounds` function."""
+    result = interpolate_between_chunks_bounds(chunks_bounds, initial_value, values)
+    np.testing.assert_almost_equal(result, expected)
+
+
 @pytest.mark.parametrize(
     "sound, velocity, value_at_max_velocity, quantile, "
     "value_on_velocity_order, value_at_zero_velocity, expected",
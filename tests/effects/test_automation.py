@@ -11,7 +11,13 @@ import numpy as np
 import pytest
 from scipy.signal import spectrogram
 
-from sinethesizer.effects.automation import apply_automated_effect
+from sinethesizer.effects.automation import (
+    REGISTRY_OF_AUTOMATABLE_EFFECTS,
+    apply_automated_effect,
+    apply_effect_to_spans,
+    compute_automated_effect_tail,
+    split_effects_params,
+)
 from sinethesizer.synth.core import Event
 from sinethesizer.oscillators import generate_mono_wave
 
@@ -128,40 +134,40 @@ def test_apply_automated_effect(
                     0,
                     5,
                     np.array([
-                        0.0002183, 0.0004449, 0.0007268, 0.0013604, 0.0075382,
-                        0.0220401, 0.0224595, 0.0227577, 0.0230772, 0.0232628,
-                        0.0234817, 0.0234934, 0.0235646, 0.0234514, 0.0235033,
-                        0.0230645, 0.0231514, 0.0225386, 0.0227911, 0.0221979
+                        0.0002042, 0.000465, 0.0006759, 0.0013215, 0.0075896,
+                        0.0219885, 0.0224523, 0.0227586, 0.0230731, 0.0232697,
+                        0.02348, 0.0234932, 0.0235637, 0.0234487, 0.0235036,
+                        0.0230645, 0.0231515, 0.0225389, 0.0227907, 0.0221977
                     ])
                 ),
                 (
                     26,
                     31,
                     np.array([
-                        0.0004725, 0.0246534, 0.0265909, 0.0265413, 0.0278156,
-                        0.0287562, .028847, 0.029115, 0.0292235, 0.029249,
-                        0.029214, 0.0290024, 0.028756, 0.0284386, 0.028084,
-                        0.0279104, 0.0273389, 0.0269038, 0.027062, 0.0250446
+                        0.0004683, 0.0245439, 0.0263431, 0.0261689, 0.0276406,
+                        0.0287956, 0.0288946, 0.0291629, 0.0292702, 0.0292968,
+                        0.0292723, 0.0291061, 0.0289185, 0.0286566, 0.0283626,
+                        0.0282208, 0.0276675, 0.0271636, 0.0273043, 0.0251784
                     ])
                 ),
                 (
                     52,
                     57,
                     np.array([
-                        0.0001076, 0.025058, 0.028553, 0.0278598, 0.0256236,
-                        0.023996, 0.0231824, 0.0225178, 0.0217181, 0.0207106,
-                        0.0187084, 0.0133343, 0.0081357, 0.0041491, 0.0015651,
-                        0.0004121, 0.0002923, 0.0002912, 0.000276, 0.0002442
+                        0.0001083, 0.0250707, 0.0285853, 0.0279093, 0.025681,
+                        0.0240717, 0.023285, 0.0226332, 0.0218373, 0.020841,
+                        0.0188702, 0.0135513, 0.0083806, 0.0043795, 0.001737,
+                        0.000513, 0.0003878, 0.0003907, 0.0003631, 0.0002867
                     ])
                 ),
                 (
                     107,
                     112,
                     np.array([
-                        0.0016849, 0.0218725, 0.0187567, 0.0202654, 0.0068659,
-                        0.00134, 0.0008968, 0.0004696, 0.0002146, 0.000099,
-                        0.0000694, 0.0000482, 0.0000291, 0.0000162, 0.0000067,
-                        0.00000213, 0.0000009, 0.0000004, 0.0000001, 0.00000006
+                        0.0016995, 0.0218854, 0.0187625, 0.0202396, 0.0068391,
+                        0.0012968, 0.0008717, 0.0004638, 0.0002246, 0.0001024,
+                        0.0000693, 0.0000470, 0.0000293, 0.0000165, 0.0000073,
+                        0.0000025, 0.0000010, 0.0000004, 0.0000002, 0.0000001
                     ])
                 ),
             ]
@@ -200,3 +206,356 @@ def test_apply_automated_effect_with_spectrogram_checks(
         spc_slice = spc[:len(expected_distribution), start_segment:end_segment]
         result = spc_slice.sum(axis=1)
         np.testing.assert_almost_equal(result, expected_distribution)
+
+
+@pytest.mark.parametrize(
+    "automated_effect_name, effect_params",
+    [
+        ('equalizer', {'breakpoint_frequencies': [300, 1000], 'gains': [1, 0.2]}),
+        ('overdrive', {'fraction_to_clip': 0.2, 'strength': 0.5}),
+        ('panning', {'left_amplitude_ratio': 0.5, 'right_amplitude_ratio': 0.9}),
+        ('tremolo', {'frequency': 7, 'amplitude': 0.3}),
+        ('tremolo', {'kind': 'relative', 'frequency_ratio': 0.01}),
+    ]
+)
+def test_apply_automated_effect_with_constant_params(
+        automated_effect_name: str, effect_params: dict[str, Any]
+) -> None:
+    """Test that natively automated effects with constant parameters are usual effects."""
+    sound = np.random.default_rng(0).normal(size=(2, 3000))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=0.3, frequency=220,
+        velocity=1, effects='', frame_rate=10000
+    )
+    break_points = [
+        {'relative_position': relative_position, **effect_params}
+        for relative_position in [0, 0.3, 1]
+    ]
+    result = apply_automated_effect(sound.copy(), event, automated_effect_name, break_points)
+    effect_fn = REGISTRY_OF_AUTOMATABLE_EFFECTS[automated_effect_name]
+    expected = effect_fn(sound.copy(), event, **effect_params)
+    np.testing.assert_almost_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "left_amplitude_ratios, right_amplitude_ratios",
+    [
+        ([0.5, 1, 0.2], [1, 0.3, 0.8]),
+        ([0, 1, 1], [1, 1, 0]),
+    ]
+)
+def test_apply_automated_panning_with_varying_params(
+        left_amplitude_ratios: list[float], right_amplitude_ratios: list[float]
+) -> None:
+    """Test that natively automated panning matches cross-faded spans of sound."""
+    sound = np.random.default_rng(0).normal(size=(2, 3000))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=0.3, frequency=220,
+        velocity=1, effects='', frame_rate=10000
+    )
+    effects_params = [
+        {'left_amplitude_ratio': left, 'right_amplitude_ratio': right}
+        for left, right in zip(left_amplitude_ratios, right_amplitude_ratios)
+    ]
+    break_points = [
+        {'relative_position': relative_position, **effect_params}
+        for relative_position, effect_params in zip([0, 0.3, 1], effects_params)
+    ]
+    result = apply_automated_effect(sound.copy(), event, 'panning', break_points)
+    expected = apply_effect_to_spans(
+        sound.copy(), event, 'panning', [0, 900, 3000], effects_params
+    )
+    np.testing.assert_almost_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "frequencies, amplitudes",
+    [
+        ([7, 7, 7], [0.1, 0.6, 0.3]),
+        ([3, 20, 5], [0.5, 0.5, 0.5]),
+        ([3, 20, 5], [0.2, 0.9, 0.4]),
+    ]
+)
+def test_apply_automated_tremolo_with_varying_params(
+        frequencies: list[float], amplitudes: list[float]
+) -> None:
+    """Test that natively automated tremolo modulates volume within interpolated amplitude."""
+    sound = np.random.default_rng(0).normal(size=(2, 3000))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=0.3, frequency=220,
+        velocity=1, effects='', frame_rate=10000
+    )
+    break_points = [
+        {'relative_position': relative_position, 'frequency': frequency, 'amplitude': amplitude}
+        for relative_position, frequency, amplitude in zip([0, 0.3, 1], frequencies, amplitudes)
+    ]
+    result = apply_automated_effect(sound.copy(), event, 'tremolo', break_points)
+    amplitude_curve = np.interp(np.arange(3000), [0, 900, 3000], amplitudes)
+    volume_deviations = result / sound - 1
+    np.testing.assert_almost_equal(volume_deviations[0], volume_deviations[1])
+    assert np.all(np.abs(volume_deviations[0]) <= amplitude_curve + 1e-9)
+    # Number of zero crossings of volume deviations is defined by integral of frequency.
+    n_zero_crossings = np.sum(np.diff(np.sign(volume_deviations[0])) != 0)
+    n_periods = np.sum(np.interp(np.arange(3000), [0, 900, 3000], frequencies)) / 10000
+    assert abs(n_zero_crossings - 2 * n_periods) <= 1
+
+
+@pytest.mark.parametrize(
+    "fractions_to_clip, strengths",
+    [
+        ([0.1, 0.1, 0.1], [0.1, 0.3, 0.2]),
+        ([0.01, 0.5, 0.2], [0.3, 0.3, 0.3]),
+        ([0.01, 0.5, 0.2], [0.3, 0.1, 0.2]),
+    ]
+)
+def test_apply_automated_overdrive_with_varying_params(
+        fractions_to_clip: list[float], strengths: list[float]
+) -> None:
+    """Test that natively automated overdrive is bounded by thresholds of break points."""
+    sound = np.random.default_rng(0).normal(size=(2, 3000))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=0.3, frequency=220,
+        velocity=1, effects='', frame_rate=10000
+    )
+    break_points = [
+        {
+            'relative_position': relative_position,
+            'fraction_to_clip': fraction,
+            'strength': strength,
+        }
+        for relative_position, fraction, strength in zip([0, 0.3, 1], fractions_to_clip, strengths)
+    ]
+    result = apply_automated_effect(sound.copy(), event, 'overdrive', break_points)
+    for index, fraction, strength in zip([0, 900], fractions_to_clip, strengths):
+        expected = REGISTRY_OF_AUTOMATABLE_EFFECTS['overdrive'](
+            sound.copy(), event, fraction, strength
+        )
+        np.testing.assert_almost_equal(result[:, index], expected[:, index])
+    thresholds = np.quantile(np.abs(sound), 1 - min(fractions_to_clip), axis=1)
+    assert np.all(np.abs(result) <= thresholds.reshape((-1, 1)) + 1e-9)
+    assert np.all(np.sign(result) == np.sign(sound))
+
+
+@pytest.mark.parametrize(
+    "break_points_params, kwargs",
+    [
+        ([{'max_frequency': 500}, {'max_frequency': 4000}], {}),
+        (
+            [
+                {'min_frequency': 300, 'max_frequency': 500},
+                {'min_frequency': 3000, 'max_frequency': 4000},
+            ],
+            {}
+        ),
+        ([{'max_frequency': 500}, {'max_frequency': 4000}], {'order': 4}),
+        (
+            [{'max_frequency_ratio': 1}, {'max_frequency_ratio': 10}],
+            {'kind': 'relative', 'order': 10}
+        ),
+    ]
+)
+def test_apply_automated_filter_with_varying_params(
+        break_points_params: list[dict[str, float]], kwargs: dict[str, Any]
+) -> None:
+    """Test that automated filter is bounded by filters of break points."""
+    sound = np.random.default_rng(0).normal(0, 0.3, size=(2, 44100))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=1, frequency=440,
+        velocity=1, effects='', frame_rate=44100
+    )
+    break_points = [
+        {'relative_position': relative_position, **params}
+        for relative_position, params in zip([0, 1], break_points_params)
+    ]
+    result = apply_automated_effect(sound.copy(), event, 'filter', break_points, **kwargs)
+    effect_fn = REGISTRY_OF_AUTOMATABLE_EFFECTS['filter']
+    max_peak = max(
+        np.max(np.abs(effect_fn(sound.copy(), event, **params, **kwargs)))
+        for params in break_points_params
+    )
+    assert np.max(np.abs(result)) <= max_peak
+
+
+@pytest.mark.parametrize(
+    "first_params, second_params, kwargs",
+    [
+        ({'max_frequency': 500}, {'max_frequency': 4000}, {}),
+        (
+            {'min_frequency': 300, 'max_frequency': 500},
+            {'min_frequency': 3000, 'max_frequency': 4000},
+            {'invert': True, 'order': 10}
+        ),
+        (
+            {'min_frequency': None, 'max_frequency': 1000},
+            {'min_frequency': 500, 'max_frequency': None},
+            {}
+        ),
+        ({'max_frequency_ratio': 1}, {'max_frequency_ratio': 10}, {'kind': 'relative'}),
+    ]
+)
+def test_apply_automated_filter_at_break_points(
+        first_params: dict[str, Any], second_params: dict[str, Any], kwargs: dict[str, Any]
+) -> None:
+    """Test that automated filter matches static filters where cutoffs do not change."""
+    frame_rate = 44100
+    sound = np.random.default_rng(0).normal(0, 0.3, size=(2, frame_rate))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=1, frequency=440,
+        velocity=1, effects='', frame_rate=frame_rate
+    )
+    break_points = [
+        {'relative_position': 0, **first_params},
+        {'relative_position': 0.5, **first_params},
+        {'relative_position': 0.75, **second_params},
+        {'relative_position': 1, **second_params},
+    ]
+    result = apply_automated_effect(sound.copy(), event, 'filter', break_points, **kwargs)
+    effect_fn = REGISTRY_OF_AUTOMATABLE_EFFECTS['filter']
+    first_expected = effect_fn(sound.copy(), event, **first_params, **kwargs)
+    np.testing.assert_allclose(
+        result[:, :frame_rate // 2], first_expected[:, :frame_rate // 2], atol=1e-4
+    )
+    # Transient response to changes of cutoffs fades out soon.
+    second_expected = effect_fn(sound.copy(), event, **second_params, **kwargs)
+    start = int(0.85 * frame_rate)
+    np.testing.assert_allclose(result[:, start:], second_expected[:, start:], atol=1e-4)
+
+
+def test_apply_automated_effect_with_duplicated_params() -> None:
+    """Test that parameters can not be set both at break points and for the whole effect."""
+    sound = np.ones((2, 100))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=1, frequency=440,
+        velocity=1, effects='', frame_rate=100
+    )
+    break_points = [
+        {'relative_position': 0, 'max_frequency': 10, 'order': 2},
+        {'relative_position': 1, 'max_frequency': 20, 'order': 2},
+    ]
+    with pytest.raises(ValueError, match="both at break points and for the whole effect"):
+        apply_automated_effect(sound, event, 'filter', break_points, order=3)
+
+
+@pytest.mark.parametrize(
+    "automated_effect_name, break_points, kwargs, expected",
+    [
+        (
+            # `automated_effect_name`
+            'stereo_delay',
+            # `break_points`
+            [
+                {'relative_position': 0, 'delay': 0.01},
+                {'relative_position': 0.5, 'delay': -0.03},
+                {'relative_position': 1, 'delay': 0.02},
+            ],
+            # `kwargs`
+            {},
+            # `expected`
+            300
+        ),
+        (
+            # `automated_effect_name`
+            'artificial_reverb',
+            # `break_points`
+            [
+                {'relative_position': 0, 'decay_duration': 0.5},
+                {'relative_position': 1, 'decay_duration': 0.6},
+            ],
+            # `kwargs`
+            {'first_reflection_delay': 0.1},
+            # `expected`
+            6999
+        ),
+        (
+            # `automated_effect_name`
+            'panning',
+            # `break_points`
+            [
+                {'relative_position': 0, 'left_amplitude_ratio': 0.5},
+                {'relative_position': 1, 'left_amplitude_ratio': 1},
+            ],
+            # `kwargs`
+            {'right_amplitude_ratio': 1},
+            # `expected`
+            0
+        ),
+    ]
+)
+def test_apply_automated_effect_with_tail(
+        automated_effect_name: str, break_points: list[dict[str, Any]],
+        kwargs: dict[str, Any], expected: int
+) -> None:
+    """Test that tails of automated effects are kept and computed correctly."""
+    sound = np.random.default_rng(0).normal(size=(2, 2000))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=0.2, frequency=220,
+        velocity=1, effects='', frame_rate=10000
+    )
+    tail = compute_automated_effect_tail(event, automated_effect_name, break_points, **kwargs)
+    assert tail == expected
+    result = apply_automated_effect(sound, event, automated_effect_name, break_points, **kwargs)
+    assert result.shape == (2, sound.shape[1] + tail)
+
+
+@pytest.mark.parametrize(
+    "effects_params, varying_params_names, expected",
+    [
+        (
+            # `effects_params`
+            [
+                {'kind': 'relative', 'frequency_ratio': 0.1, 'amplitude': 0.5},
+                {'kind': 'relative', 'frequency_ratio': 0.2, 'amplitude': 0.4},
+            ],
+            # `varying_params_names`
+            ('frequency_ratio', 'amplitude'),
+            # `expected`
+            (
+                [
+                    {'frequency_ratio': 0.1, 'amplitude': 0.5},
+                    {'frequency_ratio': 0.2, 'amplitude': 0.4},
+                ],
+                {'kind': 'relative'}
+            )
+        ),
+        (
+            # `effects_params`
+            [
+                {'frequency': 5, 'waveform': 'sine'},
+                {'frequency': 6, 'waveform': 'square'},
+            ],
+            # `varying_params_names`
+            ('frequency', 'amplitude'),
+            # `expected`
+            ([], None)
+        ),
+        (
+            # `effects_params`
+            [
+                {'frequency': 5},
+                {'frequency': 6, 'amplitude': 0.4},
+            ],
+            # `varying_params_names`
+            ('frequency', 'amplitude'),
+            # `expected`
+            ([], None)
+        ),
+        (
+            # `effects_params`
+            [
+                {'kind': 'absolute_wrt_velocity', 'min_frequency_at_zero_velocity': 100},
+                {'kind': 'absolute_wrt_velocity', 'min_frequency_at_zero_velocity': 100},
+            ],
+            # `varying_params_names`
+            ('min_frequency', 'max_frequency'),
+            # `expected`
+            ([], None)
+        ),
+    ]
+)
+def test_split_effects_params(
+        effects_params: list[dict[str, Any]], varying_params_names: tuple[str, ...],
+        expected: tuple[list[dict[str, Any]], Any]
+) -> None:
+    """Test `split_effects_params` function."""
+    result = split_effects_params(effects_params, varying_params_names)
+    assert result == expected
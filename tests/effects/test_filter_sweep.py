@@ -9,14 +9,19 @@ from typing import Any, Optional
 
 import numpy as np
 import pytest
-from scipy.signal import spectrogram
+from scipy.signal import butter, sosfilt, spectrogram
+
+from sinethesizer.effects.filter import apply_frequency_filter
 
 from sinethesizer.effects.filter_sweep import (
     apply_filter_sweep,
     apply_phaser,
-    oscillate_between_sounds,
+    filter_with_varying_sections,
+    interpolate_cutoff_frequencies,
+    propagate_states_through_blocks,
 )
 from sinethesizer.synth.core import Event
+from sinethesizer.utils.filter_design import design_state_variable_butterworth_filters
 from sinethesizer.oscillators import generate_mono_wave
 
 
@@ -50,8 +55,8 @@ from sinethesizer.oscillators import generate_mono_wave
             # for frequencies 0, 100, 200, ..., 900 respectively.
             np.array(
                 [
-                    0.0062106, 0.0158941, 0.3569285, 0.0214838, 0.3588611,
-                    0.0213496, 0.5185554, 0.013971, 0.0096646, 0.005742
+                    0.0064401, 0.0247455, 0.4013039, 0.0435522, 0.3885529,
+                    0.0270197, 0.5196183, 0.0142286, 0.0097517, 0.0057607
                 ]
             )
         ),
@@ -81,8 +86,8 @@ from sinethesizer.oscillators import generate_mono_wave
             # for frequencies 0, 100, 200, ..., 900 respectively.
             np.array(
                 [
-                    0.0059891, 0.0137329, 0.2025266, 0.0194084, 0.5194071,
-                    0.0212887, 0.5202222, 0.014996, 0.0102818, 0.0060186
+                    0.0069821, 0.0260273, 0.290624, 0.0253466, 0.5234455,
+                    0.0220951, 0.5208955, 0.0151843, 0.0103389, 0.0060466
                 ]
             )
         ),
@@ -112,8 +117,8 @@ from sinethesizer.oscillators import generate_mono_wave
             # for frequencies 0, 100, 200, ..., 900 respectively.
             np.array(
                 [
-                    0.0013472, 0.0030189, 0.0034677, 0.0040487, 0.1909366,
-                    0.0037583, 0.0027628, 0.0018015, 0.0009691, 0.0004051
+                    0.0013666, 0.0008645, 0.0011315, 0.003119, 0.1565247,
+                    0.0252527, 0.0052621, 0.0019297, 0.0006875, 0.0001999
                 ]
             )
         ),
@@ -209,90 +214,210 @@ def test_apply_phaser(frequency: float, frame_rate: int, kind: str) -> None:
 
 
 @pytest.mark.parametrize(
-    "sounds, frame_rate, frequency, phase, waveform, expected",
+    "bands, invert, order",
     [
-        (
-            # `sounds`
-            np.array(
-                [
-                    [[1, 2, 3, 4, 5, 6, 7, 8]],
-                    [[-1, -2, -3, -4, -5, -6, -7, -8]]
-                ]
-            ),
-            # `frame_rate`
-            4,
-            # `frequency`
-            1,
-            # `phase`
-            0.0,
-            # `waveform`
-            'sine',
-            # `expected`
-            np.array([[0, -2, 0, 4, 0, -6, 0, 8]])
-        ),
-        (
-            # `sounds`
-            np.array(
-                [
-                    [[1, 2, 3, 4, 5, 6, 7, 8]],
-                    [[-1, -1, -1, -1, -1, -1, -1, -1]],
-                    [[-2, -2, -2, -2, -2, -2, -2, -2]],
-                    [[11, 12, 13, 14, 15, 16, 17, 18]],
-                ]
-            ),
-            # `frame_rate`
-            4,
-            # `frequency`
-            0.5,
-            # `phase`
-            0.0,
-            # `waveform`
-            'raw_triangle',
-            # `expected`
-            np.array([[1, -0.25, -1.5, 2, 15, 2.5, -1.5, 1.25]])
-        ),
-        (
-            # `sounds`
-            np.array(
-                [
-                    [
-                        [1, 2, 3, 4, 5, 6, 7, 8],
-                        [1, 2, 3, 4, 5, 6, 7, 8]
-                    ],
-                    [
-                        [-1, -1, -1, -1, -1, -1, -1, -1],
-                        [-1, -1, -1, -1, -1, -1, -1, -1]
-                    ],
-                    [
-                        [-2, -2, -2, -2, -2, -2, -2, -2],
-                        [-2, -2, -2, -2, -2, -2, -2, -2]
-                    ],
-                    [
-                        [11, 12, 13, 14, 15, 16, 17, 18],
-                        [11, 12, 13, 14, 15, 16, 17, 18]
-                    ],
-                ]
-            ),
-            # `frame_rate`
-            4,
-            # `frequency`
-            0.5,
-            # `phase`
-            0.0,
-            # `waveform`
-            'raw_triangle',
-            # `expected`
-            np.array([
-                [1, -0.25, -1.5, 2, 15, 2.5, -1.5, 1.25],
-                [1, -0.25, -1.5, 2, 15, 2.5, -1.5, 1.25]
-            ])
-        ),
+        ([(300, 500), (3000, 4000)], False, 25),
+        ([(300, 500), (3000, 4000)], True, 25),
+        ([(100, 500), (100, 4000)], False, 25),
+        ([(None, 500), (None, 4000)], False, 25),
+        ([(880, 5500), (1760, 2750), (1980, 2420)], False, 3),
+        ([(20, 40), (8000, 9000)], True, 25),
+        ([(None, 1000), (500, None)], False, 25),
+        ([(100, None), (None, 300), (200, 2000)], True, 10),
+    ]
+)
+def test_apply_filter_sweep_on_noise(
+        bands: list[tuple[Optional[float], Optional[float]]], invert: bool, order: int
+) -> None:
+    """Test that swept output stays within the range of outputs of static filters."""
+    frame_rate = 44100
+    sound = np.random.default_rng(0).normal(0, 0.3, size=(2, frame_rate))
+    event = Event(
+        instrument='any_instrument',
+        start_time=0,
+        duration=1,
+        frequency=440,
+        velocity=1,
+        effects='',
+        frame_rate=frame_rate
+    )
+    result = apply_filter_sweep(sound, event, 'absolute', bands, invert, order)
+    static_peaks = [
+        np.max(np.abs(
+            apply_frequency_filter(sound, event, 'absolute', *band, invert, order)
+        ))
+        for band in bands
+    ]
+    assert np.max(np.abs(result)) <= max(static_peaks)
+
+
+@pytest.mark.parametrize(
+    "band, invert, order",
+    [
+        ((300, 500), False, 25),
+        ((300, 500), True, 10),
+        ((None, 500), False, 25),
+        ((500, None), False, 3),
+    ]
+)
+def test_apply_filter_sweep_with_equal_bands(
+        band: tuple[Optional[float], Optional[float]], invert: bool, order: int
+) -> None:
+    """Test that sweeping between equal bands is the same as static filtering."""
+    frame_rate = 44100
+    sound = np.random.default_rng(0).normal(0, 0.3, size=(2, frame_rate))
+    event = Event(
+        instrument='any_instrument',
+        start_time=0,
+        duration=1,
+        frequency=440,
+        velocity=1,
+        effects='',
+        frame_rate=frame_rate
+    )
+    result = apply_filter_sweep(sound, event, 'absolute', [band, band], invert, order)
+    expected = apply_frequency_filter(sound, event, 'absolute', *band, invert, order)
+    # Static filters without one of cutoffs are band-pass filters with tiny lower cutoff
+    # or with upper cutoff that is close to Nyquist frequency.
+    np.testing.assert_allclose(result, expected, atol=1e-4)
+
+
+def test_apply_phaser_with_wahwah() -> None:
+    """Test that swept band-pass filters of phaser do not amplify sound."""
+    frame_rate = 44100
+    sound = np.random.default_rng(0).normal(0, 0.3, size=(2, frame_rate))
+    event = Event(
+        instrument='any_instrument',
+        start_time=0,
+        duration=1,
+        frequency=440,
+        velocity=1,
+        effects='',
+        frame_rate=frame_rate
+    )
+    result = apply_phaser(sound, event, 'absolute', wahwah=True)
+    static_peaks = [
+        np.max(np.abs(
+            0.75 * sound
+            + 0.25 * apply_frequency_filter(sound, event, 'absolute', center - 10, center + 10)
+        ))
+        for center in np.linspace(220, 880, 10)
+    ]
+    assert np.max(np.abs(result)) <= max(static_peaks)
+
+
+@pytest.mark.parametrize(
+    "cutoff_frequencies, positions, default_frequency, expected",
+    [
+        ([100, 200, 400], np.array([0, 0.5, 1.25, 2]), 0, np.array([100, 150, 250, 400])),
+        ([None, 200, None], np.array([0, 0.5, 1.25, 2]), 0, np.array([0, 100, 150, 0])),
+        ([100, None], np.array([0, 0.5, 1]), 22050, np.array([100, 11075, 22050])),
+        ([None, None], np.array([0, 0.5, 1]), 0, None),
+    ]
+)
+def test_interpolate_cutoff_frequencies(
+        cutoff_frequencies: list[Optional[float]], positions: np.ndarray,
+        default_frequency: float, expected: Optional[np.ndarray]
+) -> None:
+    """Test `interpolate_cutoff_frequencies` function."""
+    result = interpolate_cutoff_frequencies(cutoff_frequencies, positions, default_frequency)
+    if expected is None:
+        assert result is None
+    else:
+        np.testing.assert_almost_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "bands, phase, band_index",
+    [
+        ([(None, 1000), (500, None)], -np.pi / 2, 0),
+        ([(None, 1000), (500, None)], np.pi / 2, 1),
+        ([[100, None], [None, 300]], -np.pi / 2, 0),
+        ([[100, None], [None, 300]], np.pi / 2, 1),
     ]
 )
-def test_oscillate_between_sounds(
-        sounds: np.ndarray, frame_rate: int, frequency: float, phase: float, waveform: str,
-        expected: np.ndarray
+def test_apply_filter_sweep_with_mixed_bands(
+        bands: list, phase: float, band_index: int
 ) -> None:
-    """Test `oscillate_between_sounds` function."""
-    result = oscillate_between_sounds(sounds, frame_rate, frequency, phase, waveform)
+    """Test that sweep between low-pass and high-pass filters matches them at its ends."""
+    frame_rate = 44100
+    sound = np.random.default_rng(0).normal(0, 0.3, size=(2, frame_rate))
+    event = Event(
+        instrument='any_instrument',
+        start_time=0,
+        duration=1,
+        frequency=440,
+        velocity=1,
+        effects='',
+        frame_rate=frame_rate
+    )
+    # Oscillations are so slow that filter stays at one of the bands.
+    result = apply_filter_sweep(
+        sound, event, 'absolute', bands, frequency=1e-9, phase=phase
+    )
+    expected = apply_frequency_filter(sound, event, 'absolute', *bands[band_index])
+    np.testing.assert_allclose(result, expected, atol=1e-4)
+
+
+def test_apply_filter_sweep_with_bands_from_lists() -> None:
+    """Test that bands without cutoffs can be lists (e.g., if they are loaded from YAML)."""
+    sound = np.random.default_rng(0).normal(0, 0.3, size=(2, 1000))
+    event = Event(
+        instrument='any_instrument',
+        start_time=0,
+        duration=1,
+        frequency=440,
+        velocity=1,
+        effects='',
+        frame_rate=1000
+    )
+    result = apply_filter_sweep(sound, event, 'absolute', [[None, None], [None, None]])
+    expected = apply_frequency_filter(sound, event, 'absolute')
+    np.testing.assert_equal(result, expected)
+
+
+def test_propagate_states_through_blocks() -> None:
+    """Test that `propagate_states_through_blocks` solves the recurrence."""
+    rng = np.random.default_rng(0)
+    n_blocks = 13
+    transition_matrices = rng.uniform(-0.7, 0.7, size=(n_blocks, 2, 2))
+    final_states = rng.normal(size=(2, 3, n_blocks))
+    result = propagate_states_through_blocks(transition_matrices, final_states)
+    expected = np.zeros_like(final_states)
+    for block_index in range(1, n_blocks):
+        expected[:, :, block_index] = (
+            np.einsum(
+                'ij,jc->ic',
+                transition_matrices[block_index - 1], expected[:, :, block_index - 1]
+            )
+            + final_states[:, :, block_index - 1]
+        )
     np.testing.assert_almost_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "n_channels, n_frames, block_size, order, filter_type",
+    [
+        (1, 1000, 64, 4, 'bandpass'),
+        (2, 1000, 100, 3, 'bandstop'),
+        (2, 10, 64, 5, 'lowpass'),
+        (2, 1000, 64, 25, 'highpass'),
+    ]
+)
+def test_filter_with_varying_sections(
+        n_channels: int, n_frames: int, block_size: int, order: int, filter_type: str
+) -> None:
+    """Test that `filter_with_varying_sections` with constant sections is a usual filter."""
+    sound = np.random.default_rng(0).normal(size=(n_channels, n_frames))
+    min_thresholds = np.array([0.1]) if filter_type != 'lowpass' else None
+    max_thresholds = np.array([0.2]) if filter_type != 'highpass' else None
+    sections = design_state_variable_butterworth_filters(
+        order, min_thresholds, max_thresholds, filter_type
+    )
+    n_blocks = -(-n_frames // block_size)
+    sections = np.tile(sections, (n_blocks, 1, 1))
+    result = filter_with_varying_sections(sound, sections, block_size)
+    thresholds = [x[0] for x in [min_thresholds, max_thresholds] if x is not None]
+    thresholds = thresholds if len(thresholds) > 1 else thresholds[0]
+    second_order_sections = butter(order, thresholds, btype=filter_type, output='sos')
+    np.testing.assert_almost_equal(result, sosfilt(second_order_sections, sound))
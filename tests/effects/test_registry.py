@@ -0,0 +1,72 @@
+"""
+Test `sinethesizer.effects.registry` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+from typing import Any
+
+import numpy as np
+import pytest
+
+from sinethesizer.effects.registry import get_effects_registry
+from sinethesizer.synth.core import Event
+from sinethesizer.utils.misc import convert_to_stereo
+
+
+@pytest.mark.parametrize(
+    "effect_name, params",
+    [
+        ('amplitude_normalization', {'value_at_max_velocity': 0.5, 'quantile': 0.9}),
+        ('artificial_reverb', {'random_seeds': [1, 2]}),
+        (
+            'automation',
+            {
+                'automated_effect_name': 'panning',
+                'break_points': [
+                    {
+                        'relative_position': 0.0,
+                        'left_amplitude_ratio': 1.0, 'right_amplitude_ratio': 0.0
+                    },
+                    {
+                        'relative_position': 1.0,
+                        'left_amplitude_ratio': 0.0, 'right_amplitude_ratio': 1.0
+                    },
+                ],
+            }
+        ),
+        (
+            'chorus',
+            {
+                'original_sound_gain': 0.5,
+                'copies_params': [{'delay': 0.01, 'gain': 0.5, 'frequency': 1, 'width': 0.1}],
+            }
+        ),
+        ('compressor', {'threshold': 0.3, 'quantile': 0.9}),
+        ('envelope_shaper', {'envelope_params': {'name': 'trapezoid'}, 'quantile': 0.9}),
+        ('equalizer', {'breakpoint_frequencies': [300, 1000, 3000], 'gains': [1.0, 0.5, 1.0]}),
+        ('filter', {'min_frequency': 500}),
+        ('filter_sweep', {'bands': [[300, 1000], [500, 2000]]}),
+        ('overdrive', {}),
+        ('panning', {'left_amplitude_ratio': 0.8, 'right_amplitude_ratio': 0.4}),
+        ('phaser', {}),
+        ('room_reverb', {}),
+        ('stereo_delay', {'delay': 0.01}),
+        ('stereo_to_mono_conversion', {}),
+        ('tremolo', {}),
+        ('vibrato', {}),
+    ]
+)
+def test_effects_with_mono_sound(effect_name: str, params: dict[str, Any]) -> None:
+    """Test that effects treat mono sound as stereo sound with identical channels."""
+    frame_rate = 8000
+    moments = np.arange(2000) / frame_rate
+    mono_sound = np.sin(2 * np.pi * 440 * moments) * np.linspace(1, 0, len(moments))
+    mono_sound = mono_sound.reshape((1, -1))
+    event = Event('any', 0, 0.25, 440.0, 1.0, '', frame_rate)
+    effect_fn = get_effects_registry()[effect_name]
+
+    result = effect_fn(np.copy(mono_sound), event, **params)
+    expected = effect_fn(convert_to_stereo(mono_sound), event, **params)
+    np.testing.assert_allclose(convert_to_stereo(result), expected, atol=1e-12)
@@ -18,9 +18,11 @@ from sinethesizer.effects.reverb import (
     apply_artificial_reverb,
     apply_room_reverb,
     generate_room_impulse_response,
+    generate_reflected_locations,
     generate_tiling,
 )
 from sinethesizer.synth.core import Event
+from sinethesizer.utils.misc import enable_effects_random_generator
 
 
 @pytest.mark.parametrize(
@@ -175,6 +177,23 @@ def test_apply_artificial_reverb(
     np.testing.assert_almost_equal(result, expected)
 
 
+def test_apply_artificial_reverb_with_random_generator() -> None:
+    """Test that unseeded artificial reverb is reproducible with seeded generator of sound."""
+    sound = np.vstack((np.linspace(1, 0, 800), np.linspace(0, 1, 800)))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=0.1, frequency=440,
+        velocity=1, effects='', frame_rate=8000
+    )
+    results = []
+    for _ in range(2):
+        with enable_effects_random_generator(np.random.default_rng(42)):
+            results.append(apply_artificial_reverb(sound, event, decay_duration=0.5))
+    np.testing.assert_equal(results[0], results[1])
+    with enable_effects_random_generator(np.random.default_rng(43)):
+        another_result = apply_artificial_reverb(sound, event, decay_duration=0.5)
+    assert not np.array_equal(another_result, results[0])
+
+
 @pytest.mark.parametrize(
     "sound, event, room_length, room_width, room_height, reflection_decay_factor, sound_speed, "
     "listener_x, listener_y, listener_z, listener_direction_x, listener_direction_y, "
@@ -475,3 +494,24 @@ def test_generate_tiling(
         zipped = zip(nested_result.items(), nested_expected.items())
         for (_, result_value), (_, expected_value) in zipped:
             np.testing.assert_equal(result_value, expected_value)
+
+
+@pytest.mark.parametrize(
+    "room, listener, n_reflections",
+    [
+        (Room((4, 5, 3), 0.8), Listener((1, 2, 1.5), (0, 1)), 0),
+        (Room((4, 5, 3), 0.8), Listener((1, 2, 1.5), (0, 1)), 3),
+        (Room((12, 7, 5), 0.8), Listener((3, 3.5, 1.75), (1, 0)), 6),
+    ]
+)
+def test_generate_reflected_locations(
+        room: Room, listener: Listener, n_reflections: int
+) -> None:
+    """Test that `generate_reflected_locations` returns the same rooms as `generate_tiling`."""
+    moves, locations = generate_reflected_locations(room, listener, n_reflections)
+    result = {tuple(move): location for move, location in zip(moves.tolist(), locations)}
+    tiling = generate_tiling(room, listener, n_reflections)
+    expected = {move: location for level in tiling.values() for move, location in level.items()}
+    assert result.keys() == expected.keys()
+    for move, location in expected.items():
+        np.testing.assert_almost_equal(result[move], location)
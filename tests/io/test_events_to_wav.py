@@ -6,16 +6,30 @@ Author: Nikolay Lysenko
 
 
 import functools
+import os
+import time
 from typing import Any
 
 import pytest
 import numpy as np
+from scipy.io import wavfile
 
 from sinethesizer.envelopes.misc import create_constant_envelope
+from sinethesizer.effects.reverb import apply_artificial_reverb, apply_room_reverb
+from sinethesizer.io import events_to_wav
 from sinethesizer.io.events_to_wav import (
-    add_event_to_timeline, convert_events_to_timeline, write_timeline_to_wav
+    add_event_to_timeline,
+    add_sound_to_timeline,
+    WAV_HEADER_SIZE,
+    convert_events_to_timeline,
+    convert_to_sample_format,
+    create_empty_timeline,
+    create_random_generator,
+    plan_events,
+    write_events_to_wav_in_blocks,
+    write_timeline_to_wav,
 )
-from sinethesizer.synth.core import Event, Instrument, ModulatedWave, Partial
+from sinethesizer.synth.core import Event, Instrument, ModulatedWave, Partial, synthesize
 from sinethesizer.synth.event_to_amplitude_factor import (
     compute_amplitude_factor_as_power_of_velocity
 )
@@ -94,6 +108,113 @@ def test_add_event_to_timeline(
     np.testing.assert_almost_equal(result, expected)
 
 
+@pytest.mark.parametrize("dtype", ['float64', 'float32'])
+def test_create_empty_timeline(dtype: str) -> None:
+    """Test `create_empty_timeline` function."""
+    events = [Event('any', 1.0, 0.5, 440.0, 1.0, '', 10)]
+    result = create_empty_timeline(events, 10, 1.0, [(10, 30)], dtype)
+    assert result.shape == (2, 30)
+    assert result.dtype == dtype
+    assert not np.any(result)
+
+
+def test_create_random_generator() -> None:
+    """Test that `create_random_generator` depends only on seed and event index."""
+    np.random.seed(0)
+    global_state = np.random.get_state()[1].copy()
+    first_numbers = create_random_generator(42, 3).random(5)
+    np.testing.assert_equal(create_random_generator(42, 3).random(5), first_numbers)
+    assert not np.array_equal(create_random_generator(42, 4).random(5), first_numbers)
+    assert not np.array_equal(create_random_generator(43, 3).random(5), first_numbers)
+    assert not np.array_equal(create_random_generator(None, 3).random(5), first_numbers)
+    np.testing.assert_equal(np.random.get_state()[1], global_state)
+
+
+@pytest.mark.parametrize(
+    "events, instruments_registry, frame_rate, expected",
+    [
+        (
+            # `events`
+            [
+                Event(
+                    instrument='reverberated_sine',
+                    start_time=0.5,
+                    duration=1.0,
+                    frequency=1.0,
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=4
+                ),
+                Event(
+                    instrument='reverberated_sine',
+                    start_time=1.2,
+                    duration=0.5,
+                    frequency=1.0,
+                    velocity=1.0,
+                    effects='[{"name": "stereo_delay", "delay": 0.5}]',
+                    frame_rate=4
+                ),
+            ],
+            # `instruments_registry`
+            {
+                'reverberated_sine': Instrument(
+                    partials=[
+                        Partial(
+                            wave=ModulatedWave(
+                                waveform='sine',
+                                amplitude_envelope_fn=functools.partial(
+                                    create_constant_envelope,
+                                    value=1
+                                ),
+                                phase=0,
+                                amplitude_modulator=None,
+                                phase_modulator=None,
+                                quasiperiodic_bandwidth=0,
+                                quasiperiodic_breakpoints_frequency=10
+                            ),
+                            frequency_ratio=1.0,
+                            amplitude_ratio=1.0,
+                            event_to_amplitude_factor_fn=functools.partial(
+                                compute_amplitude_factor_as_power_of_velocity,
+                                power=1
+                            ),
+                            detuning_to_amplitude={0.0: 1.0},
+                            random_detuning_range=0.0,
+                            effects=[]
+                        )
+                    ],
+                    amplitude_scaling=1.0,
+                    effects=[
+                        functools.partial(
+                            apply_artificial_reverb,
+                            first_reflection_delay=0.25,
+                            decay_duration=1.0,
+                            n_early_reflections=2,
+                            early_reflections_delay=0.25,
+                            diffusion_delay_factor=0.9
+                        )
+                    ]
+                )
+            },
+            # `frame_rate`
+            4,
+            # `expected`
+            [(2, 10), (5, 13)]
+        ),
+    ]
+)
+def test_plan_events(
+        events: list[Event], instruments_registry: dict[str, Instrument],
+        frame_rate: int, expected: list[tuple[int, int]]
+) -> None:
+    """Test `plan_events` function."""
+    result = plan_events(events, instruments_registry, frame_rate)
+    assert result == expected
+    for event, (start_frame, end_frame) in zip(events, result):
+        sound = synthesize(event, instruments_registry)
+        assert sound.shape[1] == end_frame - start_frame
+
+
 @pytest.mark.parametrize(
     "events, settings, expected",
     [
@@ -236,6 +357,466 @@ def test_convert_events_to_timeline(
     np.testing.assert_almost_equal(result, expected)
 
 
+@pytest.mark.parametrize(
+    "events, settings",
+    [
+        (
+            # `events`
+            [
+                Event(
+                    instrument='noisy_sine',
+                    start_time=0.1 * i,
+                    duration=0.5,
+                    frequency=220.0 * (1 + i % 3),
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=8000
+                )
+                for i in range(6)
+            ],
+            # `settings`
+            {
+                'frame_rate': 8000,
+                'trailing_silence': 0.5,
+                'peak_amplitude': 1,
+                'workers': 2,
+                'random_seed': 42,
+                'instruments_registry': {
+                    'noisy_sine': Instrument(
+                        partials=[
+                            Partial(
+                                wave=ModulatedWave(
+                                    waveform='sine',
+                                    amplitude_envelope_fn=functools.partial(
+                                        create_constant_envelope,
+                                        value=1
+                                    ),
+                                    phase=0,
+                                    amplitude_modulator=None,
+                                    phase_modulator=None,
+                                    quasiperiodic_bandwidth=0.5,
+                                    quasiperiodic_breakpoints_frequency=10
+                                ),
+                                frequency_ratio=1.0,
+                                amplitude_ratio=1.0,
+                                event_to_amplitude_factor_fn=functools.partial(
+                                    compute_amplitude_factor_as_power_of_velocity,
+                                    power=1
+                                ),
+                                detuning_to_amplitude={0.0: 1.0},
+                                random_detuning_range=0.1,
+                                effects=[]
+                            ),
+                            Partial(
+                                wave=ModulatedWave(
+                                    waveform='white_noise',
+                                    amplitude_envelope_fn=functools.partial(
+                                        create_constant_envelope,
+                                        value=1
+                                    ),
+                                    phase=0,
+                                    amplitude_modulator=None,
+                                    phase_modulator=None,
+                                    quasiperiodic_bandwidth=0,
+                                    quasiperiodic_breakpoints_frequency=10
+                                ),
+                                frequency_ratio=1.0,
+                                amplitude_ratio=0.1,
+                                event_to_amplitude_factor_fn=functools.partial(
+                                    compute_amplitude_factor_as_power_of_velocity,
+                                    power=1
+                                ),
+                                detuning_to_amplitude={0.0: 1.0},
+                                random_detuning_range=0.0,
+                                effects=[]
+                            ),
+                        ],
+                        amplitude_scaling=1.0,
+                        effects=[
+                            functools.partial(
+                                apply_artificial_reverb,
+                                first_reflection_delay=0.05,
+                                decay_duration=0.3
+                            )
+                        ]
+                    )
+                }
+            },
+        ),
+    ]
+)
+def test_convert_events_to_timeline_in_parallel(
+        events: list[Event], settings: dict[str, Any]
+) -> None:
+    """Test that parallel rendering of seeded events is identical to sequential rendering."""
+    parallel_result = convert_events_to_timeline(events, settings)
+    sequential_result = convert_events_to_timeline(events, {**settings, 'workers': 1})
+    np.testing.assert_array_equal(parallel_result, sequential_result)
+
+
+def list_shared_memory_blocks() -> set[str]:
+    """List names of shared memory blocks that exist in the system."""
+    return {name for name in os.listdir('/dev/shm') if name.startswith('psm_')}
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason="Shared memory is not listed.")
+def test_convert_events_to_timeline_in_parallel_with_slow_summation(monkeypatch) -> None:
+    """Test that only a few synthesized sounds wait for summation in shared memory."""
+    events = [Event('silence', 0.1 * i, 0.5, 220.0, 1.0, '', 8000) for i in range(20)]
+    instrument = Instrument(partials=[], amplitude_scaling=1.0, effects=[])
+    settings = {
+        'frame_rate': 8000,
+        'trailing_silence': 0,
+        'instruments_registry': {'silence': instrument},
+        'workers': 2,
+    }
+    initial_blocks = list_shared_memory_blocks()
+    n_blocks = []
+
+    def add_sound_slowly(*args: Any) -> np.ndarray:
+        time.sleep(0.02)
+        n_blocks.append(len(list_shared_memory_blocks() - initial_blocks))
+        return add_sound_to_timeline(*args)
+
+    monkeypatch.setattr(events_to_wav, 'add_sound_to_timeline', add_sound_slowly)
+    convert_events_to_timeline(events, settings)
+    assert len(n_blocks) == len(events)
+    # A block that is being summed and blocks of pending events.
+    assert max(n_blocks) <= 1 + events_to_wav.MAX_PENDING_EVENTS_PER_WORKER * 2
+    assert list_shared_memory_blocks() - initial_blocks == set()
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason="Shared memory is not listed.")
+def test_convert_events_to_timeline_in_parallel_with_failure(monkeypatch) -> None:
+    """Test that shared memory is released if parallel rendering fails."""
+    events = [Event('silence', 0.1 * i, 0.5, 220.0, 1.0, '', 8000) for i in range(20)]
+    instrument = Instrument(partials=[], amplitude_scaling=1.0, effects=[])
+    settings = {
+        'frame_rate': 8000,
+        'trailing_silence': 0,
+        'instruments_registry': {'silence': instrument},
+        'workers': 2,
+    }
+    initial_blocks = list_shared_memory_blocks()
+    n_calls = []
+
+    def add_sound_with_failure(*args: Any) -> np.ndarray:
+        n_calls.append(1)
+        if len(n_calls) == 3:
+            raise RuntimeError("Summation failed.")
+        return add_sound_to_timeline(*args)
+
+    monkeypatch.setattr(events_to_wav, 'add_sound_to_timeline', add_sound_with_failure)
+    with pytest.raises(RuntimeError, match="Summation failed."):
+        convert_events_to_timeline(events, settings)
+    assert list_shared_memory_blocks() - initial_blocks == set()
+
+
+@pytest.mark.parametrize(
+    "events, settings, send_levels",
+    [
+        (
+            # `events`
+            [
+                Event(
+                    instrument='sine',
+                    start_time=0.0,
+                    duration=0.5,
+                    frequency=220.0,
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=8000,
+                    sends='{"hall": 0.5}'
+                ),
+                Event(
+                    instrument='sine',
+                    start_time=0.3,
+                    duration=0.5,
+                    frequency=330.0,
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=8000
+                ),
+                Event(
+                    instrument='dry_sine',
+                    start_time=0.4,
+                    duration=0.5,
+                    frequency=440.0,
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=8000
+                ),
+            ],
+            # `settings`
+            {
+                'frame_rate': 8000,
+                'trailing_silence': 0.5,
+                'peak_amplitude': None,
+                'buses': {
+                    'hall': [{'name': 'room_reverb', 'n_reflections': 5}],
+                    'unused': [{'name': 'stereo_delay', 'delay': 0.1}],
+                },
+                'instrument_to_sends': {'sine': {'hall': 0.8}},
+                'instruments_registry': {
+                    instrument: Instrument(
+                        partials=[
+                            Partial(
+                                wave=ModulatedWave(
+                                    waveform='sine',
+                                    amplitude_envelope_fn=functools.partial(
+                                        create_constant_envelope,
+                                        value=1
+                                    ),
+                                    phase=0,
+                                    amplitude_modulator=None,
+                                    phase_modulator=None,
+                                    quasiperiodic_bandwidth=0,
+                                    quasiperiodic_breakpoints_frequency=10
+                                ),
+                                frequency_ratio=1.0,
+                                amplitude_ratio=1.0,
+                                event_to_amplitude_factor_fn=functools.partial(
+                                    compute_amplitude_factor_as_power_of_velocity,
+                                    power=1
+                                ),
+                                detuning_to_amplitude={0.0: 1.0},
+                                random_detuning_range=0.0,
+                                effects=[]
+                            )
+                        ],
+                        amplitude_scaling=1.0,
+                        effects=[]
+                    )
+                    for instrument in ['sine', 'dry_sine']
+                }
+            },
+            # `send_levels`
+            [0.5, 0.8, 0.0],
+        ),
+    ]
+)
+def test_convert_events_to_timeline_with_buses(
+        events: list[Event], settings: dict[str, Any], send_levels: list[float]
+) -> None:
+    """Test that bus effects applied once are the same as effects applied to each event."""
+    result = convert_events_to_timeline(events, settings)
+
+    dry_events = [event._replace(sends='') for event in events]
+    dry_settings = {**settings, 'buses': None, 'instrument_to_sends': None}
+    expected = convert_events_to_timeline(dry_events, dry_settings)
+    for event, send_level in zip(events, send_levels):
+        sound = synthesize(event, settings['instruments_registry'])
+        sound = apply_room_reverb(sound, event, n_reflections=5)
+        expected = add_sound_to_timeline(
+            expected, send_level * sound, event.start_time, event.frame_rate
+        )
+    # Reverb of a bus is applied to the whole track including its trailing silence.
+    expected = np.hstack((expected, np.zeros((2, result.shape[1] - expected.shape[1]))))
+    np.testing.assert_allclose(result, expected, atol=1e-9)
+
+
+@pytest.mark.parametrize(
+    "settings, match",
+    [
+        ({'buses': {'hall': [{'name': 'overdrive'}]}}, "Effects of buses must be one of"),
+        (
+            {'buses': {'hall': [{'name': 'filter', 'kind': 'relative'}]}},
+            "Effects of buses must have absolute kind"
+        ),
+        (
+            {
+                'buses': {
+                    'hall': [{
+                        'name': 'artificial_reverb', 'decay_duration': 0.1,
+                        'keep_peak_amplitude': True
+                    }]
+                }
+            },
+            "Effects of buses can not keep peak amplitude"
+        ),
+        ({'buses': {}, 'instrument_to_sends': {'sine': {'hall': 1}}}, "unknown bus"),
+    ]
+)
+def test_convert_events_to_timeline_with_invalid_buses(
+        settings: dict[str, Any], match: str
+) -> None:
+    """Test that `convert_events_to_timeline` raises an error for invalid buses."""
+    events = [Event('sine', 0, 0.5, 220.0, 1.0, '', 8000)]
+    instrument = Instrument(
+        partials=[],
+        amplitude_scaling=1.0,
+        effects=[]
+    )
+    settings = {
+        **settings,
+        'frame_rate': 8000,
+        'trailing_silence': 0,
+        'instruments_registry': {'sine': instrument},
+    }
+    with pytest.raises(ValueError, match=match):
+        convert_events_to_timeline(events, settings)
+
+
+@pytest.mark.parametrize(
+    "events, settings",
+    [
+        (
+            # `events`
+            [
+                Event(
+                    instrument='reverberated_sine',
+                    start_time=0.15 * i,
+                    duration=0.2,
+                    frequency=220.0 * (1 + i % 3),
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=8000
+                )
+                for i in range(5)
+            ],
+            # `settings`
+            {
+                'frame_rate': 8000,
+                'trailing_silence': 0.1,
+                'random_seed': 42,
+                'instruments_registry': {
+                    'reverberated_sine': Instrument(
+                        partials=[
+                            Partial(
+                                wave=ModulatedWave(
+                                    waveform='sine',
+                                    amplitude_envelope_fn=functools.partial(
+                                        create_constant_envelope,
+                                        value=1
+                                    ),
+                                    phase=0,
+                                    amplitude_modulator=None,
+                                    phase_modulator=None,
+                                    quasiperiodic_bandwidth=0,
+                                    quasiperiodic_breakpoints_frequency=10
+                                ),
+                                frequency_ratio=1.0,
+                                amplitude_ratio=1.0,
+                                event_to_amplitude_factor_fn=functools.partial(
+                                    compute_amplitude_factor_as_power_of_velocity,
+                                    power=1
+                                ),
+                                detuning_to_amplitude={0.0: 1.0},
+                                random_detuning_range=0.1,
+                                effects=[]
+                            )
+                        ],
+                        amplitude_scaling=1.0,
+                        effects=[
+                            functools.partial(
+                                apply_artificial_reverb,
+                                first_reflection_delay=0.05,
+                                decay_duration=0.3,
+                                random_seeds=(1, 2)
+                            ),
+                            functools.partial(
+                                apply_artificial_reverb,
+                                first_reflection_delay=0.02,
+                                decay_duration=0.1,
+                                random_seeds=(None, 3)
+                            ),
+                        ]
+                    )
+                }
+            },
+        ),
+    ]
+)
+@pytest.mark.parametrize("block_duration", [0.01, 0.15, 10.0])
+@pytest.mark.parametrize("peak_amplitude", [None, 0.5])
+def test_write_events_to_wav_in_blocks(
+        path_to_tmp_file: str, events: list[Event], settings: dict[str, Any],
+        block_duration: float, peak_amplitude: Any
+) -> None:
+    """Test that block-wise rendering is identical to rendering of the whole timeline."""
+    settings = {**settings, 'block_duration': block_duration, 'peak_amplitude': peak_amplitude}
+    write_events_to_wav_in_blocks(events, settings, path_to_tmp_file)
+    frame_rate, result = wavfile.read(path_to_tmp_file)
+    expected = convert_events_to_timeline(events, settings)
+    assert frame_rate == settings['frame_rate']
+    np.testing.assert_array_equal(result.T, expected)
+
+
+@pytest.mark.parametrize(
+    "events, settings",
+    [
+        (
+            # `events`
+            [
+                Event(
+                    instrument='sine',
+                    start_time=0.1 * i,
+                    duration=0.2,
+                    frequency=220.0 * (1 + i),
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=8000
+                )
+                for i in range(3)
+            ],
+            # `settings`
+            {
+                'frame_rate': 8000,
+                'trailing_silence': 0.1,
+                'block_duration': 0.05,
+                'instruments_registry': {
+                    'sine': Instrument(
+                        partials=[
+                            Partial(
+                                wave=ModulatedWave(
+                                    waveform='sine',
+                                    amplitude_envelope_fn=functools.partial(
+                                        create_constant_envelope,
+                                        value=1
+                                    ),
+                                    phase=0,
+                                    amplitude_modulator=None,
+                                    phase_modulator=None,
+                                    quasiperiodic_bandwidth=0,
+                                    quasiperiodic_breakpoints_frequency=10
+                                ),
+                                frequency_ratio=1.0,
+                                amplitude_ratio=1.0,
+                                event_to_amplitude_factor_fn=functools.partial(
+                                    compute_amplitude_factor_as_power_of_velocity,
+                                    power=1
+                                ),
+                                detuning_to_amplitude={0.0: 1.0},
+                                random_detuning_range=0.0,
+                                effects=[]
+                            )
+                        ],
+                        amplitude_scaling=1.0,
+                        effects=[]
+                    )
+                }
+            },
+        ),
+    ]
+)
+@pytest.mark.parametrize("sample_format", ['float32', 'int16', 'int24'])
+@pytest.mark.parametrize("peak_amplitude", [None, 0.5])
+def test_write_events_to_wav_in_blocks_with_sample_format(
+        path_to_tmp_file: str, events: list[Event], settings: dict[str, Any],
+        sample_format: str, peak_amplitude: Any
+) -> None:
+    """Test that block-wise rendering writes samples of requested format."""
+    settings = {**settings, 'sample_format': sample_format, 'peak_amplitude': peak_amplitude}
+    write_events_to_wav_in_blocks(events, settings, path_to_tmp_file)
+    with open(path_to_tmp_file, 'rb') as wav_file:
+        wav_file.seek(WAV_HEADER_SIZE)
+        result = wav_file.read()
+    timeline = convert_events_to_timeline(events, settings)
+    expected = convert_to_sample_format(timeline.T, sample_format)
+    assert result == expected
+    wavfile.read(path_to_tmp_file)  # Header must be valid.
+
+
 @pytest.mark.parametrize(
     "timeline, frame_rate",
     [(np.array([[1, 2, 3], [2, 3, 4]]), 10)]
@@ -245,3 +826,51 @@ def test_write_timeline_to_wav(
 ) -> None:
     """Test `write_timeline_to_wav` function."""
     write_timeline_to_wav(path_to_tmp_file, timeline, frame_rate)
+
+
+@pytest.mark.parametrize(
+    "timeline, sample_format, expected",
+    [
+        (
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]]),
+            None,
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]])
+        ),
+        (
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]], dtype=np.float32),
+            None,
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]], dtype=np.float32)
+        ),
+        (
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]]),
+            'float32',
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]], dtype=np.float32)
+        ),
+        (
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]]),
+            'int16',
+            np.array([[16384, -8192, 32767], [0, -32767, 4096]], dtype=np.int16)
+        ),
+        (
+            np.array([[0.5, -0.25, 1.5], [0, -1, 0.125]]),
+            'int24',
+            # `scipy` reads 24-bit samples as the highest bytes of 32-bit integers.
+            256 * np.array([[4194304, -2097152, 8388607], [0, -8388607, 1048576]])
+        ),
+    ]
+)
+def test_write_timeline_to_wav_with_sample_format(
+        path_to_tmp_file: str, timeline: np.ndarray, sample_format: Any, expected: np.ndarray
+) -> None:
+    """Test that `write_timeline_to_wav` writes samples of requested format."""
+    write_timeline_to_wav(path_to_tmp_file, timeline, 10, sample_format)
+    frame_rate, result = wavfile.read(path_to_tmp_file)
+    assert frame_rate == 10
+    assert result.dtype == expected.dtype or sample_format == 'int24'
+    np.testing.assert_array_equal(result.T, expected)
+
+
+def test_convert_to_sample_format_with_unknown_format() -> None:
+    """Test that `convert_to_sample_format` raises on unknown sample format."""
+    with pytest.raises(ValueError):
+        convert_to_sample_format(np.zeros((3, 2)), 'int8')
@@ -118,6 +118,36 @@ from sinethesizer.synth.core import Event
             # `expected`
             []
         ),
+        (
+            # `midi_instrument`
+            {'program': 0, 'name': '1'},
+            # `midi_events`
+            [
+                {'start': 1, 'end': 2, 'pitch': 21, 'velocity': 127},
+            ],
+            # `settings`
+            {
+                'frame_rate': 4,
+                'trailing_silence': 1,
+                'midi': {
+                    'program_to_instrument': {0: 'sine'},
+                    'program_to_sends': {0: {'hall': 0.5}},
+                },
+            },
+            # `expected`
+            [
+                Event(
+                    instrument='sine',
+                    start_time=1.0,
+                    duration=1.0,
+                    frequency=27.5,  # A0
+                    velocity=1.0,
+                    effects='',
+                    frame_rate=4,
+                    sends='{"hall": 0.5}'
+                ),
+            ]
+        ),
     ]
 )
 def test_convert_midi_to_timeline(
@@ -11,7 +11,10 @@ from typing import Optional
 import pytest
 import numpy as np
 
-from sinethesizer.oscillators.facade import generate_mono_wave
+from sinethesizer.oscillators import facade
+from sinethesizer.oscillators.facade import (
+    generate_mono_wave, generate_sum_of_plain_analog_waves, get_time_grid
+)
 
 
 @pytest.mark.parametrize(
@@ -250,3 +253,104 @@ def test_generate_mono_wave_with_noises(
     """Test noises produced by `generate_mono_wave` function."""
     result = generate_mono_wave(waveform, 440, amplitude_envelope, 1024)
     assert len(result) == expected_len
+
+
+@pytest.mark.parametrize(
+    "durations_in_frames, frame_rate",
+    [
+        ([5, 3, 12, 7], 4),
+        ([1000, 10], 44100),
+    ]
+)
+def test_get_time_grid(durations_in_frames: list[int], frame_rate: int) -> None:
+    """Test `get_time_grid` function."""
+    for duration_in_frames in durations_in_frames:
+        result = get_time_grid(duration_in_frames, frame_rate)
+        np.testing.assert_equal(result, np.arange(duration_in_frames) / frame_rate)
+        assert not result.flags.writeable
+
+
+@pytest.mark.parametrize(
+    "waveform, frequency, frame_rate, phase_modulator",
+    [
+        ('sawtooth', 440, 48000, None),
+        ('square', 110, 48000, None),
+        ('triangle', 1000, 44100, None),
+        ('pulse_20', 220, 48000, None),
+        ('sawtooth', 220, 48000, 0.5 * np.sin(np.arange(4800) / 100)),
+    ]
+)
+def test_generate_mono_wave_with_wavetable_waveforms(
+        waveform: str, frequency: float, frame_rate: int,
+        phase_modulator: Optional[np.ndarray]
+) -> None:
+    """Test that wavetable waveforms are close to their PolyBLEP counterparts."""
+    amplitude_envelope = np.ones(4800)
+    result = generate_mono_wave(
+        f'wavetable_{waveform}', frequency, amplitude_envelope, frame_rate,
+        phase_modulator=phase_modulator
+    )
+    expected = generate_mono_wave(
+        waveform, frequency, amplitude_envelope, frame_rate, phase_modulator=phase_modulator
+    )
+    # Waves differ near discontinuities, because of different anti-aliasing methods.
+    assert np.median(np.abs(result - expected)) < 0.05
+
+
+@pytest.mark.parametrize(
+    "waveform, frequencies, phases, phase_modulators, durations, shared_envelope, max_size",
+    [
+        ('sine', [100, 230, 370], [0, 1, 2], [None, None, None], [500], True, 2 ** 25),
+        ('sine', [100, 230, 370], [0, 1, 2], [None, None, None], [500], True, 8000),
+        (
+            'raw_sawtooth',
+            [100, 230],
+            [0, 0.5],
+            [None, 0.3 * np.sin(np.arange(400) / 10)],
+            [300, 400],
+            False,
+            2 ** 25
+        ),
+        (
+            'raw_triangle',
+            [50, 70, 90],
+            [0, 0, 0],
+            [np.ones(100), None, np.ones(150)],
+            [100, 200, 150],
+            False,
+            1
+        ),
+    ]
+)
+def test_generate_sum_of_plain_analog_waves(
+        waveform: str, frequencies: list[float], phases: list[float],
+        phase_modulators: list[Optional[np.ndarray]], durations: list[int],
+        shared_envelope: bool, max_size: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that `generate_sum_of_plain_analog_waves` sums outputs of `generate_mono_wave`."""
+    monkeypatch.setattr(facade, 'PHASE_MATRIX_MAX_SIZE_IN_BYTES', max_size)
+    frame_rate = 8000
+    weights = [0.5 + i for i in range(len(frequencies))]
+    if shared_envelope:
+        envelope = np.linspace(1, 0, durations[0])
+        amplitude_envelopes = [envelope for _ in frequencies]
+    else:
+        amplitude_envelopes = [np.linspace(1, 0, duration) for duration in durations]
+    result = generate_sum_of_plain_analog_waves(
+        waveform, frequencies, phases, phase_modulators, amplitude_envelopes, weights, frame_rate
+    )
+    expected = np.zeros(max(len(x) for x in amplitude_envelopes))
+    zipped = zip(frequencies, phases, phase_modulators, amplitude_envelopes, weights)
+    for frequency, phase, phase_modulator, amplitude_envelope, weight in zipped:
+        wave = generate_mono_wave(
+            waveform, frequency, amplitude_envelope, frame_rate, phase,
+            phase_modulator=phase_modulator
+        )
+        expected[:len(wave)] += weight * wave
+    np.testing.assert_almost_equal(result, expected)
+
+
+def test_generate_sum_of_plain_analog_waves_with_unsupported_waveform() -> None:
+    """Test that `generate_sum_of_plain_analog_waves` rejects non-plain waveforms."""
+    with pytest.raises(ValueError):
+        generate_sum_of_plain_analog_waves('sawtooth', [1], [0], [None], [np.ones(5)], [1], 10)
@@ -5,24 +5,69 @@ Author: Nikolay Lysenko
 """
 
 
+import numpy as np
 import pytest
 
 from sinethesizer.oscillators.karplus_strong import (
-    generate_karplus_strong_wave
+    generate_karplus_strong_wave, run_karplus_strong_feedback
 )
 
 
 @pytest.mark.parametrize(
-    "frequency, duration_in_frames, frame_rate",
+    "frequency, duration_in_frames, frame_rate, tuned",
     [
-        (50, 300, 300),
+        (50, 300, 300, False),
+        (50, 300, 300, True),
+        (440, 1000, 8000, True),
     ]
 )
 def test_generate_karplus_strong_wave(
-        frequency: float, duration_in_frames: int, frame_rate: int
+        frequency: float, duration_in_frames: int, frame_rate: int, tuned: bool
 ) -> None:
     """Test `generate_karplus_strong_wave` function."""
     result = generate_karplus_strong_wave(
-        frequency, duration_in_frames, frame_rate
+        frequency, duration_in_frames, frame_rate, tuned
     )
     assert len(result) == duration_in_frames
+
+
+@pytest.mark.parametrize(
+    "frequency, frame_rate, tuned, expected",
+    [
+        (1500, 48000, False, 1524),
+        (1500, 48000, True, 1500),
+    ]
+)
+def test_generate_karplus_strong_wave_pitch(
+        frequency: float, frame_rate: int, tuned: bool, expected: float
+) -> None:
+    """Test that `generate_karplus_strong_wave` is in tune if it is requested."""
+    wave = generate_karplus_strong_wave(frequency, frame_rate, frame_rate, tuned)
+    spectrum = np.abs(np.fft.rfft(wave * np.hanning(len(wave))))
+    spectrum[:50] = 0  # Direct current component is not of interest.
+    result = np.argmax(spectrum)  # Duration is 1 second, so index is frequency in Hz.
+    assert abs(result - expected) <= 1
+
+
+@pytest.mark.parametrize(
+    "initial_block, n_frames",
+    [
+        (np.array([1.0, -1.0]), 10),
+        (np.array([1.0, -1.0, -1.0, 1.0, 1.0]), 1000),
+        (np.random.choice([-1.0, 1.0], 97), 20000),
+    ]
+)
+def test_run_karplus_strong_feedback(initial_block: np.ndarray, n_frames: int) -> None:
+    """Test that `run_karplus_strong_feedback` matches explicit averaging of blocks."""
+    result = run_karplus_strong_feedback(initial_block, n_frames)
+
+    block = initial_block
+    blocks = []
+    for _ in range(n_frames // len(block) + 1):
+        new_block = 0.5 * (block + np.append(block[1:], 0))
+        new_block[-1] += 0.5 * new_block[0]
+        blocks.append(new_block)
+        block = new_block
+    expected = np.hstack(blocks)[:n_frames]
+
+    np.testing.assert_allclose(result, expected, atol=1e-12)
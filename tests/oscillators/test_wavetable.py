@@ -0,0 +1,76 @@
+"""
+Test `sinethesizer.oscillators.wavetable` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+import numpy as np
+import pytest
+import scipy.signal
+
+from sinethesizer.oscillators.wavetable import (
+    TABLE_SIZE, create_wavetable, generate_wavetable_wave, select_n_harmonics
+)
+
+
+TWO_PI = 2 * np.pi
+
+
+@pytest.mark.parametrize(
+    "waveform, duty_cycle, naive_wave_fn",
+    [
+        ('sawtooth', 0.5, scipy.signal.sawtooth),
+        ('triangle', 0.5, lambda xs: scipy.signal.sawtooth(xs, width=0.5)),
+        ('pulse', 0.5, scipy.signal.square),
+        ('pulse', 0.2, lambda xs: scipy.signal.square(xs, duty=0.2)),
+    ]
+)
+def test_create_wavetable(waveform: str, duty_cycle: float, naive_wave_fn) -> None:
+    """Test that `create_wavetable` approximates waves with infinite number of harmonics."""
+    result = create_wavetable(waveform, 1024, duty_cycle)
+    assert len(result) == TABLE_SIZE + 1
+    assert result[0] == result[-1]
+    xs = np.linspace(0, TWO_PI, TABLE_SIZE, endpoint=False)
+    expected = naive_wave_fn(xs)
+    # Values next to discontinuities are affected by Gibbs phenomenon, so median is used.
+    assert np.median(np.abs(result[:-1] - expected)) < 1e-3
+
+
+@pytest.mark.parametrize(
+    "xs_step, expected",
+    [
+        (TWO_PI * 100 / 48000, 128),
+        (TWO_PI * 5000 / 48000, 4),
+        (TWO_PI * 20000 / 48000, 1),
+        (TWO_PI * 1 / 48000, 1024),
+    ]
+)
+def test_select_n_harmonics(xs_step: float, expected: int) -> None:
+    """Test `select_n_harmonics` function."""
+    result = select_n_harmonics(xs_step)
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "frequency, frame_rate, waveform",
+    [
+        (1000, 48000, 'sawtooth'),
+        (3000, 48000, 'pulse'),
+        (440, 44100, 'triangle'),
+    ]
+)
+def test_generate_wavetable_wave(frequency: float, frame_rate: int, waveform: str) -> None:
+    """Test that `generate_wavetable_wave` has no aliasing and supports negative phases."""
+    xs_step = TWO_PI * frequency / frame_rate
+    xs = xs_step * np.arange(frame_rate) - 10
+    result = generate_wavetable_wave(xs, xs_step, waveform)
+    expected = generate_wavetable_wave(xs + 10 * TWO_PI, xs_step, waveform)
+    np.testing.assert_allclose(result, expected, atol=1e-9)
+
+    spectrum = np.abs(np.fft.rfft(result * np.hanning(len(result)))) ** 2
+    frequencies = np.fft.rfftfreq(len(result), 1 / frame_rate)
+    is_harmonic = np.abs(frequencies / frequency - np.round(frequencies / frequency)) * frequency
+    is_harmonic = is_harmonic < 3
+    aliasing_energy_share = spectrum[~is_harmonic].sum() / spectrum.sum()
+    assert aliasing_energy_share < 1e-6
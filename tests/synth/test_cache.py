@@ -0,0 +1,250 @@
+"""
+Test `sinethesizer.synth.cache` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+import functools
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+
+from sinethesizer.effects.reverb import apply_artificial_reverb
+from sinethesizer.envelopes.misc import create_constant_envelope
+from sinethesizer.synth.cache import DiskRenderCache, RenderCache, is_event_random
+from sinethesizer.synth.core import Event, Instrument, ModulatedWave, Partial, synthesize
+from sinethesizer.synth.event_to_amplitude_factor import (
+    compute_amplitude_factor_as_power_of_velocity
+)
+
+
+def create_instrument(
+        waveform: str = 'sine', random_detuning_range: float = 0.0,
+        effects: list = None
+) -> Instrument:
+    """Create instrument with one partial."""
+    instrument = Instrument(
+        partials=[
+            Partial(
+                wave=ModulatedWave(
+                    waveform=waveform,
+                    amplitude_envelope_fn=functools.partial(create_constant_envelope, value=1),
+                    phase=0,
+                    amplitude_modulator=None,
+                    phase_modulator=None,
+                    quasiperiodic_bandwidth=0,
+                    quasiperiodic_breakpoints_frequency=10
+                ),
+                frequency_ratio=1.0,
+                amplitude_ratio=1.0,
+                event_to_amplitude_factor_fn=functools.partial(
+                    compute_amplitude_factor_as_power_of_velocity, power=1
+                ),
+                detuning_to_amplitude={0.0: 1.0},
+                random_detuning_range=random_detuning_range,
+                effects=[]
+            )
+        ],
+        amplitude_scaling=1.0,
+        effects=effects or []
+    )
+    return instrument
+
+
+INSTRUMENTS_REGISTRY = {
+    'sine': create_instrument(),
+    'detuned_sine': create_instrument(random_detuning_range=0.1),
+    'noise': create_instrument(waveform='white_noise'),
+    'reverberated_sine': create_instrument(
+        effects=[functools.partial(apply_artificial_reverb, decay_duration=0.1)]
+    ),
+    'seeded_reverberated_sine': create_instrument(
+        effects=[
+            functools.partial(apply_artificial_reverb, decay_duration=0.1, random_seeds=(1, 2))
+        ]
+    ),
+}
+
+
+def create_event(instrument: str, frequency: float = 100, effects: str = '') -> Event:
+    """Create event with fixed duration and velocity."""
+    event = Event(
+        instrument=instrument, start_time=0, duration=0.1, frequency=frequency,
+        velocity=1, effects=effects, frame_rate=1000
+    )
+    return event
+
+
+@pytest.mark.parametrize(
+    "event, expected",
+    [
+        (create_event('sine'), False),
+        (create_event('detuned_sine'), True),
+        (create_event('noise'), True),
+        (create_event('reverberated_sine'), True),
+        (create_event('seeded_reverberated_sine'), False),
+        (create_event('sine', effects='[{"name": "artificial_reverb"}]'), True),
+        (
+            create_event(
+                'sine', effects='[{"name": "artificial_reverb", "random_seeds": [1, 2]}]'
+            ),
+            False
+        ),
+    ]
+)
+def test_is_event_random(event: Event, expected: bool) -> None:
+    """Test `is_event_random` function."""
+    result = is_event_random(event, INSTRUMENTS_REGISTRY)
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "events, max_size_in_bytes, seed_random_events, expected_stats",
+    [
+        (
+            # `events`
+            [create_event('sine'), create_event('sine')._replace(start_time=1)],
+            # `max_size_in_bytes`
+            10 ** 6,
+            # `seed_random_events`
+            False,
+            # `expected_stats`
+            {
+                'hits': 1, 'misses': 1, 'evictions': 0, 'bypasses': 0,
+                'n_sounds': 1, 'size_in_bytes': 1600
+            }
+        ),
+        (
+            # `events`
+            [create_event('sine', 100), create_event('sine', 200), create_event('sine', 100)],
+            # `max_size_in_bytes`
+            2000,
+            # `seed_random_events`
+            False,
+            # `expected_stats`
+            {
+                'hits': 0, 'misses': 3, 'evictions': 2, 'bypasses': 0,
+                'n_sounds': 1, 'size_in_bytes': 1600
+            }
+        ),
+        (
+            # `events`
+            [create_event('noise'), create_event('noise')],
+            # `max_size_in_bytes`
+            10 ** 6,
+            # `seed_random_events`
+            False,
+            # `expected_stats`
+            {
+                'hits': 0, 'misses': 0, 'evictions': 0, 'bypasses': 2,
+                'n_sounds': 0, 'size_in_bytes': 0
+            }
+        ),
+        (
+            # `events`
+            [create_event('noise'), create_event('noise')],
+            # `max_size_in_bytes`
+            10 ** 6,
+            # `seed_random_events`
+            True,
+            # `expected_stats`
+            {
+                'hits': 1, 'misses': 1, 'evictions': 0, 'bypasses': 0,
+                'n_sounds': 1, 'size_in_bytes': 1600
+            }
+        ),
+    ]
+)
+def test_render_cache(
+        events: list[Event], max_size_in_bytes: int, seed_random_events: bool,
+        expected_stats: dict[str, int]
+) -> None:
+    """Test that `RenderCache` returns the same sounds as `synthesize` and counts calls."""
+    render_cache = RenderCache(max_size_in_bytes, seed_random_events)
+    for event in events:
+        result = render_cache(event, INSTRUMENTS_REGISTRY)
+        if not is_event_random(event, INSTRUMENTS_REGISTRY):
+            np.testing.assert_equal(result, synthesize(event, INSTRUMENTS_REGISTRY))
+    assert render_cache.get_stats() == expected_stats
+
+
+def test_render_cache_with_seeded_random_events() -> None:
+    """Test that seeding of random events does not affect global random state."""
+    render_cache = RenderCache(10 ** 6, seed_random_events=True)
+    np.random.seed(0)
+    first_sound = render_cache(create_event('noise'), INSTRUMENTS_REGISTRY)
+    result = np.random.rand()
+    np.random.seed(0)
+    expected = np.random.rand()
+    assert result == expected
+
+    render_cache = RenderCache(10 ** 6, seed_random_events=True)
+    second_sound = render_cache(create_event('noise'), INSTRUMENTS_REGISTRY)
+    np.testing.assert_equal(first_sound, second_sound)
+
+
+def test_disk_render_cache(tmp_path) -> None:
+    """Test that `DiskRenderCache` persists sounds and invalidates only changed instruments."""
+    cache_dir = str(tmp_path)
+    instruments_registry = {
+        'sine': INSTRUMENTS_REGISTRY['sine']._replace(digest='a'),
+        'another_sine': INSTRUMENTS_REGISTRY['sine']._replace(digest='b'),
+        'detuned_sine': INSTRUMENTS_REGISTRY['detuned_sine']._replace(digest='c'),
+    }
+    events = [create_event('sine'), create_event('another_sine'), create_event('detuned_sine')]
+
+    render_cache = DiskRenderCache(cache_dir)
+    for event in events:
+        render_cache(event, instruments_registry)
+    assert render_cache.get_stats() == {'hits': 0, 'misses': 2, 'bypasses': 1}
+
+    render_cache = DiskRenderCache(cache_dir)
+    for event in events[:2]:
+        result = render_cache(event, instruments_registry)
+        assert isinstance(result, np.memmap)
+        np.testing.assert_equal(result, synthesize(event, instruments_registry))
+    assert render_cache.get_stats() == {'hits': 2, 'misses': 0, 'bypasses': 0}
+
+    instruments_registry['sine'] = instruments_registry['sine']._replace(digest='d')
+    render_cache = DiskRenderCache(cache_dir)
+    for event in events[:2]:
+        render_cache(event, instruments_registry)
+    assert render_cache.get_stats() == {'hits': 1, 'misses': 1, 'bypasses': 0}
+    assert sorted(os.listdir(os.path.join(cache_dir, 'sine'))) == ['a', 'd']
+    assert os.listdir(os.path.join(cache_dir, 'another_sine')) == ['b']
+
+    instruments_registry['sine'] = instruments_registry['sine']._replace(digest='a')
+    render_cache = DiskRenderCache(cache_dir)
+    render_cache(events[0], instruments_registry)
+    assert render_cache.get_stats() == {'hits': 1, 'misses': 0, 'bypasses': 0}
+
+
+def test_disk_render_cache_with_unused_versions(tmp_path) -> None:
+    """Test that `DiskRenderCache` removes only versions of instruments unused for long."""
+    cache_dir = str(tmp_path)
+    for digest, n_unused_days in zip(['a', 'b', 'c'], [100, 10, 0]):
+        path = os.path.join(cache_dir, 'sine', digest)
+        os.makedirs(path)
+        last_use_time = time.time() - n_unused_days * 24 * 60 * 60
+        os.utime(path, (last_use_time, last_use_time))
+    instruments_registry = {'sine': INSTRUMENTS_REGISTRY['sine']._replace(digest='c')}
+    render_cache = DiskRenderCache(cache_dir, max_unused_days=30)
+    render_cache(create_event('sine'), instruments_registry)
+    assert sorted(os.listdir(os.path.join(cache_dir, 'sine'))) == ['b', 'c']
+
+
+def test_disk_render_cache_with_removed_version(tmp_path) -> None:
+    """Test that `DiskRenderCache` synthesizes sound if its directory is removed meanwhile."""
+    cache_dir = str(tmp_path)
+    instruments_registry = {'sine': INSTRUMENTS_REGISTRY['sine']._replace(digest='a')}
+    event = create_event('sine')
+    render_cache = DiskRenderCache(cache_dir)
+    render_cache(event, instruments_registry)
+    shutil.rmtree(os.path.join(cache_dir, 'sine'))
+    result = render_cache(event._replace(duration=0.2), instruments_registry)
+    expected = synthesize(event._replace(duration=0.2), instruments_registry)
+    np.testing.assert_equal(result, expected)
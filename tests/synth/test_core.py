@@ -7,20 +7,24 @@ Author: Nikolay Lysenko
 
 import functools
 import math
+from typing import Optional
 
 import numpy as np
 import pytest
 
+from sinethesizer.effects.registry import get_effect_name_and_params
 from sinethesizer.effects.stereo import apply_stereo_delay
 from sinethesizer.envelopes.misc import create_constant_envelope
 from sinethesizer.synth.core import (
     Event, Instrument, ModulatedWave, Modulator, Partial,
-    adjust_envelope_duration, generate_modulated_wave, generate_partial,
-    introduce_quasiperiodicity, synthesize
+    adjust_envelope_duration, compile_event_effects, compute_sound_duration_in_frames,
+    generate_modulated_wave, generate_partial, generate_partials,
+    introduce_quasiperiodicity, is_batchable, synthesize
 )
 from sinethesizer.synth.event_to_amplitude_factor import (
     compute_amplitude_factor_as_power_of_velocity
 )
+from sinethesizer.utils.misc import sum_two_sounds
 
 
 @pytest.mark.parametrize(
@@ -71,6 +75,44 @@ def test_introduce_quasiperiodicity(
     assert max_relative_deviation <= upper_threshold
 
 
+@pytest.mark.parametrize(
+    "n_frames, frame_rate, frequency, "
+    "quasiperiodic_bandwidth, quasiperiodic_breakpoints_frequency",
+    [
+        (5, 10, 100, 1, 10),
+        (1000, 1000, 100, 1, 10),
+        (30000, 10000, 440, 0.5, 10),
+        (30000, 10000, 100, 1, 1),
+    ]
+)
+def test_introduce_quasiperiodicity_against_dense_weights(
+        n_frames: int, frame_rate: int, frequency: float,
+        quasiperiodic_bandwidth: float, quasiperiodic_breakpoints_frequency: float
+) -> None:
+    """Test that `introduce_quasiperiodicity` matches explicit weighting of breakpoints."""
+    result = introduce_quasiperiodicity(
+        None, n_frames, frame_rate, frequency,
+        quasiperiodic_bandwidth, quasiperiodic_breakpoints_frequency,
+        np.random.default_rng(0)
+    )
+
+    random_generator = np.random.default_rng(0)
+    max_deviation_in_hz = frequency * (2 ** (0.5 * quasiperiodic_bandwidth / 12) - 1)
+    max_increment = 2 * np.pi * max_deviation_in_hz / frame_rate
+    n_breakpoints = round(n_frames / frame_rate * quasiperiodic_breakpoints_frequency)
+    n_breakpoints = max(n_breakpoints, 3)
+    breakpoints = random_generator.uniform(0, n_frames, n_breakpoints - 2).round()
+    breakpoints = np.hstack((breakpoints, np.array([0, n_frames - 1]))).reshape((-1, 1))
+    slopes = random_generator.uniform(-max_increment, max_increment, n_breakpoints)
+    slopes = slopes.reshape((-1, 1))
+    distances_to_breakpoints = np.abs(np.arange(n_frames) - breakpoints)
+    weights = 1 / (distances_to_breakpoints + 1e-5) ** 2
+    weights /= weights.sum(axis=0)
+    expected = np.cumsum(np.sum(weights * slopes, axis=0))
+
+    np.testing.assert_allclose(result, expected, rtol=1e-7, atol=1e-9)
+
+
 @pytest.mark.parametrize(
     "wave, frequency, event, expected",
     [
@@ -108,12 +150,6 @@ def test_introduce_quasiperiodicity(
                     1.0, 0.80901699, 0.30901699, -0.30901699, -0.80901699,
                     -1.0, -0.80901699, -0.30901699, 0.30901699, 0.80901699,
                 ],
-                [
-                    1.0, 0.80901699, 0.30901699, -0.30901699, -0.80901699,
-                    -1.0, -0.80901699, -0.30901699, 0.30901699, 0.80901699,
-                    1.0, 0.80901699, 0.30901699, -0.30901699, -0.80901699,
-                    -1.0, -0.80901699, -0.30901699, 0.30901699, 0.80901699,
-                ],
             ])
         ),
         (
@@ -160,12 +196,6 @@ def test_introduce_quasiperiodicity(
                     1.0, -0.56677191, 0.73174451, -0.42209869, -0.02573332,
                     1.0, -0.02573332, -0.42209869, 0.73174451, -0.56677191,
                 ],
-                [
-                    1.0, -0.56677191, 0.73174451, -0.42209869, -0.02573332,
-                    1.0, -0.02573332, -0.42209869, 0.73174451, -0.56677191,
-                    1.0, -0.56677191, 0.73174451, -0.42209869, -0.02573332,
-                    1.0, -0.02573332, -0.42209869, 0.73174451, -0.56677191,
-                ],
             ])
         ),
     ]
@@ -271,7 +301,7 @@ def test_generate_modulated_wave(
                 frame_rate=20
             ),
             # `expected`
-            np.array([[], []])
+            np.array([[]])
         ),
     ]
 )
@@ -283,6 +313,118 @@ def test_generate_partial(
     np.testing.assert_almost_equal(result, expected)
 
 
+def create_partial(
+        waveform: str, frequency_ratio: float, envelope_value: float,
+        amplitude_modulator: Optional[Modulator] = None, effects: Optional[list] = None
+) -> Partial:
+    """Create partial with detuned copies for tests of batch generation."""
+    partial = Partial(
+        wave=ModulatedWave(
+            waveform=waveform,
+            phase=0.5,
+            amplitude_envelope_fn=functools.partial(
+                create_constant_envelope,
+                value=envelope_value
+            ),
+            amplitude_modulator=amplitude_modulator,
+            phase_modulator=None,
+            quasiperiodic_bandwidth=0,
+            quasiperiodic_breakpoints_frequency=10
+        ),
+        frequency_ratio=frequency_ratio,
+        amplitude_ratio=0.5,
+        event_to_amplitude_factor_fn=functools.partial(
+            compute_amplitude_factor_as_power_of_velocity,
+            power=1
+        ),
+        detuning_to_amplitude={-0.1: 0.5, 0.0: 1.0, 0.1: 0.5},
+        random_detuning_range=0.05,
+        effects=effects or []
+    )
+    return partial
+
+
+@pytest.mark.parametrize(
+    "partial, expected",
+    [
+        (create_partial('sine', 1.0, 1.0), True),
+        (create_partial('raw_sawtooth', 1.0, 1.0), True),
+        (create_partial('sawtooth', 1.0, 1.0), False),
+        (create_partial('white_noise', 1.0, 1.0), False),
+        (create_partial('sine', 1.0, 1.0, effects=[apply_stereo_delay]), False),
+        (
+            create_partial(
+                'sine', 1.0, 1.0,
+                amplitude_modulator=Modulator(
+                    waveform='sine',
+                    carrier_frequency_ratio=1.0,
+                    modulator_frequency_ratio=2.0,
+                    modulation_index_envelope_fn=functools.partial(
+                        create_constant_envelope,
+                        value=0.5
+                    ),
+                    phase=0,
+                    use_ring_modulation=False
+                )
+            ),
+            False
+        ),
+    ]
+)
+def test_is_batchable(partial: Partial, expected: bool) -> None:
+    """Test `is_batchable` function."""
+    assert is_batchable(partial) == expected
+
+
+@pytest.mark.parametrize(
+    "partials, frame_rate",
+    [
+        (
+            [
+                create_partial('sine', 1.0, 1.0),
+                create_partial('sine', 2.0, 0.5),
+                create_partial('raw_triangle', 3.0, 0.5),
+                create_partial('sawtooth', 1.0, 1.0),
+                create_partial('sine', 4.0, 0.2),
+            ],
+            8000
+        ),
+        (
+            [
+                create_partial('sine', 1.0, 1.0),
+                create_partial('sine', 100.0, 1.0),  # It is above Nyquist frequency.
+                create_partial('sine', 1.5, 1.0, effects=[functools.partial(
+                    apply_stereo_delay, delay=0.01
+                )]),
+            ],
+            8000
+        ),
+        (
+            [create_partial('sine', 100.0, 1.0)],
+            8000
+        ),
+    ]
+)
+def test_generate_partials(partials: list[Partial], frame_rate: int) -> None:
+    """Test that `generate_partials` is equivalent to sum of `generate_partial` outputs."""
+    event = Event(
+        instrument='any_instrument',
+        start_time=0.0,
+        duration=0.1,
+        frequency=110.0,
+        velocity=1.0,
+        effects='',
+        frame_rate=frame_rate
+    )
+    result = generate_partials(partials, event, np.random.default_rng(0))
+    random_generator = np.random.default_rng(0)
+    expected = np.zeros((1, 0))
+    for partial in partials:
+        partial_sound = generate_partial(partial, event, random_generator)
+        expected = sum_two_sounds(expected, partial_sound)
+    np.testing.assert_almost_equal(result, expected)
+
+
 @pytest.mark.parametrize(
     "event, instruments_registry, expected",
     [
@@ -404,3 +546,189 @@ def test_synthesize(
     """Test `synthesize` function."""
     result = synthesize(event, instruments_registry)
     np.testing.assert_almost_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "event, instruments_registry",
+    [
+        (
+            # `event`
+            Event(
+                instrument='sine',
+                start_time=0.0,
+                duration=0.5,
+                frequency=440.0,
+                velocity=1.0,
+                effects=(
+                    '[{"name": "stereo_delay", "delay": -0.05}, '
+                    '{"name": "room_reverb", "n_reflections": 3}]'
+                ),
+                frame_rate=8000,
+            ),
+            # `instruments_registry`
+            {
+                'sine': Instrument(
+                    partials=[
+                        Partial(
+                            wave=ModulatedWave(
+                                waveform='sine',
+                                amplitude_envelope_fn=functools.partial(
+                                    create_constant_envelope,
+                                    value=1
+                                ),
+                                phase=0,
+                                amplitude_modulator=None,
+                                phase_modulator=None,
+                                quasiperiodic_bandwidth=0,
+                                quasiperiodic_breakpoints_frequency=10
+                            ),
+                            frequency_ratio=1.0,
+                            amplitude_ratio=1.0,
+                            event_to_amplitude_factor_fn=functools.partial(
+                                compute_amplitude_factor_as_power_of_velocity,
+                                power=1
+                            ),
+                            detuning_to_amplitude={0.0: 1.0},
+                            random_detuning_range=0.0,
+                            effects=[functools.partial(apply_stereo_delay, delay=0.1)]
+                        ),
+                        Partial(
+                            wave=ModulatedWave(
+                                waveform='sine',
+                                amplitude_envelope_fn=functools.partial(
+                                    create_constant_envelope,
+                                    value=1
+                                ),
+                                phase=0,
+                                amplitude_modulator=None,
+                                phase_modulator=None,
+                                quasiperiodic_bandwidth=0,
+                                quasiperiodic_breakpoints_frequency=10
+                            ),
+                            frequency_ratio=10.0,
+                            amplitude_ratio=1.0,
+                            event_to_amplitude_factor_fn=functools.partial(
+                                compute_amplitude_factor_as_power_of_velocity,
+                                power=1
+                            ),
+                            detuning_to_amplitude={0.0: 1.0},
+                            random_detuning_range=0.0,
+                            effects=[functools.partial(apply_stereo_delay, delay=1.0)]
+                        ),
+                    ],
+                    amplitude_scaling=1.0,
+                    effects=[functools.partial(apply_stereo_delay, delay=0.2)]
+                )
+            },
+        ),
+    ]
+)
+def test_compute_sound_duration_in_frames(
+        event: Event, instruments_registry: dict[str, Instrument]
+) -> None:
+    """Test `compute_sound_duration_in_frames` function."""
+    result = compute_sound_duration_in_frames(event, instruments_registry)
+    expected = synthesize(event, instruments_registry).shape[1]
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "effects, expected_names, expected_params",
+    [
+        ('', [], []),
+        (
+            '[{"name": "panning", "left_amplitude_ratio": 1, "right_amplitude_ratio": 0.5}]',
+            ['panning'],
+            [{'left_amplitude_ratio': 1, 'right_amplitude_ratio': 0.5}]
+        ),
+        (
+            '[{"name": "stereo_delay", "delay": 0.1}, {"name": "stereo_to_mono_conversion"}]',
+            ['stereo_delay', 'stereo_to_mono_conversion'],
+            [{'delay': 0.1}, {}]
+        ),
+    ]
+)
+def test_compile_event_effects(
+        effects: str, expected_names: list[str], expected_params: list[dict]
+) -> None:
+    """Test `compile_event_effects` function."""
+    result = compile_event_effects(effects)
+    assert [get_effect_name_and_params(fn)[0] for fn in result] == expected_names
+    assert [get_effect_name_and_params(fn)[1] for fn in result] == expected_params
+    assert compile_event_effects(effects) is result
+
+
+@pytest.mark.parametrize(
+    "event, instruments_registry",
+    [
+        (
+            # `event`
+            Event(
+                instrument='modulated_sine',
+                start_time=0.0,
+                duration=0.5,
+                frequency=440.0,
+                velocity=1.0,
+                effects=(
+                    '[{"name": "filter", "kind": "absolute", "max_frequency": 2000}, '
+                    '{"name": "chorus", "original_sound_gain": 1, '
+                    '"copies_params": [{"delay": 0.01, "gain": 0.5}]}, '
+                    '{"name": "room_reverb", "n_reflections": 3}]'
+                ),
+                frame_rate=8000,
+            ),
+            # `instruments_registry`
+            {
+                'modulated_sine': Instrument(
+                    partials=[
+                        Partial(
+                            wave=ModulatedWave(
+                                waveform='sine',
+                                amplitude_envelope_fn=functools.partial(
+                                    create_constant_envelope,
+                                    value=1
+                                ),
+                                phase=0,
+                                amplitude_modulator=None,
+                                phase_modulator=Modulator(
+                                    waveform='sine',
+                                    carrier_frequency_ratio=1.0,
+                                    modulator_frequency_ratio=2.0,
+                                    modulation_index_envelope_fn=functools.partial(
+                                        create_constant_envelope,
+                                        value=0.5
+                                    ),
+                                    phase=0.0,
+                                    use_ring_modulation=False
+                                ),
+                                quasiperiodic_bandwidth=1,
+                                quasiperiodic_breakpoints_frequency=10
+                            ),
+                            frequency_ratio=1.0,
+                            amplitude_ratio=1.0,
+                            event_to_amplitude_factor_fn=functools.partial(
+                                compute_amplitude_factor_as_power_of_velocity,
+                                power=1
+                            ),
+                            detuning_to_amplitude={0.0: 1.0},
+                            random_detuning_range=0.0,
+                            effects=[functools.partial(apply_stereo_delay, delay=0.01)]
+                        ),
+                    ],
+                    amplitude_scaling=1.0,
+                    effects=[]
+                )
+            },
+        ),
+    ]
+)
+def test_synthesize_with_float32(
+        event: Event, instruments_registry: dict[str, Instrument]
+) -> None:
+    """Test that sounds of 32-bit floats are close to sounds of 64-bit floats."""
+    expected = synthesize(event, instruments_registry, np.random.default_rng(0))
+    result = synthesize(
+        event._replace(dtype='float32'), instruments_registry, np.random.default_rng(0)
+    )
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, atol=1e-5)
@@ -0,0 +1,122 @@
+"""
+Test `sinethesizer.synth.profiling` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+import functools
+
+import numpy as np
+import pytest
+
+from sinethesizer.effects.stereo import apply_stereo_delay
+from sinethesizer.envelopes.misc import create_constant_envelope
+from sinethesizer.synth.core import Event, Instrument, ModulatedWave, Partial, synthesize
+from sinethesizer.synth.event_to_amplitude_factor import (
+    compute_amplitude_factor_as_power_of_velocity
+)
+from sinethesizer.synth.profiling import PROFILING_STATE, Profiler, enable_profiling
+
+
+INSTRUMENTS_REGISTRY = {
+    'sine': Instrument(
+        partials=[
+            Partial(
+                wave=ModulatedWave(
+                    waveform='sine',
+                    amplitude_envelope_fn=functools.partial(create_constant_envelope, value=1),
+                    phase=0,
+                    amplitude_modulator=None,
+                    phase_modulator=None,
+                    quasiperiodic_bandwidth=0,
+                    quasiperiodic_breakpoints_frequency=10
+                ),
+                frequency_ratio=1.0,
+                amplitude_ratio=1.0,
+                event_to_amplitude_factor_fn=functools.partial(
+                    compute_amplitude_factor_as_power_of_velocity, power=1
+                ),
+                detuning_to_amplitude={0.0: 1.0, 0.1: 0.5},
+                random_detuning_range=0.0,
+                effects=[functools.partial(apply_stereo_delay, delay=0.1)]
+            ),
+        ],
+        amplitude_scaling=1.0,
+        effects=[functools.partial(apply_stereo_delay, delay=0.2)]
+    )
+}
+
+
+@pytest.mark.parametrize(
+    "event, track_memory, expected_calls",
+    [
+        (
+            # `event`
+            Event(
+                instrument='sine',
+                start_time=0.0,
+                duration=0.5,
+                frequency=440.0,
+                velocity=1.0,
+                effects='[{"name": "room_reverb", "n_reflections": 3}]',
+                frame_rate=8000,
+            ),
+            # `track_memory`
+            False,
+            # `expected_calls`
+            {
+                'envelopes': 2,
+                'quasiperiodicity': 2,
+                'oscillators': 2,
+                'partial_effect:stereo_delay': 1,
+                'instrument_effect:stereo_delay': 1,
+                'event_effect:room_reverb': 1,
+            },
+        ),
+        (
+            # `event`
+            Event(
+                instrument='sine',
+                start_time=0.0,
+                duration=1.0,
+                frequency=440.0,
+                velocity=1.0,
+                effects='',
+                frame_rate=8000,
+            ),
+            # `track_memory`
+            True,
+            # `expected_calls`
+            {
+                'envelopes': 2,
+                'quasiperiodicity': 2,
+                'oscillators': 2,
+                'partial_effect:stereo_delay': 1,
+                'instrument_effect:stereo_delay': 1,
+            },
+        ),
+    ]
+)
+def test_profiler(event: Event, track_memory: bool, expected_calls: dict[str, int]) -> None:
+    """Test that `Profiler` measures all stages and does not change sounds."""
+    expected_sound = synthesize(event, INSTRUMENTS_REGISTRY, np.random.default_rng(0))
+
+    profiler = Profiler(track_memory)
+    with enable_profiling(profiler):
+        sound = synthesize(event, INSTRUMENTS_REGISTRY, np.random.default_rng(0))
+    assert PROFILING_STATE['profiler'] is None
+    np.testing.assert_equal(sound, expected_sound)
+
+    stats_by_stage = profiler.aggregate('stage')
+    assert {k: v['calls'] for k, v in stats_by_stage.items()} == expected_calls
+    stats_by_instrument = profiler.aggregate('instrument')
+    assert list(stats_by_instrument.keys()) == ['sine']
+    assert stats_by_instrument['sine']['time'] <= profiler.total_time
+    if track_memory:
+        # Oscillator output has 8000 frames of 64-bit floats.
+        assert stats_by_stage['oscillators']['peak_bytes'] >= 8000 * 8
+
+    report = profiler.create_report()
+    for stage_name in expected_calls:
+        assert f"  {stage_name}: " in report
@@ -0,0 +1,145 @@
+"""
+Test `sinethesizer.utils.convolution` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+import numpy as np
+import pytest
+import scipy.signal
+
+from sinethesizer.utils.convolution import (
+    KERNEL_SPECTRA,
+    convolve,
+    convolve_with_interpolated_kernels,
+    select_convolution_method,
+    select_partition_size,
+)
+
+
+@pytest.mark.parametrize(
+    "n_frames, kernel_size, expected",
+    [
+        (1000, 10, 'direct'),
+        (10, 1000, 'direct'),
+        (1000, 500, 'partitioned'),
+        (100000, 961, 'partitioned'),
+    ]
+)
+def test_select_convolution_method(n_frames: int, kernel_size: int, expected: str) -> None:
+    """Test `select_convolution_method` function."""
+    result = select_convolution_method(n_frames, kernel_size)
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "kernel_size, expected",
+    [
+        (33, 64),
+        (1024, 1024),
+        (1025, 2048),
+        (100000, 8192),
+    ]
+)
+def test_select_partition_size(kernel_size: int, expected: int) -> None:
+    """Test `select_partition_size` function."""
+    result = select_partition_size(kernel_size)
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "sound_shape, kernel_shape, mode",
+    [
+        ((2, 1000), (10,), 'full'),
+        ((2, 1000), (10,), 'same'),
+        ((2, 1000), (2, 700), 'full'),
+        ((2, 300), (2, 700), 'same'),
+        ((1, 10000), (2, 700), 'full'),
+        ((2, 10001), (961,), 'same'),
+        ((2, 12345), (2, 100), 'full'),
+        ((1, 50000), (960,), 'same'),
+        ((2, 3000), (20000,), 'full'),
+        ((1, 50000), (2, 20000), 'same'),
+    ]
+)
+def test_convolve(sound_shape: tuple[int, ...], kernel_shape: tuple[int, ...], mode: str) -> None:
+    """Test that `convolve` matches `scipy.signal.convolve` for every method."""
+    np.random.seed(0)
+    sound = np.random.normal(size=sound_shape)
+    kernel = np.random.normal(size=kernel_shape)
+    result = convolve(sound, kernel, mode)
+
+    kernel = np.atleast_2d(kernel)
+    n_channels = max(sound.shape[0], kernel.shape[0])
+    expected = np.vstack([
+        scipy.signal.convolve(sound[i % sound.shape[0]], kernel[i % kernel.shape[0]], mode)
+        for i in range(n_channels)
+    ])
+    np.testing.assert_allclose(result, expected, atol=1e-9)
+
+    result_with_cached_spectrum = convolve(sound, kernel, mode)
+    np.testing.assert_equal(result_with_cached_spectrum, result)
+
+
+def test_convolve_with_disabled_cache() -> None:
+    """Test that `convolve` does not cache spectra of kernels if it is not requested."""
+    KERNEL_SPECTRA.clear()
+    sound = np.ones((2, 5000))
+    kernel = np.linspace(1, 0, 100)
+    convolve(sound, kernel, cache_kernel_spectrum=False)
+    assert len(KERNEL_SPECTRA) == 0
+    convolve(sound, kernel)
+    assert len(KERNEL_SPECTRA) == 1
+
+
+def test_convolve_with_sounds_of_different_lengths() -> None:
+    """Test that spectrum of kernel is reused for sounds of any length."""
+    KERNEL_SPECTRA.clear()
+    kernel = np.linspace(1, 0, 20000)
+    for n_frames in [100, 5000, 12345, 100000]:
+        convolve(np.ones((2, n_frames)), kernel)
+    assert len(KERNEL_SPECTRA) == 1
+
+
+def test_convolve_with_kernel_key() -> None:
+    """Test that spectrum of kernel is identified by key if it is passed."""
+    KERNEL_SPECTRA.clear()
+    sound = np.ones((2, 5000))
+    kernel = np.linspace(1, 0, 100)
+    result = convolve(sound, kernel, kernel_key=('linear_decay', 100))
+    assert len(KERNEL_SPECTRA) == 1
+    result_with_key = convolve(sound, kernel, kernel_key=('linear_decay', 100))
+    assert len(KERNEL_SPECTRA) == 1
+    np.testing.assert_equal(result_with_key, result)
+    convolve(sound, kernel)
+    assert len(KERNEL_SPECTRA) == 2
+
+
+def test_convolve_with_empty_sound() -> None:
+    """Test that `convolve` returns empty sound for empty input."""
+    result = convolve(np.array([[], []]), np.ones(100))
+    assert result.shape == (2, 0)
+
+
+@pytest.mark.parametrize(
+    "n_frames, kernel_size, position, mode",
+    [
+        (1000, 101, 0, 'same'),
+        (1000, 101, 1, 'full'),
+        (50, 101, 1, 'same'),
+        (1000, 101, 0.25, 'full'),
+    ]
+)
+def test_convolve_with_interpolated_kernels(
+        n_frames: int, kernel_size: int, position: float, mode: str
+) -> None:
+    """Test `convolve_with_interpolated_kernels` function with constant position."""
+    random_generator = np.random.default_rng(0)
+    sound = random_generator.normal(size=(2, n_frames))
+    kernels = random_generator.normal(size=(2, kernel_size))
+    positions = np.full(n_frames, position)
+    result = convolve_with_interpolated_kernels(sound, kernels, positions, mode)
+    kernel = (1 - position) * kernels[0] + position * kernels[1]
+    expected = convolve(sound, kernel, mode, cache_kernel_spectrum=False)
+    np.testing.assert_almost_equal(result, expected)
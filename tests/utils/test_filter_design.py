@@ -0,0 +1,135 @@
+"""
+Test `sinethesizer.utils.filter_design` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+from typing import Optional
+
+import numpy as np
+import pytest
+from scipy.signal import butter, firwin2, freqz_zpk
+
+from sinethesizer.effects.filter import filter_relative_frequencies
+from sinethesizer.synth.core import Event
+from sinethesizer.utils.filter_design import (
+    compute_state_space_response,
+    design_butterworth_filter,
+    design_fir_filter,
+    design_state_variable_butterworth_filters,
+    get_filter_designs_stats,
+    quantize_frequency,
+)
+
+
+@pytest.mark.parametrize(
+    "n_taps, breakpoint_frequencies, gains, kwargs",
+    [
+        (11, [0, 0.5, 1], [1, 0.5, 0], {}),
+        (101, [0, 0.2, 0.3, 1], [0, 1, 1, 0], {'window': ['kaiser', 8.0]}),
+    ]
+)
+def test_design_fir_filter(
+        n_taps: int, breakpoint_frequencies: list[float], gains: list[float], kwargs: dict
+) -> None:
+    """Test that `design_fir_filter` matches `firwin2` and caches designs."""
+    result = design_fir_filter(n_taps, breakpoint_frequencies, gains, **kwargs)
+    kwargs = {key: tuple(value) for key, value in kwargs.items()}
+    expected = firwin2(n_taps, breakpoint_frequencies, gains, **kwargs)
+    np.testing.assert_equal(result, expected)
+    assert not result.flags.writeable
+
+    hits_before = get_filter_designs_stats()['fir']['hits']
+    cached_result = design_fir_filter(n_taps, breakpoint_frequencies, gains, **kwargs)
+    assert cached_result is result
+    assert get_filter_designs_stats()['fir']['hits'] == hits_before + 1
+
+
+@pytest.mark.parametrize(
+    "order, min_threshold, max_threshold, filter_type",
+    [
+        (10, 0.1, 0.2, 'bandpass'),
+        (25, 1e-8, 0.5, 'bandstop'),
+    ]
+)
+def test_design_butterworth_filter(
+        order: int, min_threshold: float, max_threshold: float, filter_type: str
+) -> None:
+    """Test that `design_butterworth_filter` matches `butter` and caches designs."""
+    result = design_butterworth_filter(order, min_threshold, max_threshold, filter_type)
+    expected = butter(order, [min_threshold, max_threshold], btype=filter_type, output='sos')
+    np.testing.assert_equal(result, expected)
+    hits_before = get_filter_designs_stats()['butterworth']['hits']
+    design_butterworth_filter(order, min_threshold, max_threshold, filter_type)
+    assert get_filter_designs_stats()['butterworth']['hits'] == hits_before + 1
+
+
+@pytest.mark.parametrize(
+    "order, min_thresholds, max_thresholds, filter_type",
+    [
+        (1, None, [0.1, 0.5], 'lowpass'),
+        (25, None, [0.02, 0.9], 'lowpass'),
+        (4, [0.01, 0.3], None, 'highpass'),
+        (25, [0.02, 0.9], None, 'highpass'),
+        (1, [0.1, 0.01], [0.2, 0.9], 'bandpass'),
+        (25, [0.01, 0.3], [0.02, 0.4], 'bandpass'),
+        (3, [0.1, 0.01], [0.2, 0.9], 'bandstop'),
+        (10, [0.01, 0.3], [0.02, 0.4], 'bandstop'),
+    ]
+)
+def test_design_state_variable_butterworth_filters(
+        order: int, min_thresholds: Optional[list[float]],
+        max_thresholds: Optional[list[float]], filter_type: str
+) -> None:
+    """Test that `design_state_variable_butterworth_filters` matches `butter`."""
+    sections = design_state_variable_butterworth_filters(
+        order,
+        np.array(min_thresholds) if min_thresholds is not None else None,
+        np.array(max_thresholds) if max_thresholds is not None else None,
+        filter_type
+    )
+    angles = np.linspace(0.001, np.pi - 0.001, 100)
+    for filter_index in range(sections.shape[0]):
+        thresholds = [
+            thresholds[filter_index]
+            for thresholds in [min_thresholds, max_thresholds]
+            if thresholds is not None
+        ]
+        thresholds = thresholds if len(thresholds) > 1 else thresholds[0]
+        zeros, poles, gain = butter(order, thresholds, btype=filter_type, output='zpk')
+        expected = np.abs(freqz_zpk(zeros, poles, gain, angles)[1])
+        filter_sections = np.tile(sections[filter_index], (len(angles), 1, 1))
+        responses = compute_state_space_response(filter_sections, angles)
+        result = np.abs(np.prod(responses, axis=1))
+        np.testing.assert_allclose(result, expected, rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize(
+    "frequency, quantization_step, expected",
+    [
+        (441.0, None, 441.0),
+        (441.0, 100, 2 ** (105 / 12)),
+        (440.0, 1200, 512.0),
+        (0.0, 100, 0.0),
+    ]
+)
+def test_quantize_frequency(
+        frequency: float, quantization_step: Optional[float], expected: float
+) -> None:
+    """Test `quantize_frequency` function."""
+    result = quantize_frequency(frequency, quantization_step)
+    assert result == pytest.approx(expected)
+
+
+def test_filter_with_quantization() -> None:
+    """Test that quantized cutoffs allow reusing filter designs for notes of different pitch."""
+    sound = np.random.normal(size=(2, 1000))
+    frequencies = [440.0, 441.0, 442.0]
+    stats_before = get_filter_designs_stats()['butterworth']
+    for frequency in frequencies:
+        event = Event('any', 0, 1, frequency, 1, '', 44100)
+        filter_relative_frequencies(sound, event, 2, 4, quantization_step=50)
+    stats_after = get_filter_designs_stats()['butterworth']
+    assert stats_after['misses'] - stats_before['misses'] <= 1
+    assert stats_after['hits'] - stats_before['hits'] >= len(frequencies) - 1
@@ -0,0 +1,135 @@
+"""
+Test `sinethesizer.utils.ir_store` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from sinethesizer.effects.reverb import apply_artificial_reverb, apply_room_reverb
+from sinethesizer.synth.core import Event
+from sinethesizer.utils.convolution import KERNEL_SPECTRA, convolve
+from sinethesizer.utils.ir_store import (
+    IR_STORE_STATE, ImpulseResponseStore, create_ir_store, enable_ir_store, load_or_generate
+)
+
+
+def test_impulse_response_store(tmp_path) -> None:
+    """Test that `ImpulseResponseStore` generates arrays once and then loads them from disk."""
+    store_dir = str(tmp_path)
+    n_calls = []
+
+    def generate_fn() -> np.ndarray:
+        n_calls.append(1)
+        return np.arange(6.0).reshape((2, 3))
+
+    store = ImpulseResponseStore(store_dir)
+    first_result = store.get(('ir', 1), generate_fn)
+    assert isinstance(first_result, np.memmap)
+    np.testing.assert_equal(first_result, np.arange(6.0).reshape((2, 3)))
+    second_result = store.get(('ir', 1), generate_fn)
+    np.testing.assert_equal(second_result, first_result)
+    assert store.get_stats() == {'hits': 1, 'misses': 1}
+    assert len(os.listdir(store_dir)) == 1
+
+    store = pickle.loads(pickle.dumps(store))
+    result = store.get(('ir', 1), generate_fn)
+    assert isinstance(result, np.memmap)
+    np.testing.assert_equal(result, first_result)
+    assert len(n_calls) == 1
+
+    store.get(('ir', 2), generate_fn)
+    assert store.get_stats() == {'hits': 2, 'misses': 2}
+    assert len(os.listdir(store_dir)) == 2
+
+
+def test_load_or_generate(tmp_path) -> None:
+    """Test that `load_or_generate` uses store only within `enable_ir_store` context."""
+    store = ImpulseResponseStore(str(tmp_path))
+    with enable_ir_store(store):
+        load_or_generate(('ir',), lambda: np.ones(3))
+    assert IR_STORE_STATE['store'] is None
+    load_or_generate(('ir',), lambda: np.ones(3))
+    assert store.get_stats() == {'hits': 0, 'misses': 1}
+
+
+@pytest.mark.parametrize(
+    "settings, expected",
+    [
+        ({}, False),
+        ({'ir_store_dir': None}, False),
+        ({'ir_store_dir': 'ir_store'}, True),
+    ]
+)
+def test_create_ir_store(settings: dict, expected: bool) -> None:
+    """Test `create_ir_store` function."""
+    result = create_ir_store(settings)
+    assert (result is not None) == expected
+
+
+def test_reverbs_with_ir_store(tmp_path) -> None:
+    """Test that reverbs produce the same sounds with and without store of impulse responses."""
+    sound = np.vstack((np.linspace(1, 0, 800), np.linspace(0, 1, 800)))
+    event = Event(
+        instrument='any_instrument', start_time=0, duration=0.1, frequency=440,
+        velocity=1, effects='', frame_rate=8000
+    )
+    room_reverb_params = {
+        'room_length': 4, 'room_width': 5, 'room_height': 3,
+        'listener_x': 1, 'listener_y': 2, 'listener_z': 1.5,
+        'sound_source_x': 3, 'sound_source_y': 4, 'sound_source_z': 1,
+        'n_reflections': 3
+    }
+    artificial_reverb_params = {'decay_duration': 0.5, 'random_seeds': [1, 2]}
+    expected = [
+        apply_room_reverb(sound, event, **room_reverb_params),
+        apply_artificial_reverb(sound, event, **artificial_reverb_params),
+    ]
+
+    for _ in range(2):
+        store = ImpulseResponseStore(str(tmp_path))
+        with enable_ir_store(store):
+            result = [
+                apply_room_reverb(sound, event, **room_reverb_params),
+                apply_artificial_reverb(sound, event, **artificial_reverb_params),
+            ]
+        for actual_sound, expected_sound in zip(result, expected):
+            np.testing.assert_equal(actual_sound, expected_sound)
+    assert store.get_stats() == {'hits': 2, 'misses': 0}
+
+
+def test_convolve_with_ir_store(tmp_path) -> None:
+    """Test that `convolve` stores spectra of long kernels only."""
+    sound = np.ones((1, 20000))
+    store = ImpulseResponseStore(str(tmp_path))
+    with enable_ir_store(store):
+        KERNEL_SPECTRA.clear()
+        convolve(sound, np.linspace(1, 0, 100))
+        assert store.get_stats() == {'hits': 0, 'misses': 0}
+        kernel = np.linspace(1, 0, 2 ** 14)
+        result = convolve(sound, kernel)
+        assert store.get_stats() == {'hits': 0, 'misses': 1}
+        KERNEL_SPECTRA.clear()
+        np.testing.assert_equal(convolve(sound, kernel), result)
+        assert store.get_stats() == {'hits': 1, 'misses': 1}
+
+
+def test_artificial_reverb_with_ir_store_for_different_durations(tmp_path) -> None:
+    """Test that notes of different durations do not add spectra to store."""
+    store = ImpulseResponseStore(str(tmp_path))
+    with enable_ir_store(store):
+        KERNEL_SPECTRA.clear()
+        for duration in np.linspace(0.1, 1, 10):
+            n_frames = int(round(duration * 16000))
+            sound = np.ones((2, n_frames))
+            event = Event(
+                instrument='any_instrument', start_time=0, duration=duration, frequency=440,
+                velocity=1, effects='', frame_rate=16000
+            )
+            apply_artificial_reverb(sound, event, random_seeds=[1, 2])
+    assert len(os.listdir(tmp_path)) == 2
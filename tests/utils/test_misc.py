@@ -8,7 +8,9 @@ Author: Nikolay Lysenko
 import numpy as np
 import pytest
 
-from sinethesizer.utils.misc import mix_with_original_sound, sum_two_sounds
+from sinethesizer.utils.misc import (
+    SoundAccumulator, convert_to_stereo, mix_with_original_sound, sum_two_sounds
+)
 
 
 @pytest.mark.parametrize(
@@ -42,6 +44,16 @@ def test_mix_with_original_sound(
             np.array([[1, 2, 3], [2, 3, 4]]),
             np.array([[8, 11, 3], [10, 12, 4]])
         ),
+        (
+            np.array([[7, 9]]),
+            np.array([[1, 2, 3], [2, 3, 4]]),
+            np.array([[8, 11, 3], [9, 12, 4]])
+        ),
+        (
+            np.array([[1, 2, 3], [2, 3, 4]]),
+            np.array([[7, 9, 1, 1]]),
+            np.array([[8, 11, 4, 1], [9, 12, 5, 1]])
+        ),
     ]
 )
 def test_sum_two_sounds(
@@ -50,3 +62,64 @@ def test_sum_two_sounds(
     """Test `sum_two_sounds` function."""
     result = sum_two_sounds(first_sound, second_sound)
     np.testing.assert_almost_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "sound, expected",
+    [
+        (np.array([[1, 2, 3]]), np.array([[1, 2, 3], [1, 2, 3]])),
+        (np.array([[1, 2, 3], [2, 3, 4]]), np.array([[1, 2, 3], [2, 3, 4]])),
+    ]
+)
+def test_convert_to_stereo(sound: np.ndarray, expected: np.ndarray) -> None:
+    """Test `convert_to_stereo` function."""
+    result = convert_to_stereo(sound)
+    np.testing.assert_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "n_frames, sounds_and_start_frames, expected, expected_n_reallocations",
+    [
+        (
+            0,
+            [(np.array([[1.0, 2, 3]]), 0), (np.array([[7.0, 9]]), 0)],
+            np.array([[8.0, 11, 3]]),
+            1
+        ),
+        (
+            5,
+            [(np.array([[1.0, 2, 3]]), 0), (np.array([[7.0, 9]]), 3)],
+            np.array([[1.0, 2, 3, 7, 9]]),
+            0
+        ),
+        (
+            2,
+            [(np.array([[1.0, 2]]), 0), (np.array([[1.0, 2], [3, 4]]), 1)],
+            np.array([[1.0, 3, 2], [1, 5, 4]]),
+            1
+        ),
+        (
+            1,
+            [(np.array([[1.0]]), 0), (np.array([[1.0]]), 1), (np.array([[1.0]]), 2)],
+            np.array([[1.0, 1, 1]]),
+            2
+        ),
+        (
+            4,
+            [],
+            np.array([[]]),
+            0
+        ),
+    ]
+)
+def test_sound_accumulator(
+        n_frames: int, sounds_and_start_frames: list[tuple[np.ndarray, int]],
+        expected: np.ndarray, expected_n_reallocations: int
+) -> None:
+    """Test `SoundAccumulator` class."""
+    accumulator = SoundAccumulator(n_frames)
+    for sound, start_frame in sounds_and_start_frames:
+        accumulator.add(sound, start_frame)
+    result = accumulator.get_sound()
+    np.testing.assert_equal(result, expected)
+    assert accumulator.n_reallocations == expected_n_reallocations